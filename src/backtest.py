@@ -0,0 +1,349 @@
+"""
+Verifica di un pattern candidato sulle fatture già elaborate, prima di salvarlo.
+
+I pattern creati dalle correzioni dell'utente entrano nel database senza
+essere provati su altri documenti: un pattern di denominazione troppo generico
+(es. un prefisso di pochi caratteri seguito da "(.+)") corrisponde a quasi ogni
+fattura, cattura testo sbagliato e rallenta tutte le estrazioni successive.
+
+Il pattern viene quindi eseguito, in parallelo su più processi, su un campione
+dei testi conservati nella cache dei testi (vedi `text_cache`), senza aprire
+alcun PDF. Il fornitore di ogni documento, quando noto, si ricava
+dall'impronta del layout registrata nel database dei pattern: così si
+distinguono le corrispondenze corrette da quelle errate. Il risultato riporta
+percentuale di corrispondenze, corrispondenze errate e costo aggiunto per file.
+
+Uso da riga di comando:
+    python src/backtest.py PATTERN --tipo denominazione|numero_data [--fornitore NOME] [--documenti 1000]
+"""
+
+import re
+import sys
+import time
+import random
+import logging
+import argparse
+import multiprocessing
+from dataclasses import dataclass, field
+from config import get_impostazioni
+from regex_guard import REGEX_TIMEOUT
+from supplier_index import chiave_fornitore
+from text_cache import CacheTesti, get_cache_testi
+
+# Numero massimo di documenti della cache su cui viene provato un pattern
+DOCUMENTI_BACKTEST = get_impostazioni().documenti_backtest
+
+# Quota massima di corrispondenze errate (sul totale di quelle verificabili) di un pattern accettabile
+SOGLIA_ERRATE = 0.05
+
+# Costo medio per file (in millisecondi) oltre il quale un pattern viene segnalato come lento
+SOGLIA_COSTO_MS = 1.0
+
+# Oltre questa quota di documenti, un pattern di denominazione che non si può verificare è sospetto
+SOGLIA_GENERICO = 0.5
+
+# Esempi di corrispondenze errate riportati nel risultato
+MAX_ESEMPI = 5
+
+# Intervallo (in secondi) tra due chiamate della funzione di attesa
+INTERVALLO_ATTESA = 0.1
+
+# Stato dei processi worker, impostato da `_inizializza_worker`
+_regex = None
+_cache = None
+_max_pagine = 0
+
+
+@dataclass
+class RisultatoBacktest:
+    """
+    Esito della verifica di un pattern sui testi in cache.
+
+    Attributes:
+        pattern (str): Pattern verificato
+        tipo (str): "denominazione" o "numero_data"
+        fornitore (str): Fornitore del pattern "numero_data", se specifico
+        documenti (int): Documenti su cui il pattern è stato eseguito
+        corrispondenze (int): Documenti in cui il pattern ha trovato i gruppi attesi
+        corrette (int): Corrispondenze su documenti del fornitore giusto
+        errate (int): Corrispondenze su documenti di un altro fornitore
+        non_verificabili (int): Corrispondenze su documenti di fornitore sconosciuto
+        attesi (int): Documenti del fornitore (solo per i pattern "numero_data" di un fornitore)
+        tempo_medio_ms (float): Tempo medio di ricerca per documento
+        tempo_p95_ms (float): 95° percentile del tempo di ricerca
+        tempo_massimo_ms (float): Tempo di ricerca più lungo
+        timeout (bool): True se una ricerca ha superato il budget di tempo delle regex
+        errore (str): Messaggio se il pattern non è un'espressione regolare valida
+        esempi_errati (list): Fino a MAX_ESEMPI tuple (documento, valore catturato, fornitore atteso)
+    """
+    pattern: str
+    tipo: str
+    fornitore: str = None
+    documenti: int = 0
+    corrispondenze: int = 0
+    corrette: int = 0
+    errate: int = 0
+    non_verificabili: int = 0
+    attesi: int = 0
+    tempo_medio_ms: float = 0.0
+    tempo_p95_ms: float = 0.0
+    tempo_massimo_ms: float = 0.0
+    timeout: bool = False
+    errore: str = None
+    esempi_errati: list = field(default_factory=list)
+
+    @property
+    def tasso_corrispondenze(self):
+        """float: Quota dei documenti in cui il pattern trova una corrispondenza."""
+        return self.corrispondenze / self.documenti if self.documenti else 0.0
+
+    @property
+    def tasso_errate(self):
+        """float: Quota delle corrispondenze verificabili che sono errate."""
+        verificabili = self.corrette + self.errate
+        return self.errate / verificabili if verificabili else 0.0
+
+    @property
+    def problemi(self):
+        """list: Descrizioni dei motivi per cui il pattern non dovrebbe essere salvato."""
+        problemi = []
+        if self.errore:
+            problemi.append(f"Pattern non valido: {self.errore}")
+        if self.timeout:
+            problemi.append(f"Una ricerca ha superato il budget di {REGEX_TIMEOUT:g}s")
+        if self.errate and self.tasso_errate > SOGLIA_ERRATE:
+            problemi.append(f"{self.errate} corrispondenze su documenti di altri fornitori")
+        if self.tempo_medio_ms > SOGLIA_COSTO_MS:
+            problemi.append(f"Costo medio di {self.tempo_medio_ms:.2f} ms per file")
+        if (self.tipo == "denominazione" and self.tasso_corrispondenze > SOGLIA_GENERICO
+                and not self.corrette and not self.errate):
+            problemi.append(f"Corrisponde al {self.tasso_corrispondenze:.0%} dei documenti senza poterlo verificare")
+        return problemi
+
+    def riepilogo(self):
+        """
+        Descrive il risultato in poche righe, per l'utente.
+
+        Returns:
+            str: Testo del riepilogo
+        """
+        if self.errore:
+            return f"Pattern non valido: {self.errore}"
+        righe = [f"Documenti verificati: {self.documenti}"]
+        righe.append(f"Corrispondenze: {self.corrispondenze} ({self.tasso_corrispondenze:.1%})")
+        if self.tipo == "numero_data" and self.fornitore:
+            righe.append(f"Documenti di {self.fornitore} riconosciuti: {self.corrette} su {self.attesi}")
+        else:
+            righe.append(f"Corrette: {self.corrette}")
+        righe.append(f"Su documenti di altri fornitori: {self.errate}")
+        righe.append(f"Su documenti di fornitore sconosciuto: {self.non_verificabili}")
+        righe.append(f"Costo per file: {self.tempo_medio_ms:.3f} ms in media, "
+                     f"{self.tempo_p95_ms:.3f} ms al 95° percentile, {self.tempo_massimo_ms:.3f} ms al massimo")
+        if self.timeout:
+            righe.append(f"Interrotto: una ricerca ha superato il budget di {REGEX_TIMEOUT:g}s")
+        for documento, valore, atteso in self.esempi_errati:
+            righe.append(f"  {documento}: '{valore}' (fornitore: {atteso})")
+        return "\n".join(righe)
+
+
+def _inizializza_worker(pattern, cartella_cache, max_pagine):
+    """Compila il pattern e apre la cache dei testi nel processo worker."""
+    global _regex, _cache, _max_pagine
+    _regex = re.compile(pattern)
+    _cache = CacheTesti(cartella_cache)
+    _max_pagine = max_pagine
+
+
+def _verifica_documento(chiave):
+    """
+    Esegue il pattern sul testo in cache di un documento.
+
+    Returns:
+        tuple: (chiave, gruppi catturati o None, millisecondi, impronta, nome),
+            oppure None se la voce non è più disponibile
+    """
+    voce = _cache.leggi(chiave, _max_pagine)
+    if voce is None:
+        return None
+    inizio = time.perf_counter()
+    match = _regex.search(voce.testo)
+    durata = (time.perf_counter() - inizio) * 1000
+    return chiave, match.groups() if match else None, durata, voce.impronta, voce.nome
+
+
+def campiona_chiavi(cache, documenti=DOCUMENTI_BACKTEST, seme=0):
+    """
+    Sceglie a caso i documenti della cache su cui provare un pattern.
+
+    Args:
+        cache (CacheTesti): Cache dei testi
+        documenti (int): Numero massimo di documenti
+        seme (int): Seme del generatore, per ripetere la stessa verifica
+
+    Returns:
+        list: Chiavi dei documenti scelti
+    """
+    chiavi = list(cache.chiavi())
+    if len(chiavi) <= documenti:
+        return chiavi
+    return random.Random(seme).sample(chiavi, documenti)
+
+
+def _esegui_ricerche(pattern, chiavi, cache, worker, in_attesa):
+    """
+    Esegue il pattern sui documenti in un pool di processi.
+
+    Un processo bloccato in una regex non può essere interrotto: se nessun
+    risultato arriva entro il budget delle regex, il pool viene terminato.
+
+    Returns:
+        tuple: (risultati di `_verifica_documento`, True se il budget è stato superato)
+    """
+    impostazioni = get_impostazioni()
+    contesto = multiprocessing.get_context("spawn")
+    pool = contesto.Pool(processes=max(1, min(worker, len(chiavi))), initializer=_inizializza_worker,
+                         initargs=(pattern, cache.cartella, impostazioni.max_pagine_estrazione))
+    risultati = []
+    try:
+        iteratore = pool.imap_unordered(_verifica_documento, chiavi)
+        # Il primo risultato attende anche l'avvio dei worker
+        attesa_massima = impostazioni.timeout_avvio_worker + REGEX_TIMEOUT
+        ultimo = time.monotonic()
+        while True:
+            try:
+                risultato = iteratore.next(timeout=INTERVALLO_ATTESA)
+            except StopIteration:
+                return risultati, False
+            except multiprocessing.TimeoutError:
+                if in_attesa is not None:
+                    in_attesa()
+                if time.monotonic() - ultimo > attesa_massima:
+                    logging.warning("Verifica interrotta, il pattern supera il budget di %ss: %s", REGEX_TIMEOUT, pattern)
+                    return risultati, True
+                continue
+            ultimo = time.monotonic()
+            attesa_massima = REGEX_TIMEOUT + INTERVALLO_ATTESA
+            if risultato is not None:
+                risultati.append(risultato)
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _stesso_fornitore(valore, fornitore, alias):
+    """Verifica se una denominazione catturata indica il fornitore atteso."""
+    chiave = chiave_fornitore(valore)
+    return chiave == chiave_fornitore(fornitore) or alias.get(chiave) == fornitore
+
+
+def verifica_pattern(pattern, tipo, pattern_db, fornitore=None, cache=None, documenti=DOCUMENTI_BACKTEST,
+                     worker=None, in_attesa=None):
+    """
+    Prova un pattern candidato sui testi in cache e ne misura precisione e costo.
+
+    Per "denominazione" una corrispondenza è corretta se il valore catturato
+    indica il fornitore associato all'impronta del documento; per
+    "numero_data" di un fornitore è corretta sui documenti di quel fornitore
+    ed errata su quelli degli altri.
+
+    Args:
+        pattern (str): Espressione regolare candidata
+        tipo (str): "denominazione" o "numero_data"
+        pattern_db (PatternDatabase): Database da cui ricavare i fornitori dalle impronte
+        fornitore (str, optional): Fornitore del pattern "numero_data"
+        cache (CacheTesti, optional): Cache dei testi; predefinita quella del processo
+        documenti (int): Numero massimo di documenti verificati
+        worker (int, optional): Processi worker; predefinito `worker_estrazione`
+        in_attesa (callable, optional): Funzione chiamata periodicamente durante
+            l'attesa, ad esempio per mantenere reattiva l'interfaccia
+
+    Returns:
+        RisultatoBacktest: Esito della verifica (con documenti=0 se la cache è vuota o disattivata)
+    """
+    risultato = RisultatoBacktest(pattern=pattern, tipo=tipo, fornitore=fornitore)
+    try:
+        re.compile(pattern)
+    except re.error as e:
+        risultato.errore = str(e)
+        return risultato
+
+    cache = cache or get_cache_testi()
+    chiavi = campiona_chiavi(cache, documenti) if cache is not None else []
+    if not chiavi:
+        return risultato
+
+    inizio = time.perf_counter()
+    ricerche, risultato.timeout = _esegui_ricerche(
+        pattern, chiavi, cache, worker or get_impostazioni().worker_estrazione, in_attesa
+    )
+    gruppi_attesi = 2 if tipo == "numero_data" else 1
+    alias = pattern_db.patterns.get("alias_fornitori", {})
+    durate = []
+
+    for chiave, gruppi, durata, impronta, nome in ricerche:
+        durate.append(durata)
+        atteso = pattern_db.get_fornitore_da_impronta(impronta) if impronta else None
+        del_fornitore = bool(fornitore and atteso and _stesso_fornitore(atteso, fornitore, alias))
+        if del_fornitore:
+            risultato.attesi += 1
+        if not gruppi or len(gruppi) < gruppi_attesi or not all(gruppi[:gruppi_attesi]):
+            continue
+        risultato.corrispondenze += 1
+        if atteso is None:
+            risultato.non_verificabili += 1
+            continue
+        if tipo == "denominazione":
+            corretta = _stesso_fornitore(gruppi[0].strip(), atteso, alias)
+        else:
+            corretta = fornitore is None or del_fornitore
+        if corretta:
+            risultato.corrette += 1
+        else:
+            risultato.errate += 1
+            if len(risultato.esempi_errati) < MAX_ESEMPI:
+                valore = " ".join(g.strip() for g in gruppi[:gruppi_attesi])
+                risultato.esempi_errati.append((nome or chiave[:12], valore[:60], atteso))
+
+    risultato.documenti = len(durate)
+    if durate:
+        durate.sort()
+        risultato.tempo_medio_ms = sum(durate) / len(durate)
+        risultato.tempo_p95_ms = durate[min(len(durate) - 1, int(len(durate) * 0.95))]
+        risultato.tempo_massimo_ms = durate[-1]
+    logging.info("Verifica del pattern %s su %d documenti in %.2fs: %d corrispondenze, %d errate",
+                 pattern, risultato.documenti, time.perf_counter() - inizio,
+                 risultato.corrispondenze, risultato.errate)
+    return risultato
+
+
+def main():
+    """Verifica un pattern dalla riga di comando e stampa il riepilogo."""
+    parser = argparse.ArgumentParser(description="Verifica di un pattern sulle fatture già elaborate")
+    parser.add_argument("pattern", help="Espressione regolare da verificare")
+    parser.add_argument("--tipo", choices=("denominazione", "numero_data"), default="denominazione")
+    parser.add_argument("--fornitore", help="Fornitore del pattern numero_data")
+    parser.add_argument("--documenti", type=int, default=DOCUMENTI_BACKTEST,
+                        help=f"Documenti della cache da usare (predefinito: {DOCUMENTI_BACKTEST})")
+    parser.add_argument("--worker", type=int, help="Processi worker (predefinito: worker_estrazione)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s - %(message)s')
+    from pattern_db import get_pattern_db
+
+    cache = get_cache_testi()
+    if cache is None:
+        parser.error("La cache dei testi è disattivata (cache_testi)")
+    risultato = verifica_pattern(args.pattern, args.tipo, get_pattern_db(sola_lettura=True), args.fornitore,
+                                 cache, args.documenti, args.worker)
+    if not risultato.documenti and not risultato.errore:
+        print(f"Nessun documento nella cache dei testi ({cache.cartella})")
+        return 1
+    print(risultato.riepilogo())
+    for problema in risultato.problemi:
+        print(f"ATTENZIONE: {problema}")
+    return 1 if risultato.problemi else 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
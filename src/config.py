@@ -1,17 +1,195 @@
-
-
 """
 Modulo di configurazione per l'applicazione InvoiceReader.
 
-Questo file è destinato a contenere costanti, variabili di configurazione
-e impostazioni che possono essere modificate per personalizzare il comportamento
-dell'applicazione senza dover modificare il codice principale.
+Le impostazioni regolabili (numero di worker, dimensioni delle cache, budget di
+tempo, pagine da leggere, livello di log, cartelle dei dati) sono raccolte nella
+dataclass `Impostazioni`, con i valori predefiniti dell'applicazione. I valori
+possono essere modificati senza toccare il codice:
 
-Esempi di possibili configurazioni future:
-- Formati di data supportati
-- Pattern di espressioni regolari per l'estrazione di informazioni
-- Formati di nome file personalizzati
-- Impostazioni di interfaccia utente
+1. nel file JSON `config.json` nella cartella principale del progetto (o nel file
+   indicato dalla variabile d'ambiente INVOICEREADER_CONFIG), con i nomi dei campi
+   come chiavi, ad esempio {"worker_estrazione": 8, "max_pagine_estrazione": 3};
+2. con le variabili d'ambiente INVOICEREADER_<NOME_CAMPO> (es. INVOICEREADER_WORKER_ESTRAZIONE=8),
+   che hanno la precedenza sul file.
+
+Le impostazioni vengono lette una volta per processo con `get_impostazioni`; i
+processi worker, avviati con "spawn", le rileggono allo stesso modo.
 """
 
-# Configurazioni future verranno aggiunte qui
+import os
+import json
+import logging
+from dataclasses import dataclass, field, fields
+
+# Cartella principale del progetto
+CARTELLA_PROGETTO = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# File di configurazione predefinito
+FILE_CONFIGURAZIONE = os.path.join(CARTELLA_PROGETTO, "config.json")
+
+# Prefisso delle variabili d'ambiente che sovrascrivono le impostazioni
+PREFISSO_AMBIENTE = "INVOICEREADER_"
+
+
+def _ambiente(nome):
+    """Metadati di un campo con una variabile d'ambiente diversa da quella predefinita."""
+    return {"ambiente": PREFISSO_AMBIENTE + nome}
+
+
+@dataclass
+class Impostazioni:
+    """
+    Impostazioni dell'applicazione, con i rispettivi valori predefiniti.
+
+    Attributes:
+        cartella_dati (str): Cartella di pattern, quarantena e altri dati persistenti
+        cartella_log (str): Cartella dei file di log
+        livello_log (str): Livello minimo dei messaggi di log (INVOICEREADER_LOG_LEVEL)
+        log_json (bool): Se True, scrive i log come righe JSON (INVOICEREADER_LOG_JSON)
+        log_max_byte (int): Dimensione oltre la quale il file di log viene ruotato
+        log_copie (int): Numero di file di log ruotati conservati
+        log_giorni_conservazione (int): Giorni dopo i quali i vecchi log per avvio vengono eliminati
+        caratteri_testo_debug (int): Caratteri del testo non riconosciuto scritti nel log a livello DEBUG
+        worker_estrazione (int): Processi worker del servizio HTTP, della simulazione e della verifica dei pattern
+        budget_estrazione (float): Secondi concessi all'estrazione di un file prima della quarantena
+        timeout_avvio_worker (float): Secondi concessi all'avvio del processo di estrazione
+        timeout_richiesta (float): Secondi di attesa massima di un worker libero per una richiesta al servizio HTTP
+        max_byte_upload (int): Dimensione massima di un documento inviato al servizio HTTP
+        max_pagine_estrazione (int): Pagine lette per l'estrazione del testo (0 = tutte)
+        cache_testi (bool): Se True, il testo estratto dai PDF viene conservato nella cartella "testi" dei dati
+        documenti_backtest (int): Testi in cache su cui viene verificato un nuovo pattern prima di salvarlo
+        intervallo_salvataggio_pattern (float): Secondi entro cui le impronte apprese durante l'estrazione vengono salvate
+        regex_timeout (float): Secondi concessi a ogni ricerca regex
+        timeout_per_segnalazione (int): Ricerche scadute dopo le quali un pattern viene segnalato e ignorato
+        max_pattern_compilati (int): Pattern compilati mantenuti in cache dal processo delle regex
+        max_byte_cache_documenti (int): Memoria massima dei documenti conservati in cache
+        max_archivi_aperti (int): Archivi ZIP tenuti aperti contemporaneamente
+        max_copie_concorrenti (int): Copie contemporanee verso un altro volume
+        dimensione_blocco_scansione (int): Documenti consegnati all'interfaccia per ogni blocco della scansione
+        scala_anteprima (float): Scala di rendering delle pagine nell'anteprima
+        passo_zoom_avanti (float): Fattore applicato a ogni ingrandimento dell'anteprima
+        passo_zoom_indietro (float): Fattore applicato a ogni riduzione dell'anteprima
+    """
+    cartella_dati: str = os.path.join(CARTELLA_PROGETTO, "data")
+    cartella_log: str = os.path.join(CARTELLA_PROGETTO, "logs")
+    livello_log: str = field(default="INFO", metadata=_ambiente("LOG_LEVEL"))
+    log_json: bool = field(default=False, metadata=_ambiente("LOG_JSON"))
+    log_max_byte: int = 5 * 1024 * 1024
+    log_copie: int = 5
+    log_giorni_conservazione: int = 30
+    caratteri_testo_debug: int = 500
+    worker_estrazione: int = max(1, min(4, os.cpu_count() or 1))
+    budget_estrazione: float = 30.0
+    timeout_avvio_worker: float = 60.0
+    timeout_richiesta: float = 120.0
+    max_byte_upload: int = 50 * 1024 * 1024
+    max_pagine_estrazione: int = 0
+    cache_testi: bool = True
+    documenti_backtest: int = 2000
+    intervallo_salvataggio_pattern: float = 30.0
+    regex_timeout: float = 2.0
+    timeout_per_segnalazione: int = 3
+    max_pattern_compilati: int = 512
+    max_byte_cache_documenti: int = 256 * 1024 * 1024
+    max_archivi_aperti: int = 4
+    max_copie_concorrenti: int = 4
+    dimensione_blocco_scansione: int = 500
+    scala_anteprima: float = 1.5
+    passo_zoom_avanti: float = 1.2
+    passo_zoom_indietro: float = 0.8
+
+    @property
+    def livello_log_numerico(self):
+        """int: Livello di log come costante del modulo logging (INFO se non valido)."""
+        livello = logging.getLevelName(self.livello_log.upper())
+        return livello if isinstance(livello, int) else logging.INFO
+
+
+def _converti(valore, tipo):
+    """
+    Converte un valore letto dal file o dall'ambiente nel tipo del campo.
+
+    Raises:
+        ValueError: Se il valore non è valido per il tipo
+    """
+    if tipo is bool:
+        if isinstance(valore, str):
+            testo = valore.strip().lower()
+            if testo in ("1", "true", "si", "sì", "yes"):
+                return True
+            if testo in ("0", "false", "no", ""):
+                return False
+            raise ValueError(f"valore booleano non valido: {valore!r}")
+        return bool(valore)
+    if tipo is int and isinstance(valore, float) and not valore.is_integer():
+        raise ValueError(f"valore intero non valido: {valore!r}")
+    if tipo in (int, float) and isinstance(valore, bool):
+        raise ValueError(f"valore numerico non valido: {valore!r}")
+    return tipo(valore)
+
+
+def carica_impostazioni(percorso=None, ambiente=None):
+    """
+    Legge le impostazioni dal file JSON e dalle variabili d'ambiente.
+
+    Le chiavi sconosciute e i valori non validi vengono segnalati nel log e
+    ignorati: resta in uso il valore predefinito.
+
+    Args:
+        percorso (str, optional): File JSON; predefinito INVOICEREADER_CONFIG o `config.json`
+        ambiente (dict, optional): Variabili d'ambiente; predefinito os.environ
+
+    Returns:
+        Impostazioni: Impostazioni risultanti
+    """
+    ambiente = os.environ if ambiente is None else ambiente
+    percorso = percorso or ambiente.get(PREFISSO_AMBIENTE + "CONFIG") or FILE_CONFIGURAZIONE
+    campi = {f.name: f for f in fields(Impostazioni)}
+    valori = {}
+
+    try:
+        with open(percorso, 'r', encoding='utf-8') as f:
+            dal_file = json.load(f)
+        if not isinstance(dal_file, dict):
+            raise ValueError("il file deve contenere un oggetto JSON")
+    except FileNotFoundError:
+        dal_file = {}
+    except (OSError, ValueError) as e:
+        logging.warning("Impossibile leggere il file di configurazione %s: %s", percorso, e)
+        dal_file = {}
+
+    for nome, valore in dal_file.items():
+        if nome not in campi:
+            logging.warning("Impostazione sconosciuta in %s: %s", percorso, nome)
+            continue
+        valori[nome] = (valore, percorso)
+
+    for nome, campo in campi.items():
+        variabile = campo.metadata.get("ambiente", PREFISSO_AMBIENTE + nome.upper())
+        if variabile in ambiente:
+            valori[nome] = (ambiente[variabile], variabile)
+
+    impostazioni = Impostazioni()
+    for nome, (valore, origine) in valori.items():
+        try:
+            setattr(impostazioni, nome, _converti(valore, campi[nome].type))
+        except (TypeError, ValueError) as e:
+            logging.warning("Impostazione %s non valida (%s): %s", nome, origine, e)
+    return impostazioni
+
+
+# Impostazioni condivise da tutto il processo
+_impostazioni = None
+
+
+def get_impostazioni():
+    """
+    Restituisce le impostazioni del processo, leggendole alla prima chiamata.
+
+    Returns:
+        Impostazioni: Impostazioni condivise
+    """
+    global _impostazioni
+    if _impostazioni is None:
+        _impostazioni = carica_impostazioni()
+    return _impostazioni
@@ -0,0 +1,376 @@
+"""
+Accesso ai documenti da elaborare, indipendentemente da dove si trovano.
+
+Un documento può essere un file su disco oppure un membro di un archivio ZIP.
+I membri degli archivi sono identificati da un percorso virtuale nella forma
+"archivio.zip::cartella/fattura.pdf" e vengono letti direttamente dall'archivio,
+un membro alla volta, senza estrarre l'archivio su disco.
+
+Il contenuto di ogni documento viene letto una sola volta e conservato in una
+cache limitata in memoria: estrazione, anteprima e pagine successive usano lo
+stesso buffer, evitando letture ripetute dello stesso file su condivisioni di rete.
+La cache è di ogni processo: il documento già letto dall'interfaccia viene
+passato al processo di estrazione (vedi `workers.EstrattoreIsolato.estrai`).
+"""
+
+import os
+import shutil
+import logging
+import threading
+import zipfile
+from collections import OrderedDict
+from mover import sposta_file, sposta_file_multipli, MAX_COPIE_CONCORRENTI
+from config import get_impostazioni
+
+# Separatore tra il percorso dell'archivio e il nome del membro
+SEPARATORE_ZIP = "::"
+
+# Estensioni dei documenti elaborabili contenuti negli archivi
+ESTENSIONI_DOCUMENTI = (".pdf", ".xml", ".p7m")
+
+# Numero massimo di archivi ZIP tenuti aperti contemporaneamente
+MAX_ARCHIVI_APERTI = get_impostazioni().max_archivi_aperti
+
+# Memoria massima (in byte) occupata dai documenti in cache
+MAX_BYTE_CACHE_DOCUMENTI = get_impostazioni().max_byte_cache_documenti
+
+_archivi_aperti = OrderedDict()
+_lock_archivi = threading.Lock()
+
+_cache_documenti = OrderedDict()
+_byte_in_cache = 0
+_lock_cache = threading.Lock()
+
+
+def is_membro_zip(path):
+    """
+    Verifica se il percorso indica un membro di un archivio ZIP.
+
+    Args:
+        path (str): Percorso del documento
+
+    Returns:
+        bool: True se il percorso è nella forma "archivio.zip::membro"
+    """
+    return SEPARATORE_ZIP in path
+
+
+def percorso_membro_zip(percorso_zip, membro):
+    """
+    Costruisce il percorso virtuale di un membro di un archivio ZIP.
+
+    Args:
+        percorso_zip (str): Percorso dell'archivio
+        membro (str): Nome del membro all'interno dell'archivio
+
+    Returns:
+        str: Percorso virtuale del membro
+    """
+    return f"{percorso_zip}{SEPARATORE_ZIP}{membro}"
+
+
+def dividi_percorso_zip(path):
+    """
+    Separa un percorso virtuale nelle sue componenti.
+
+    Args:
+        path (str): Percorso virtuale "archivio.zip::membro"
+
+    Returns:
+        tuple: (percorso dell'archivio, nome del membro)
+    """
+    percorso_zip, membro = path.split(SEPARATORE_ZIP, 1)
+    return percorso_zip, membro
+
+
+def _apri_archivio(percorso_zip):
+    """Restituisce l'archivio aperto, riusando quelli già aperti di recente."""
+    with _lock_archivi:
+        archivio = _archivi_aperti.pop(percorso_zip, None)
+        if archivio is None:
+            archivio = zipfile.ZipFile(percorso_zip)
+        _archivi_aperti[percorso_zip] = archivio
+        while len(_archivi_aperti) > MAX_ARCHIVI_APERTI:
+            _, vecchio = _archivi_aperti.popitem(last=False)
+            vecchio.close()
+        return archivio
+
+
+def chiudi_archivio(percorso_zip):
+    """
+    Chiude un archivio ZIP se è tra quelli aperti.
+
+    Args:
+        percorso_zip (str): Percorso dell'archivio
+    """
+    with _lock_archivi:
+        archivio = _archivi_aperti.pop(percorso_zip, None)
+    if archivio is not None:
+        archivio.close()
+
+
+def elenca_documenti_zip(percorso_zip):
+    """
+    Elenca i documenti elaborabili contenuti in un archivio ZIP.
+
+    Args:
+        percorso_zip (str): Percorso dell'archivio
+
+    Returns:
+        list: Percorsi virtuali dei membri PDF, XML e p7m
+    """
+    try:
+        archivio = _apri_archivio(percorso_zip)
+        return [
+            percorso_membro_zip(percorso_zip, info.filename)
+            for info in archivio.infolist()
+            if not info.is_dir()
+            and not info.filename.startswith("__MACOSX/")
+            and info.filename.lower().endswith(ESTENSIONI_DOCUMENTI)
+        ]
+    except (OSError, zipfile.BadZipFile) as e:
+        logging.error("Impossibile leggere l'archivio ZIP %s: %s", percorso_zip, e)
+        return []
+
+
+def esiste_documento(path):
+    """
+    Verifica che il documento esista.
+
+    Args:
+        path (str): Percorso del file o percorso virtuale del membro ZIP
+
+    Returns:
+        bool: True se il documento esiste
+    """
+    if not is_membro_zip(path):
+        return os.path.exists(path)
+    percorso_zip, membro = dividi_percorso_zip(path)
+    if not os.path.exists(percorso_zip):
+        return False
+    try:
+        _apri_archivio(percorso_zip).getinfo(membro)
+        return True
+    except (KeyError, OSError, zipfile.BadZipFile):
+        return False
+
+
+def firma_documento(path):
+    """
+    Restituisce la firma usata per verificare che il documento in cache sia ancora valido.
+
+    Returns:
+        tuple: (mtime in nanosecondi, dimensione) del file o dell'archivio, più il CRC per i membri ZIP
+    """
+    if not is_membro_zip(path):
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+    percorso_zip, membro = dividi_percorso_zip(path)
+    stat = os.stat(percorso_zip)
+    return stat.st_mtime_ns, stat.st_size, _apri_archivio(percorso_zip).getinfo(membro).CRC
+
+
+def _leggi_da_sorgente(path):
+    """Legge il contenuto del documento dal disco o dall'archivio."""
+    if not is_membro_zip(path):
+        with open(path, "rb") as f:
+            return f.read()
+    percorso_zip, membro = dividi_percorso_zip(path)
+    return _apri_archivio(percorso_zip).read(membro)
+
+
+def leggi_documento(path):
+    """
+    Legge il contenuto completo di un documento, usando la cache se possibile.
+
+    Le richieste successive per lo stesso documento non modificato restituiscono
+    lo stesso oggetto bytes senza rileggere né copiare il file.
+
+    Args:
+        path (str): Percorso del file o percorso virtuale del membro ZIP
+
+    Returns:
+        bytes: Contenuto del documento
+    """
+    global _byte_in_cache
+    firma = firma_documento(path)
+    with _lock_cache:
+        voce = _cache_documenti.get(path)
+        if voce is not None and voce[0] == firma:
+            _cache_documenti.move_to_end(path)
+            return voce[1]
+
+    dati = _leggi_da_sorgente(path)
+    memorizza_documento(path, firma, dati)
+    return dati
+
+
+def memorizza_documento(path, firma, dati):
+    """
+    Inserisce nella cache un documento già letto, ad esempio da un altro processo.
+
+    Args:
+        path (str): Percorso del file o percorso virtuale del membro ZIP
+        firma (tuple): Firma del documento al momento della lettura (vedi `firma_documento`)
+        dati (bytes): Contenuto del documento
+    """
+    global _byte_in_cache
+    with _lock_cache:
+        vecchia = _cache_documenti.pop(path, None)
+        if vecchia is not None:
+            _byte_in_cache -= len(vecchia[1])
+        # I documenti troppo grandi non vengono conservati per non svuotare la cache
+        if len(dati) <= MAX_BYTE_CACHE_DOCUMENTI // 4:
+            _cache_documenti[path] = (firma, dati)
+            _byte_in_cache += len(dati)
+            while _byte_in_cache > MAX_BYTE_CACHE_DOCUMENTI:
+                _, (_, rimossi) = _cache_documenti.popitem(last=False)
+                _byte_in_cache -= len(rimossi)
+
+
+def documento_in_cache(path):
+    """
+    Restituisce il documento se è già in cache e non è stato modificato, senza leggerlo.
+
+    La cache è del singolo processo: l'interfaccia usa questa funzione per
+    passare al processo di estrazione il documento già letto per l'anteprima.
+
+    Args:
+        path (str): Percorso del file o percorso virtuale del membro ZIP
+
+    Returns:
+        tuple: (firma, contenuto), oppure None se il documento non è in cache
+    """
+    with _lock_cache:
+        voce = _cache_documenti.get(path)
+    if voce is None:
+        return None
+    try:
+        if firma_documento(path) != voce[0]:
+            return None
+    except (OSError, KeyError, zipfile.BadZipFile):
+        return None
+    return voce
+
+
+def dimentica_documento(path):
+    """
+    Rimuove un documento dalla cache, ad esempio dopo averlo rinominato.
+
+    Args:
+        path (str): Percorso del file o percorso virtuale del membro ZIP
+    """
+    global _byte_in_cache
+    with _lock_cache:
+        voce = _cache_documenti.pop(path, None)
+        if voce is not None:
+            _byte_in_cache -= len(voce[1])
+
+
+def nome_documento(path):
+    """
+    Restituisce il nome del documento da mostrare all'utente.
+
+    Args:
+        path (str): Percorso del file o percorso virtuale del membro ZIP
+
+    Returns:
+        str: Nome del file, preceduto dal nome dell'archivio per i membri ZIP
+    """
+    if not is_membro_zip(path):
+        return os.path.basename(path)
+    percorso_zip, membro = dividi_percorso_zip(path)
+    return f"{os.path.basename(percorso_zip)} › {os.path.basename(membro)}"
+
+
+def cartella_documento(path):
+    """
+    Restituisce la cartella in cui salvare il documento rinominato.
+
+    Per i membri ZIP è la cartella che contiene l'archivio.
+
+    Args:
+        path (str): Percorso del file o percorso virtuale del membro ZIP
+
+    Returns:
+        str: Percorso della cartella
+    """
+    if is_membro_zip(path):
+        path = dividi_percorso_zip(path)[0]
+    return os.path.dirname(path)
+
+
+def salva_documento(path, destinazione):
+    """
+    Porta il documento nella destinazione indicata.
+
+    I file su disco vengono spostati (copiati e poi rimossi se la destinazione è
+    su un altro volume, vedi `mover.sposta_file`); i membri ZIP vengono copiati a
+    blocchi dall'archivio al file di destinazione, che è l'unico file scritto su disco.
+
+    Args:
+        path (str): Percorso del file o percorso virtuale del membro ZIP
+        destinazione (str): Percorso completo del file di destinazione
+    """
+    if not is_membro_zip(path):
+        sposta_file(path, destinazione)
+        dimentica_documento(path)
+        return
+
+    percorso_zip, membro = dividi_percorso_zip(path)
+    voce = _cache_documenti.get(path)
+    if voce is not None:
+        # Il membro è già in memoria: lo scriviamo senza rileggere l'archivio
+        with open(destinazione, "xb") as f:
+            try:
+                f.write(voce[1])
+            except Exception:
+                f.close()
+                os.remove(destinazione)
+                raise
+        dimentica_documento(path)
+        return
+
+    with _apri_archivio(percorso_zip).open(membro) as sorgente, open(destinazione, "xb") as f:
+        try:
+            shutil.copyfileobj(sorgente, f, 1024 * 1024)
+        except Exception:
+            # Non lasciare file di destinazione incompleti
+            f.close()
+            os.remove(destinazione)
+            raise
+
+
+def salva_documenti(coppie, max_copie=MAX_COPIE_CONCORRENTI):
+    """
+    Porta più documenti nelle rispettive destinazioni.
+
+    I file su disco vengono spostati insieme con `mover.sposta_file_multipli`,
+    che copia in parallelo quelli diretti su un altro volume e sincronizza ogni
+    cartella di destinazione una sola volta; i membri ZIP vengono scritti uno
+    alla volta con `salva_documento`. Nessuna destinazione esistente viene sovrascritta.
+
+    Args:
+        coppie (list): Coppie (percorso del documento, destinazione)
+        max_copie (int): Numero massimo di copie contemporanee tra volumi diversi
+
+    Returns:
+        list: Un errore (str) o None per ogni coppia, nello stesso ordine
+    """
+    errori = [None] * len(coppie)
+    su_disco = []
+    for indice, (path, destinazione) in enumerate(coppie):
+        if not is_membro_zip(path):
+            su_disco.append(indice)
+            continue
+        try:
+            salva_documento(path, destinazione)
+        except Exception as e:
+            errori[indice] = str(e)
+
+    esiti = sposta_file_multipli([coppie[i] for i in su_disco], max_copie, riconcilia=False)
+    for indice, errore in zip(su_disco, esiti):
+        errori[indice] = errore
+        if errore is None:
+            dimentica_documento(coppie[indice][0])
+    return errori
@@ -0,0 +1,286 @@
+"""
+Valutazione di precisione e velocità dell'estrazione su un corpus di PDF etichettati.
+
+I pattern cambiano di continuo con l'apprendimento: questo strumento misura
+se una modifica ha reso l'estrazione più lenta o meno precisa. Ogni PDF del
+corpus è accompagnato da un file JSON con lo stesso nome ("fattura.pdf" ->
+"fattura.json") con i valori attesi:
+
+    {"denominazione": "ACME SRL", "numero_fattura": "123", "data_fattura": "01-02-2025"}
+
+`estrai_info_da_pdf` viene eseguita su ogni documento con un file dei pattern
+aperto in sola lettura (nessuna modifica viene salvata, né applicata durante la
+valutazione). Per ogni fornitore vengono calcolati precisione (estrazioni
+corrette / estrazioni complete) e richiamo (estrazioni corrette / documenti),
+oltre alle latenze p50/p95 e al numero di regex provate per documento. Con due
+file dei pattern i risultati vengono affiancati.
+
+Uso da riga di comando:
+    python src/evaluation.py CORPUS --pattern data/patterns.json [--confronta altro_patterns.json] [--csv report.csv]
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from config import get_impostazioni
+from pattern_db import get_pattern_db
+from supplier_index import chiave_fornitore
+from text_cache import get_cache_testi
+
+# Estensione del file con i valori attesi di ogni PDF
+ESTENSIONE_ETICHETTA = ".json"
+
+# Formati di data accettati nelle etichette e nei risultati
+FORMATI_DATA = ("%d-%m-%Y", "%d/%m/%Y", "%d.%m.%Y", "%Y-%m-%d", "%d-%m-%y", "%d/%m/%y")
+
+# Campi confrontati con i valori attesi
+CAMPI_ETICHETTA = ("denominazione", "numero_fattura", "data_fattura")
+
+
+def carica_corpus(cartella):
+    """
+    Elenca i PDF del corpus con i rispettivi valori attesi.
+
+    I PDF senza file di etichetta vengono ignorati e segnalati nel log.
+
+    Args:
+        cartella (str): Cartella del corpus, visitata ricorsivamente
+
+    Returns:
+        list: Coppie (percorso del PDF, dict con denominazione, numero_fattura, data_fattura)
+
+    Raises:
+        ValueError: Se un file di etichetta non è valido
+    """
+    corpus = []
+    for radice, _, nomi in os.walk(cartella):
+        for nome in sorted(nomi):
+            if not nome.lower().endswith(".pdf"):
+                continue
+            percorso = os.path.join(radice, nome)
+            etichetta = os.path.splitext(percorso)[0] + ESTENSIONE_ETICHETTA
+            if not os.path.exists(etichetta):
+                logging.warning("PDF senza etichetta ignorato: %s", percorso)
+                continue
+            with open(etichetta, 'r', encoding='utf-8') as f:
+                atteso = json.load(f)
+            if not isinstance(atteso, dict) or not all(atteso.get(campo) for campo in CAMPI_ETICHETTA):
+                raise ValueError(f"Etichetta non valida (servono {', '.join(CAMPI_ETICHETTA)}): {etichetta}")
+            corpus.append((percorso, atteso))
+    return corpus
+
+
+def _normalizza_numero(numero):
+    """Confronta i numeri di fattura come li produce l'estrazione ("/" diventa "-")."""
+    return str(numero).strip().upper().replace("/", "-") if numero else None
+
+
+def _normalizza_data(data):
+    """Riduce una data in uno dei FORMATI_DATA al formato ISO; restituisce il testo se non riconosciuta."""
+    if not data:
+        return None
+    data = str(data).strip()
+    for formato in FORMATI_DATA:
+        try:
+            return datetime.strptime(data, formato).date().isoformat()
+        except ValueError:
+            continue
+    return data
+
+
+def _inizializza_worker(file_pattern):
+    """Apre il file dei pattern in sola lettura prima che `utils` crei il database condiviso."""
+    logging.basicConfig(level=max(logging.WARNING, get_impostazioni().livello_log_numerico))
+    get_pattern_db(file_pattern, sola_lettura=True)
+
+    from utils import pattern_db, regex_guard
+    for tipo in ("denominazione", "numero_data"):
+        pattern_db.get_pattern_compilati(tipo)
+    # Avvia il processo delle regex: il primo documento non deve pagarne l'avvio
+    regex_guard.imposta_testo("")
+    regex_guard.cerca("^")
+
+
+def _valuta_documento(path):
+    """
+    Estrae i dati di un documento nel worker e misura latenza e regex provate.
+
+    Returns:
+        dict: Valori estratti, origine, latenza_ms e regex_provate
+    """
+    from utils import estrai_info_da_pdf, regex_guard
+
+    dettagli = {}
+    ricerche = regex_guard.ricerche
+    inizio = time.perf_counter()
+    denominazione, numero_fattura, data_fattura = estrai_info_da_pdf(path, dettagli=dettagli)
+    return {
+        "denominazione": denominazione,
+        "numero_fattura": numero_fattura,
+        "data_fattura": data_fattura,
+        "origine": dettagli.get("origine"),
+        "testo_in_cache": dettagli.get("testo_in_cache", False),
+        "latenza_ms": (time.perf_counter() - inizio) * 1000,
+        "regex_provate": regex_guard.ricerche - ricerche,
+    }
+
+
+def esegui_valutazione(corpus, file_pattern, worker=1):
+    """
+    Esegue l'estrazione su tutto il corpus con un file dei pattern.
+
+    Con un solo worker (predefinito) i documenti vengono elaborati uno alla
+    volta e le latenze non risentono della concorrenza tra processi. Se la
+    cache dei testi è attiva, il corpus viene elaborato una prima volta senza
+    misure: le latenze di tutte le valutazioni escludono allora l'estrazione del
+    testo con MuPDF e due file dei pattern si confrontano alla pari.
+
+    Args:
+        corpus (list): Coppie restituite da `carica_corpus`
+        file_pattern (str): File patterns.json da valutare
+        worker (int): Numero di processi worker
+
+    Returns:
+        pandas.DataFrame: Una riga per documento, con valori attesi ed estratti, "completo"
+            (tutti i campi estratti), "corretto" (tutti i campi uguali agli attesi),
+            origine, testo_in_cache, latenza_ms e regex_provate
+    """
+    if not os.path.exists(file_pattern):
+        raise FileNotFoundError(f"File dei pattern non trovato: {file_pattern}")
+
+    # "spawn": ogni worker crea il proprio database dei pattern dal file indicato
+    with ProcessPoolExecutor(max_workers=max(1, worker), mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_inizializza_worker, initargs=(file_pattern,)) as pool:
+        percorsi = [path for path, _ in corpus]
+        if get_cache_testi() is not None:
+            # Il database è in sola lettura: il primo passaggio riempie solo la cache dei testi
+            list(pool.map(_valuta_documento, percorsi))
+        risultati = list(pool.map(_valuta_documento, percorsi))
+
+    righe = []
+    for (path, atteso), estratto in zip(corpus, risultati):
+        completo = all(estratto[campo] for campo in CAMPI_ETICHETTA)
+        corretto = completo and (
+            chiave_fornitore(estratto["denominazione"]) == chiave_fornitore(atteso["denominazione"])
+            and _normalizza_numero(estratto["numero_fattura"]) == _normalizza_numero(atteso["numero_fattura"])
+            and _normalizza_data(estratto["data_fattura"]) == _normalizza_data(atteso["data_fattura"])
+        )
+        righe.append({
+            "percorso": path,
+            "fornitore": atteso["denominazione"],
+            "denominazione_estratta": estratto["denominazione"],
+            "numero_estratto": estratto["numero_fattura"],
+            "data_estratta": estratto["data_fattura"],
+            "completo": completo,
+            "corretto": corretto,
+            "origine": estratto["origine"],
+            "testo_in_cache": estratto["testo_in_cache"],
+            "latenza_ms": estratto["latenza_ms"],
+            "regex_provate": estratto["regex_provate"],
+        })
+    return pd.DataFrame(righe)
+
+
+def _statistiche(gruppo):
+    """Calcola precisione, richiamo, latenze e regex provate di un insieme di documenti."""
+    completi = int(gruppo["completo"].sum())
+    corretti = int(gruppo["corretto"].sum())
+    return pd.Series({
+        "documenti": len(gruppo),
+        "completi": completi,
+        "corretti": corretti,
+        "precisione": corretti / completi if completi else float("nan"),
+        "richiamo": corretti / len(gruppo) if len(gruppo) else float("nan"),
+        "p50_ms": gruppo["latenza_ms"].quantile(0.50),
+        "p95_ms": gruppo["latenza_ms"].quantile(0.95),
+        "regex_medie": gruppo["regex_provate"].mean(),
+    })
+
+
+def riepilogo(risultati):
+    """
+    Riassume i risultati per fornitore, con una riga finale "TOTALE".
+
+    Args:
+        risultati (pandas.DataFrame): Restituito da `esegui_valutazione`
+
+    Returns:
+        pandas.DataFrame: Indicizzato per fornitore, con documenti, completi, corretti,
+            precisione, richiamo, p50_ms, p95_ms e regex_medie
+    """
+    per_fornitore = risultati.groupby("fornitore").apply(_statistiche)
+    per_fornitore.loc["TOTALE"] = _statistiche(risultati)
+    return per_fornitore.astype({"documenti": int, "completi": int, "corretti": int})
+
+
+def confronta(riepilogo_a, riepilogo_b, etichette=("A", "B")):
+    """
+    Affianca i riepiloghi di due file dei pattern.
+
+    Args:
+        riepilogo_a, riepilogo_b (pandas.DataFrame): Restituiti da `riepilogo`
+        etichette (tuple): Suffissi delle colonne dei due riepiloghi
+
+    Returns:
+        pandas.DataFrame: Per ogni metrica le colonne dei due riepiloghi una accanto all'altra,
+            più le differenze (B - A) di precisione, richiamo e p95
+    """
+    a, b = etichette
+    confronto = riepilogo_a.join(riepilogo_b, how="outer", lsuffix=f"_{a}", rsuffix=f"_{b}")
+    colonne = [f"{metrica}_{s}" for metrica in riepilogo_a.columns for s in (a, b)]
+    confronto = confronto[colonne]
+    for metrica in ("precisione", "richiamo", "p95_ms"):
+        confronto[f"delta_{metrica}"] = confronto[f"{metrica}_{b}"] - confronto[f"{metrica}_{a}"]
+    # Il totale resta in fondo
+    return confronto.loc[[i for i in confronto.index if i != "TOTALE"] + ["TOTALE"]]
+
+
+def main():
+    """Valuta uno o due file dei pattern su un corpus dalla riga di comando."""
+    parser = argparse.ArgumentParser(description="Valutazione di precisione e velocità dell'estrazione")
+    parser.add_argument("corpus", help="Cartella dei PDF etichettati (un file .json per ogni PDF)")
+    parser.add_argument("--pattern", default=os.path.join(get_impostazioni().cartella_dati, "patterns.json"),
+                        help="File dei pattern da valutare (predefinito: quello in uso)")
+    parser.add_argument("--confronta", help="Secondo file dei pattern da affiancare al primo")
+    parser.add_argument("--worker", type=int, default=1,
+                        help="Processi worker (con più di uno le latenze includono la concorrenza)")
+    parser.add_argument("--csv", help="Salva il riepilogo in questo file CSV")
+    parser.add_argument("--dettaglio", help="Salva i risultati per documento in questo file CSV")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s - %(message)s')
+
+    corpus = carica_corpus(args.corpus)
+    if not corpus:
+        parser.error(f"Nessun PDF etichettato in {args.corpus}")
+    print(f"Corpus: {len(corpus)} documenti etichettati")
+
+    risultati = esegui_valutazione(corpus, args.pattern, args.worker)
+    report = riepilogo(risultati)
+    if args.confronta:
+        risultati_b = esegui_valutazione(corpus, args.confronta, args.worker)
+        report = confronta(report, riepilogo(risultati_b))
+        risultati = pd.concat([risultati.assign(pattern="A"), risultati_b.assign(pattern="B")])
+        print(f"A: {args.pattern}\nB: {args.confronta}")
+
+    with pd.option_context("display.max_rows", None, "display.max_columns", None, "display.width", 200,
+                           "display.float_format", "{:.3f}".format):
+        print(report)
+
+    if args.csv:
+        report.to_csv(args.csv, sep=";", encoding="utf-8-sig")
+    if args.dettaglio:
+        risultati.to_csv(args.dettaglio, index=False, sep=";", encoding="utf-8-sig")
+    return 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,226 @@
+"""
+Lettura delle fatture elettroniche FatturaPA (XML SDI), anche firmate in formato .p7m.
+
+I dati vengono letti direttamente dalla struttura XML con `lxml.etree.iterparse`,
+senza passare dall'estrazione del testo e dalle espressioni regolari. La lettura
+si interrompe alla fine dei dati generali del documento, così le righe e gli
+allegati in base64 in coda alla fattura non vengono nemmeno analizzati.
+"""
+
+import io
+import re
+import base64
+import binascii
+import logging
+from lxml import etree
+
+# Estensioni riconosciute come fatture elettroniche
+ESTENSIONI_FATTURAPA = (".xml", ".p7m")
+
+_RE_XML_GREZZO = re.compile(rb"<\?xml.*?FatturaElettronica>", re.DOTALL)
+
+
+def is_fattura_elettronica(path):
+    """
+    Verifica se il file è una fattura elettronica in base all'estensione.
+
+    Args:
+        path (str): Percorso del file
+
+    Returns:
+        bool: True per i file .xml e .p7m
+    """
+    return path.lower().endswith(ESTENSIONI_FATTURAPA)
+
+
+def _leggi_intestazione_ber(dati, pos):
+    """
+    Legge tag e lunghezza di un elemento ASN.1 codificato BER/DER.
+
+    Returns:
+        tuple: (tag, lunghezza o None se indefinita, posizione del contenuto)
+    """
+    tag = dati[pos]
+    pos += 1
+    if tag & 0x1F == 0x1F:
+        # Tag con numero esteso su più byte
+        while dati[pos] & 0x80:
+            pos += 1
+        pos += 1
+    lunghezza = dati[pos]
+    pos += 1
+    if lunghezza == 0x80:
+        return tag, None, pos
+    if lunghezza & 0x80:
+        num_byte = lunghezza & 0x7F
+        lunghezza = int.from_bytes(dati[pos:pos + num_byte], "big")
+        pos += num_byte
+    return tag, lunghezza, pos
+
+
+def _cerca_contenuto_xml(dati, pos, fine):
+    """
+    Cerca ricorsivamente la prima OCTET STRING che contiene un documento XML.
+
+    Args:
+        dati (bytes): Busta PKCS#7/CMS
+        pos (int): Posizione iniziale
+        fine (int | None): Posizione finale, None per lunghezza indefinita
+
+    Returns:
+        tuple: (contenuto XML o None, posizione successiva all'ultimo elemento letto)
+    """
+    while pos < len(dati) and (fine is None or pos < fine):
+        if fine is None and dati[pos:pos + 2] == b"\x00\x00":
+            return None, pos + 2
+
+        tag, lunghezza, inizio = _leggi_intestazione_ber(dati, pos)
+        fine_elemento = None if lunghezza is None else inizio + lunghezza
+
+        if tag == 0x04:
+            # OCTET STRING primitiva
+            contenuto = dati[inizio:fine_elemento]
+            if contenuto.lstrip(b"\xef\xbb\xbf \r\n\t").startswith(b"<"):
+                return contenuto, fine_elemento
+            pos = fine_elemento
+        elif tag == 0x24:
+            # OCTET STRING costruita: il contenuto è spezzato in più frammenti
+            frammenti = []
+            pos = inizio
+            while pos < len(dati) and (fine_elemento is None or pos < fine_elemento):
+                if fine_elemento is None and dati[pos:pos + 2] == b"\x00\x00":
+                    pos += 2
+                    break
+                _, lung_frammento, inizio_frammento = _leggi_intestazione_ber(dati, pos)
+                frammenti.append(dati[inizio_frammento:inizio_frammento + lung_frammento])
+                pos = inizio_frammento + lung_frammento
+            contenuto = b"".join(frammenti)
+            if contenuto.lstrip(b"\xef\xbb\xbf \r\n\t").startswith(b"<"):
+                return contenuto, pos
+            if fine_elemento is not None:
+                pos = fine_elemento
+        elif tag & 0x20:
+            # Elemento costruito: scendiamo nei figli
+            trovato, pos = _cerca_contenuto_xml(dati, inizio, fine_elemento)
+            if trovato is not None:
+                return trovato, pos
+            if fine_elemento is not None:
+                pos = fine_elemento
+        else:
+            pos = fine_elemento
+    return None, pos
+
+
+def estrai_xml_da_p7m(dati):
+    """
+    Estrae il documento XML contenuto in una busta firmata .p7m (CAdES).
+
+    La busta viene decodificata localmente, senza verificare la firma.
+    Sono supportate sia la codifica binaria DER/BER sia quella base64.
+
+    Args:
+        dati (bytes): Contenuto del file .p7m
+
+    Returns:
+        bytes: Documento XML, oppure None se non trovato
+    """
+    if not dati.startswith(b"\x30"):
+        try:
+            dati = base64.b64decode(dati, validate=False)
+        except (binascii.Error, ValueError):
+            return None
+
+    try:
+        contenuto, _ = _cerca_contenuto_xml(dati, 0, len(dati))
+        if contenuto is not None:
+            return contenuto
+    except (IndexError, TypeError) as e:
+        logging.debug("Struttura della busta p7m non riconosciuta: %s", e)
+
+    # Ultima possibilità: XML non frammentato all'interno della busta
+    match = _RE_XML_GREZZO.search(dati)
+    return match.group(0) if match else None
+
+
+def leggi_fattura_xml(dati):
+    """
+    Legge i campi principali di una fattura FatturaPA.
+
+    Args:
+        dati (bytes): Documento XML della fattura
+
+    Returns:
+        dict: Chiavi "denominazione", "numero_fattura", "data_fattura" e "tipo_documento";
+              i campi non trovati valgono None
+    """
+    risultato = {"denominazione": None, "numero_fattura": None, "data_fattura": None, "tipo_documento": None}
+    nome = cognome = None
+    percorso = []
+
+    contesto = etree.iterparse(
+        io.BytesIO(dati), events=("start", "end"),
+        resolve_entities=False, no_network=True, huge_tree=True, recover=True
+    )
+    for evento, elemento in contesto:
+        tag = etree.QName(elemento).localname if isinstance(elemento.tag, str) else ""
+        if evento == "start":
+            percorso.append(tag)
+            continue
+
+        if tag == "DatiGeneraliDocumento":
+            # Fine dei dati generali del primo documento: il resto (righe, allegati) non serve
+            break
+
+        testo = (elemento.text or "").strip()
+        if "CedentePrestatore" in percorso and "Anagrafica" in percorso:
+            if tag == "Denominazione" and testo:
+                risultato["denominazione"] = testo
+            elif tag == "Nome" and testo:
+                nome = testo
+            elif tag == "Cognome" and testo:
+                cognome = testo
+        elif len(percorso) >= 2 and percorso[-2] == "DatiGeneraliDocumento":
+            if tag == "Numero" and testo and not risultato["numero_fattura"]:
+                risultato["numero_fattura"] = testo.replace("/", "-")
+            elif tag == "Data" and testo and not risultato["data_fattura"]:
+                # FatturaPA usa AAAA-MM-GG, i nomi file usano GG-MM-AAAA
+                parti = testo.split("-")
+                risultato["data_fattura"] = "-".join(reversed(parti)) if len(parti) == 3 else testo
+            elif tag == "TipoDocumento" and testo and not risultato["tipo_documento"]:
+                risultato["tipo_documento"] = testo
+
+        percorso.pop()
+        elemento.clear()
+
+    if not risultato["denominazione"] and (nome or cognome):
+        risultato["denominazione"] = " ".join(p for p in (nome, cognome) if p)
+    return risultato
+
+
+def estrai_info_da_fattura_elettronica(path, dati=None):
+    """
+    Estrae denominazione, numero e data da un file FatturaPA .xml o .p7m.
+
+    Args:
+        path (str): Percorso del file (usato anche per riconoscere il formato)
+        dati (bytes, optional): Contenuto già letto del file
+
+    Returns:
+        dict: Campi letti dalla fattura (vedi `leggi_fattura_xml`), oppure None se
+              il file non contiene una fattura leggibile
+    """
+    if dati is None:
+        with open(path, "rb") as f:
+            dati = f.read()
+
+    if path.lower().endswith(".p7m"):
+        dati = estrai_xml_da_p7m(dati)
+        if dati is None:
+            logging.error("Impossibile estrarre l'XML dalla busta p7m: %s", path)
+            return None
+
+    try:
+        return leggi_fattura_xml(dati)
+    except etree.LxmlError as e:
+        logging.error("Errore nella lettura della fattura elettronica %s: %s", path, e)
+        return None
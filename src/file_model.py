@@ -0,0 +1,178 @@
+"""
+Modello Qt per la lista dei documenti da elaborare.
+
+Sostituisce la coppia QListWidget + lista Python: i percorsi sono indicizzati
+in un dizionario per evitare duplicati in tempo costante, gli inserimenti
+avvengono a blocchi e ogni riga ha uno stato di elaborazione aggiornabile
+singolarmente durante l'elaborazione.
+"""
+
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt6.QtGui import QColor
+from document_source import nome_documento
+
+# Stati possibili di un documento e relative etichette
+STATO_IN_ATTESA = "in_attesa"
+STATO_ESTRATTO = "estratto"
+STATO_RINOMINATO = "rinominato"
+STATO_FALLITO = "fallito"
+
+ETICHETTE_STATI = {
+    STATO_IN_ATTESA: "⏳ In attesa",
+    STATO_ESTRATTO: "🔍 Estratto",
+    STATO_RINOMINATO: "✅ Rinominato",
+    STATO_FALLITO: "❌ Non elaborato",
+}
+
+COLORI_STATI = {
+    STATO_RINOMINATO: QColor("#1b7d2c"),
+    STATO_FALLITO: QColor("#b00020"),
+}
+
+
+class FileListModel(QAbstractTableModel):
+    """
+    Modello a due colonne (documento, stato) per la lista dei file da elaborare.
+
+    Il ruolo `Qt.ItemDataRole.UserRole` della prima colonna restituisce il
+    percorso completo del documento.
+    """
+
+    COLONNA_FILE = 0
+    COLONNA_STATO = 1
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._percorsi = []
+        self._nomi = []
+        self._stati = []
+        self._indice = {}
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._percorsi)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else 2
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        riga = index.row()
+        if role == Qt.ItemDataRole.DisplayRole:
+            if index.column() == self.COLONNA_FILE:
+                return self._nomi[riga]
+            return ETICHETTE_STATI[self._stati[riga]]
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return self._percorsi[riga]
+        if role == Qt.ItemDataRole.UserRole:
+            return self._percorsi[riga]
+        if role == Qt.ItemDataRole.ForegroundRole and index.column() == self.COLONNA_STATO:
+            return COLORI_STATI.get(self._stati[riga])
+        return None
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return ("File", "Stato")[section]
+        return None
+
+    def __len__(self):
+        return len(self._percorsi)
+
+    def __contains__(self, path):
+        return path in self._indice
+
+    def aggiungi_percorsi(self, percorsi):
+        """
+        Aggiunge un blocco di percorsi, ignorando quelli già presenti.
+
+        Args:
+            percorsi (iterable): Percorsi dei documenti da aggiungere
+
+        Returns:
+            int: Numero di documenti effettivamente aggiunti
+        """
+        nuovi = []
+        visti = set()
+        for path in percorsi:
+            if path not in self._indice and path not in visti:
+                visti.add(path)
+                nuovi.append(path)
+        if not nuovi:
+            return 0
+
+        inizio = len(self._percorsi)
+        self.beginInsertRows(QModelIndex(), inizio, inizio + len(nuovi) - 1)
+        for offset, path in enumerate(nuovi):
+            self._indice[path] = inizio + offset
+            self._percorsi.append(path)
+            self._nomi.append(nome_documento(path))
+            self._stati.append(STATO_IN_ATTESA)
+        self.endInsertRows()
+        return len(nuovi)
+
+    def rimuovi_riga(self, riga):
+        """
+        Rimuove il documento alla riga indicata.
+
+        Args:
+            riga (int): Indice della riga da rimuovere
+        """
+        if not 0 <= riga < len(self._percorsi):
+            return
+        self.beginRemoveRows(QModelIndex(), riga, riga)
+        del self._indice[self._percorsi[riga]]
+        del self._percorsi[riga]
+        del self._nomi[riga]
+        del self._stati[riga]
+        for i in range(riga, len(self._percorsi)):
+            self._indice[self._percorsi[i]] = i
+        self.endRemoveRows()
+
+    def svuota(self):
+        """Rimuove tutti i documenti dal modello."""
+        self.beginResetModel()
+        self._percorsi.clear()
+        self._nomi.clear()
+        self._stati.clear()
+        self._indice.clear()
+        self.endResetModel()
+
+    def percorso(self, riga):
+        """
+        Restituisce il percorso del documento alla riga indicata.
+
+        Args:
+            riga (int): Indice della riga
+
+        Returns:
+            str: Percorso del documento, oppure None se la riga non esiste
+        """
+        if 0 <= riga < len(self._percorsi):
+            return self._percorsi[riga]
+        return None
+
+    def percorsi(self):
+        """
+        Restituisce una copia della lista dei percorsi, nell'ordine di visualizzazione.
+
+        Returns:
+            list: Percorsi dei documenti
+        """
+        return list(self._percorsi)
+
+    def imposta_stato(self, path, stato):
+        """
+        Aggiorna lo stato di elaborazione di un documento.
+
+        Viene notificata alla vista solo la cella modificata.
+
+        Args:
+            path (str): Percorso del documento
+            stato (str): Uno tra STATO_IN_ATTESA, STATO_ESTRATTO, STATO_RINOMINATO, STATO_FALLITO
+        """
+        riga = self._indice.get(path)
+        if riga is None or self._stati[riga] == stato:
+            return
+        self._stati[riga] = stato
+        cella = self.index(riga, self.COLONNA_STATO)
+        self.dataChanged.emit(cella, cella, [Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.ForegroundRole])
@@ -0,0 +1,68 @@
+"""
+Impronta del layout di un PDF, usata per riconoscere il fornitore senza regex.
+
+Le fatture dello stesso fornitore sono generate quasi sempre dallo stesso
+programma con lo stesso modello: stessi metadati (producer, creator), stessi
+font nella prima pagina, stesso formato di pagina e stessa intestazione.
+L'impronta combina questi elementi, eliminando le cifre dall'intestazione
+(numeri e date cambiano da una fattura all'altra), in un hash breve che il
+database dei pattern associa al fornitore.
+"""
+
+import re
+import hashlib
+
+# Numero di blocchi di testo in cima alla prima pagina inclusi nell'impronta
+BLOCCHI_INTESTAZIONE = 3
+
+# Caratteri considerati per ogni blocco dell'intestazione
+MAX_CARATTERI_BLOCCO = 80
+
+_RE_CIFRE = re.compile(r"\d+")
+_RE_SPAZI = re.compile(r"\s+")
+
+
+def _normalizza_blocco(testo):
+    """Rimuove cifre e spazi superflui da un blocco di testo dell'intestazione."""
+    testo = _RE_CIFRE.sub("#", testo)
+    return _RE_SPAZI.sub(" ", testo).strip().upper()[:MAX_CARATTERI_BLOCCO]
+
+
+def calcola_impronta(pdf):
+    """
+    Calcola l'impronta del layout di un PDF.
+
+    Vengono letti solo i metadati e la prima pagina: il costo non dipende dal
+    numero di pagine del documento.
+
+    Args:
+        pdf (fitz.Document): Documento PDF già aperto
+
+    Returns:
+        str: Impronta esadecimale di 16 caratteri, oppure None se il PDF non ha pagine
+             o la prima pagina non contiene testo
+    """
+    if len(pdf) == 0:
+        return None
+    pagina = pdf[0]
+
+    blocchi = [
+        b for b in pagina.get_text("blocks", sort=True)
+        if b[6] == 0 and b[4].strip()
+    ][:BLOCCHI_INTESTAZIONE]
+    if not blocchi:
+        # Le scansioni senza testo hanno tutte la stessa impronta: non sono distinguibili
+        return None
+
+    metadati = pdf.metadata or {}
+    # I font incorporati parzialmente hanno un prefisso casuale (es. "ABCDEF+Arial")
+    font = sorted({f[3].split("+")[-1] for f in pagina.get_fonts()})
+    larghezza, altezza = round(pagina.rect.width), round(pagina.rect.height)
+
+    parti = [
+        metadati.get("producer") or "",
+        metadati.get("creator") or "",
+        ",".join(font),
+        f"{larghezza}x{altezza}",
+    ] + [_normalizza_blocco(b[4]) for b in blocchi]
+    return hashlib.sha1("\n".join(parti).encode("utf-8")).hexdigest()[:16]
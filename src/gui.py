@@ -9,20 +9,41 @@ per la rinomina e processare i file.
 import os
 import logging
 import re
-import traceback
-from datetime import datetime
+import time
 from PyQt6.QtWidgets import (
     QWidget, QVBoxLayout, QPushButton,
     QLabel, QFileDialog, QLineEdit, QMessageBox,
-    QComboBox, QHBoxLayout, QListWidget, QListWidgetItem, QCheckBox, QSizePolicy, QSpacerItem,
+    QComboBox, QHBoxLayout, QTableView, QAbstractItemView, QHeaderView, QCheckBox, QSizePolicy, QSpacerItem,
     QGraphicsView, QGraphicsScene, QFrame, QMenuBar, QMenu, QMainWindow, QDialog, QTextBrowser,
-    QScrollArea
+    QScrollArea, QApplication
 )
 from PyQt6.QtCore import Qt, QRectF, QUrl, QSize
 from PyQt6.QtGui import QFont, QImage, QPixmap, QDesktopServices, QTextCursor
 import fitz  # PyMuPDF
-from utils import estrai_info_da_pdf, genera_nome_file
-from pattern_db import PatternDatabase
+from utils import genera_nome_file, estensione_documento, apri_pdf, percorso_destinazione, azzera_indice_cartelle
+from pattern_db import get_pattern_db
+from pattern_model import PatternFornitoriModel
+from pattern_induction import induci_pattern_numero_data
+from fatturapa import is_fattura_elettronica
+from splitter import trova_fatture_documento, salva_parti_documento
+from file_model import (
+    FileListModel, STATO_ESTRATTO, STATO_RINOMINATO, STATO_FALLITO
+)
+from document_source import (
+    elenca_documenti_zip, nome_documento, cartella_documento, salva_documenti
+)
+from manifest import ManifestLotto, ESITO_RINOMINATO, ESITO_NON_RICONOSCIUTO, ESITO_ERRORE
+from workers import EstrattoreIsolato, EstrazioneInterrottaError
+from planner import calcola_piano, salva_piano, carica_piano, esegui_piano
+from backtest import verifica_pattern
+from config import get_impostazioni
+from scanner import (
+    ScannerCartella, dividi_filtri, FILTRI_INCLUSIONE_PREDEFINITI, FILTRI_ESCLUSIONE_PREDEFINITI
+)
+
+# Documenti rinominati spostati insieme durante l'elaborazione (vedi `salva_documenti_accodati`)
+DOCUMENTI_PER_SPOSTAMENTO = 32
+
 
 class ReadmeViewer(QDialog):
     """
@@ -217,13 +238,17 @@ class FatturaRenamer(QMainWindow):
         self.central_widget = QWidget()
         self.setCentralWidget(self.central_widget)
 
-        # Inizializza il database dei pattern
-        self.pattern_db = PatternDatabase()
+        # Usa il database dei pattern condiviso con l'estrazione
+        self.pattern_db = get_pattern_db()
+        self.pattern_db.aggiungi_listener(self.on_pattern_db_modificato)
         self.current_extraction_text = None  # Per memorizzare il testo estratto dall'ultimo PDF
         self.current_pdf_path = None  # Per memorizzare il percorso del PDF attualmente selezionato
         self.zoom_factor = 1.0  # Fattore di zoom iniziale
         self.current_page = 0  # Pagina corrente del PDF
         self.total_pages = 0  # Numero totale di pagine nel PDF
+        self.scanner = None  # Scansione di cartella in corso
+        self.estrattore = EstrattoreIsolato()  # Estrazione in un processo separato, con budget di tempo per file
+        self.filtri_cartella = (FILTRI_INCLUSIONE_PREDEFINITI, FILTRI_ESCLUSIONE_PREDEFINITI)
 
         # Crea il menu bar
         self.create_menu_bar()
@@ -231,12 +256,34 @@ class FatturaRenamer(QMainWindow):
         # Inizializza l'interfaccia utente
         self.setup_ui()
 
+    def on_pattern_db_modificato(self, evento, dettagli):
+        """
+        Aggiorna la barra di stato quando il database dei pattern cambia.
+
+        Args:
+            evento (str): Tipo di modifica (es. "pattern_aggiunto", "ricaricato")
+            dettagli (dict): Informazioni aggiuntive sulla modifica
+        """
+        messaggi = {
+            "pattern_aggiunto": "Nuovo pattern globale disponibile",
+            "pattern_fornitore_aggiunto": f"Pattern aggiornati per {dettagli.get('denominazione', '')}",
+            "pattern_segnalato": "Un pattern troppo lento o non valido è stato disattivato",
+            "ricaricato": "Pattern ricaricati da disco",
+        }
+        if evento in messaggi:
+            self.statusBar().showMessage(messaggi[evento], 5000)
+
     def create_menu_bar(self):
         """
-        Crea la barra dei menu con le opzioni Info e Guida.
+        Crea la barra dei menu con le opzioni File, Info e Guida.
         """
         menubar = self.menuBar()
 
+        # Menu File
+        file_menu = menubar.addMenu("File")
+        esegui_piano_action = file_menu.addAction("Esegui piano di rinomina...")
+        esegui_piano_action.triggered.connect(self.esegui_piano_salvato)
+
         # Menu Info
         info_menu = menubar.addMenu("Info")
         about_action = info_menu.addAction("Informazioni")
@@ -292,7 +339,7 @@ class FatturaRenamer(QMainWindow):
             QPushButton:hover {
                 background-color: #005fa1;
             }
-            QLineEdit, QComboBox, QListWidget {
+            QLineEdit, QComboBox, QTableView {
                 background-color: white;
                 border: 1px solid #ccc;
                 border-radius: 4px;
@@ -320,7 +367,7 @@ class FatturaRenamer(QMainWindow):
             }
         """)
 
-        self.file_paths = []
+        self.file_model = FileListModel(self)
 
         # Layout principale orizzontale per dividere form e preview
         self.main_layout = QHBoxLayout()
@@ -365,12 +412,21 @@ class FatturaRenamer(QMainWindow):
         self.cartella_checkbox = QCheckBox("Sposta i file in cartelle con nome del fornitore")
         self.form_layout.addLayout(crea_riga("", self.cartella_checkbox))
 
+        self.dividi_checkbox = QCheckBox("Dividi i PDF che contengono più fatture")
+        self.dividi_checkbox.setToolTip("Riconosce l'inizio di ogni fattura pagina per pagina e salva ogni fattura in un file separato. Il PDF originale non viene modificato.")
+        self.form_layout.addLayout(crea_riga("", self.dividi_checkbox))
+
         # Checkbox per l'apprendimento automatico
         self.ml_checkbox = QCheckBox("Abilita apprendimento automatico")
         self.ml_checkbox.setChecked(False)  # Non abilitato di default
         self.ml_checkbox.setToolTip("Quando abilitato, il sistema impara dai documenti elaborati creando nuovi pattern di estrazione per migliorare il riconoscimento futuro")
         self.form_layout.addLayout(crea_riga("", self.ml_checkbox))
 
+        # Checkbox per la simulazione: calcola il piano di rinomina senza modificare i file
+        self.simulazione_checkbox = QCheckBox("Simulazione (nessun file viene rinominato)")
+        self.simulazione_checkbox.setToolTip("Calcola nomi, cartelle e collisioni di tutti i documenti e salva il piano in un file JSON, eseguibile in seguito dal menu File")
+        self.form_layout.addLayout(crea_riga("", self.simulazione_checkbox))
+
         # Pulsanti file management
         self.file_button_layout = QHBoxLayout()
 
@@ -378,6 +434,11 @@ class FatturaRenamer(QMainWindow):
         self.button_select.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed)
         self.button_select.clicked.connect(self.apri_file_dialog)
 
+        self.button_folder = QPushButton("📁 Aggiungi cartella")
+        self.button_folder.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed)
+        self.button_folder.setToolTip("Aggiunge tutti i documenti contenuti nella cartella e nelle sue sottocartelle")
+        self.button_folder.clicked.connect(self.apri_cartella_dialog)
+
         self.button_remove = QPushButton("🗑️ Rimuovi selezionato")
         self.button_remove.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed)
         self.button_remove.clicked.connect(self.rimuovi_file)
@@ -391,15 +452,25 @@ class FatturaRenamer(QMainWindow):
         self.button_patterns.clicked.connect(self.apri_gestore_pattern)
 
         self.file_button_layout.addWidget(self.button_select)
+        self.file_button_layout.addWidget(self.button_folder)
         self.file_button_layout.addWidget(self.button_remove)
         self.file_button_layout.addWidget(self.button_reset)
         self.file_button_layout.addWidget(self.button_patterns)
         self.form_layout.addLayout(self.file_button_layout)
 
         # Lista file
-        self.file_list = QListWidget()
-        self.file_list.setSelectionMode(QListWidget.SelectionMode.SingleSelection)
-        self.file_list.currentRowChanged.connect(self.aggiorna_anteprima_pdf)  # Connetti il segnale di cambio selezione
+        self.file_list = QTableView()
+        self.file_list.setModel(self.file_model)
+        self.file_list.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.file_list.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.file_list.setShowGrid(False)
+        self.file_list.verticalHeader().setVisible(False)
+        self.file_list.horizontalHeader().setSectionResizeMode(FileListModel.COLONNA_FILE, QHeaderView.ResizeMode.Stretch)
+        self.file_list.horizontalHeader().setSectionResizeMode(FileListModel.COLONNA_STATO, QHeaderView.ResizeMode.ResizeToContents)
+        # Connetti il segnale di cambio selezione
+        self.file_list.selectionModel().currentRowChanged.connect(
+            lambda corrente, precedente: self.aggiorna_anteprima_pdf(corrente.row())
+        )
         self.form_layout.addWidget(self.file_list)
 
         # Pulsante di processo
@@ -479,29 +550,153 @@ class FatturaRenamer(QMainWindow):
         Apre un dialogo per selezionare uno o più file PDF.
 
         I file selezionati vengono aggiunti alla lista dei file da processare,
-        evitando duplicati.
+        evitando duplicati. Degli archivi ZIP vengono aggiunti i documenti contenuti.
         """
-        files, _ = QFileDialog.getOpenFileNames(self, "Seleziona file PDF", "", "PDF Files (*.pdf)")
-        for path in files:
-            if path not in self.file_paths:
-                self.file_paths.append(path)
-                self.file_list.addItem(QListWidgetItem(os.path.basename(path)))
+        files, _ = QFileDialog.getOpenFileNames(
+            self, "Seleziona file PDF", "",
+            "Fatture (*.pdf *.xml *.p7m *.zip);;PDF Files (*.pdf);;Fatture elettroniche (*.xml *.p7m);;Archivi ZIP (*.zip)"
+        )
+        percorsi = []
+        for selezionato in files:
+            # Gli archivi ZIP vengono espansi nei documenti che contengono, senza estrarli su disco
+            if selezionato.lower().endswith(".zip"):
+                percorsi.extend(elenca_documenti_zip(selezionato))
+            else:
+                percorsi.append(selezionato)
+        self.file_model.aggiungi_percorsi(percorsi)
 
         # Se è stato aggiunto almeno un file, seleziona il primo
-        if len(self.file_paths) > 0 and self.file_list.currentRow() == -1:
-            self.file_list.setCurrentRow(0)
+        if len(self.file_model) > 0 and self.file_list.currentIndex().row() == -1:
+            self.file_list.selectRow(0)
+
+    def apri_cartella_dialog(self):
+        """
+        Apre un dialogo per scegliere una cartella da cui aggiungere i documenti.
+
+        La cartella viene percorsa ricorsivamente in un thread separato e i
+        documenti trovati vengono aggiunti alla lista a blocchi, mentre
+        l'interfaccia resta utilizzabile.
+        """
+        if self.scanner is not None:
+            # Un secondo clic durante la scansione la interrompe
+            self.scanner.interrompi()
+            return
+
+        cartella = QFileDialog.getExistingDirectory(self, "Seleziona cartella")
+        if not cartella:
+            return
+
+        filtri = self.chiedi_filtri_cartella()
+        if filtri is None:
+            return
+        includi, escludi = filtri
+
+        self.scanner = ScannerCartella(cartella, dividi_filtri(includi), dividi_filtri(escludi), self)
+        self.scanner.documenti_trovati.connect(self.aggiungi_documenti_trovati)
+        self.scanner.scansione_terminata.connect(self.fine_scansione_cartella)
+        self.button_folder.setText("⏹️ Interrompi scansione")
+        self.label_output.setText(f"🔎 Scansione di {cartella} in corso...")
+        self.scanner.start()
+
+    def chiedi_filtri_cartella(self):
+        """
+        Chiede all'utente i filtri di inclusione ed esclusione per la scansione della cartella.
+
+        Returns:
+            tuple: (filtri di inclusione, filtri di esclusione) come stringhe separate da ";",
+                   oppure None se l'utente annulla
+        """
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Filtri scansione cartella")
+        dialog.resize(450, 150)
+
+        layout = QVBoxLayout()
+        layout.addWidget(QLabel("File da includere (separati da ;):"))
+        includi_input = QLineEdit(self.filtri_cartella[0])
+        layout.addWidget(includi_input)
+        layout.addWidget(QLabel("File o cartelle da escludere (separati da ;):"))
+        escludi_input = QLineEdit(self.filtri_cartella[1])
+        escludi_input.setPlaceholderText("es. */archivio/*; bozza_*")
+        layout.addWidget(escludi_input)
+
+        buttons_layout = QHBoxLayout()
+        btn_cancel = QPushButton("Annulla")
+        btn_cancel.clicked.connect(dialog.reject)
+        btn_confirm = QPushButton("Avvia scansione")
+        btn_confirm.clicked.connect(dialog.accept)
+        buttons_layout.addWidget(btn_cancel)
+        buttons_layout.addWidget(btn_confirm)
+        layout.addLayout(buttons_layout)
+        dialog.setLayout(layout)
+
+        if not dialog.exec():
+            return None
+        # I filtri vengono ricordati per la scansione successiva
+        self.filtri_cartella = (includi_input.text().strip(), escludi_input.text().strip())
+        return self.filtri_cartella
+
+    def aggiungi_documenti_trovati(self, percorsi):
+        """
+        Aggiunge alla lista un blocco di documenti trovati dalla scansione della cartella.
+
+        Args:
+            percorsi (list): Percorsi dei documenti trovati
+        """
+        if self.sender() is not self.scanner:
+            # Blocco consegnato da una scansione già interrotta
+            return
+        self.file_model.aggiungi_percorsi(percorsi)
+        self.label_output.setText(f"🔎 Scansione in corso: {len(self.file_model)} documenti in lista...")
+        if len(self.file_model) > 0 and self.file_list.currentIndex().row() == -1:
+            self.file_list.selectRow(0)
+
+    def fine_scansione_cartella(self, totale):
+        """
+        Aggiorna l'interfaccia al termine della scansione della cartella.
+
+        Args:
+            totale (int): Numero di documenti trovati dalla scansione
+        """
+        if self.sender() is not self.scanner:
+            return
+        self._rilascia_scanner()
+        self.label_output.setText(f"📁 Scansione completata: {totale} documenti trovati")
+
+    def _rilascia_scanner(self):
+        """Attende la fine del thread di scansione e ripristina il pulsante."""
+        self.scanner.wait()
+        self.scanner.deleteLater()
+        self.scanner = None
+        self.button_folder.setText("📁 Aggiungi cartella")
+
+    def interrompi_scansione(self):
+        """
+        Interrompe la scansione della cartella in corso e attende la fine del thread.
+
+        I blocchi già consegnati ma non ancora ricevuti vengono ignorati.
+        """
+        if self.scanner is not None:
+            self.scanner.interrompi()
+            self._rilascia_scanner()
+
+    def closeEvent(self, event):
+        """
+        Interrompe le operazioni in background prima di chiudere la finestra.
+        """
+        self.interrompi_scansione()
+        self.estrattore.chiudi()
+        super().closeEvent(event)
 
     def rimuovi_file(self):
         """
         Rimuove il file selezionato dalla lista dei file da processare.
         """
-        selected = self.file_list.currentRow()
+        selected = self.file_list.currentIndex().row()
         if selected >= 0:
-            self.file_paths.pop(selected)
-            self.file_list.takeItem(selected)
+            self.file_model.rimuovi_riga(selected)
 
             # Se non ci sono più file, nascondi l'anteprima
-            if len(self.file_paths) == 0:
+            if len(self.file_model) == 0:
                 self.pdf_preview_widget.setVisible(False)
                 self.preview_title.setText("Anteprima PDF")
                 self.current_pdf_path = None
@@ -551,8 +746,8 @@ class FatturaRenamer(QMainWindow):
         i menu a tendina ai valori iniziali. Ripristina anche lo stile originale
         di tutti i campi.
         """
-        self.file_paths.clear()
-        self.file_list.clear()
+        self.interrompi_scansione()
+        self.file_model.svuota()
         self.anno_input.clear()
         self.tipo_combo.setCurrentIndex(0)
         self.tipo_combo.setEnabled(True)
@@ -570,7 +765,9 @@ class FatturaRenamer(QMainWindow):
 
         self.generico_checkbox.setChecked(False)
         self.cartella_checkbox.setChecked(False)
+        self.dividi_checkbox.setChecked(False)
         self.ml_checkbox.setChecked(False)  # Ripristina l'apprendimento automatico a disabilitato
+        self.simulazione_checkbox.setChecked(False)
         self.label_output.setText("")
 
         # Nascondi l'anteprima PDF
@@ -621,8 +818,8 @@ class FatturaRenamer(QMainWindow):
         if not self.current_pdf_path or not self.pdf_preview_widget.isVisible():
             return
 
-        # Aumenta il fattore di zoom del 20%
-        self.zoom_factor *= 1.2
+        # Aumenta il fattore di zoom (del 20% con le impostazioni predefinite)
+        self.zoom_factor *= get_impostazioni().passo_zoom_avanti
 
         # Applica il nuovo zoom
         self.pdf_view.resetTransform()
@@ -635,8 +832,8 @@ class FatturaRenamer(QMainWindow):
         if not self.current_pdf_path or not self.pdf_preview_widget.isVisible():
             return
 
-        # Diminuisce il fattore di zoom del 20%
-        self.zoom_factor *= 0.8
+        # Diminuisce il fattore di zoom (del 20% con le impostazioni predefinite)
+        self.zoom_factor *= get_impostazioni().passo_zoom_indietro
 
         # Applica il nuovo zoom
         self.pdf_view.resetTransform()
@@ -671,7 +868,7 @@ class FatturaRenamer(QMainWindow):
         self.pdf_scene.clear()
 
         # Se non c'è nessun file selezionato, nascondi l'anteprima
-        if current_row < 0 or current_row >= len(self.file_paths):
+        if current_row < 0 or current_row >= len(self.file_model):
             self.pdf_preview_widget.setVisible(False)
             self.preview_title.setText("Anteprima PDF")
             self.current_pdf_path = None
@@ -683,7 +880,7 @@ class FatturaRenamer(QMainWindow):
             return
 
         # Ottieni il percorso del file selezionato
-        file_path = self.file_paths[current_row]
+        file_path = self.file_model.percorso(current_row)
         self.current_pdf_path = file_path
 
         # Resetta il fattore di zoom quando si cambia documento
@@ -692,9 +889,21 @@ class FatturaRenamer(QMainWindow):
         # Resetta la pagina corrente
         self.current_page = 0
 
+        # Le fatture elettroniche XML/p7m non hanno una rappresentazione grafica
+        if is_fattura_elettronica(file_path):
+            self.pdf_preview_widget.setVisible(False)
+            self.preview_title.setText("Anteprima non disponibile per le fatture elettroniche")
+            return
+
+        # I documenti in quarantena hanno già bloccato l'estrazione: non li apriamo nel processo dell'interfaccia
+        if self.estrattore.quarantena.contiene(file_path):
+            self.pdf_preview_widget.setVisible(False)
+            self.preview_title.setText(f"Anteprima non disponibile: {nome_documento(file_path)} è in quarantena")
+            return
+
         try:
             # Apri il PDF con PyMuPDF
-            doc = fitz.open(file_path)
+            doc = apri_pdf(file_path)
 
             # Salva il numero totale di pagine
             self.total_pages = len(doc)
@@ -709,7 +918,7 @@ class FatturaRenamer(QMainWindow):
             self.pdf_preview_widget.setVisible(True)
 
             # Aggiorna il titolo con il nome del file
-            self.preview_title.setText(f"Anteprima: {os.path.basename(file_path)}")
+            self.preview_title.setText(f"Anteprima: {nome_documento(file_path)}")
 
             # Chiudi il documento
             doc.close()
@@ -718,8 +927,8 @@ class FatturaRenamer(QMainWindow):
             # In caso di errore, nascondi l'anteprima e mostra un messaggio
             self.pdf_preview_widget.setVisible(False)
             self.preview_title.setText(f"Errore nell'anteprima: {str(e)}")
-            logging.error(f"Errore durante la generazione dell'anteprima PDF: {str(e)}")
-            logging.debug(traceback.format_exc())
+            logging.error("Errore durante la generazione dell'anteprima PDF: %s", e)
+            logging.debug("Traceback dell'errore:", exc_info=True)
 
     def mostra_pagina_corrente(self, doc=None):
         """
@@ -734,7 +943,7 @@ class FatturaRenamer(QMainWindow):
         close_doc = False
         try:
             if doc is None:
-                doc = fitz.open(self.current_pdf_path)
+                doc = apri_pdf(self.current_pdf_path)
                 close_doc = True
 
             if self.current_page < 0:
@@ -746,7 +955,9 @@ class FatturaRenamer(QMainWindow):
             page = doc[self.current_page]
 
             # Renderizza la pagina come immagine
-            pix = page.get_pixmap(matrix=fitz.Matrix(1.5, 1.5))  # Scala 1.5 per una migliore qualità
+            # Scala maggiore di 1 (1.5 con le impostazioni predefinite) per una migliore qualità
+            scala = get_impostazioni().scala_anteprima
+            pix = page.get_pixmap(matrix=fitz.Matrix(scala, scala))
 
             # Converti l'immagine in QImage
             img = QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format.Format_RGB888)
@@ -766,8 +977,8 @@ class FatturaRenamer(QMainWindow):
             self.page_label.setText(f"Pagina {self.current_page + 1} di {self.total_pages}")
 
         except Exception as e:
-            logging.error(f"Errore durante la visualizzazione della pagina {self.current_page}: {str(e)}")
-            logging.debug(traceback.format_exc())
+            logging.error("Errore durante la visualizzazione della pagina %s: %s", self.current_page, e)
+            logging.debug("Traceback dell'errore:", exc_info=True)
         finally:
             if close_doc and doc:
                 doc.close()
@@ -817,7 +1028,8 @@ class FatturaRenamer(QMainWindow):
             testo_estratto (str): Testo completo estratto dal PDF
 
         Returns:
-            tuple: Denominazione, numero fattura e data fattura confermati o corretti
+            tuple: Denominazione, numero fattura e data fattura confermati o corretti, e True se
+                l'utente ha confermato (False se ha annullato: i valori sono quelli ricevuti)
         """
         from PyQt6.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton, QTextEdit
 
@@ -887,37 +1099,108 @@ class FatturaRenamer(QMainWindow):
                 if new_denom and new_denom != denominazione:
                     # Crea un nuovo pattern per la denominazione
                     pattern = self.crea_pattern_da_testo(testo_estratto, new_denom, "denominazione")
-                    if pattern:
+                    if pattern and self.conferma_pattern(pattern, "denominazione"):
                         self.pattern_db.add_global_pattern("denominazione", pattern)
 
+                # Un fornitore solo simile viene usato solo se l'utente conferma che è lo stesso
+                fornitore_simile = self.pattern_db.suggerisci_fornitore(new_denom)
+                if fornitore_simile and self.conferma_fornitore_simile(new_denom, fornitore_simile):
+                    self.pattern_db.conferma_alias(new_denom, fornitore_simile)
+                    new_denom = fornitore_simile
+
                 if new_denom and new_num and new_data:
-                    # Crea un pattern specifico per questo fornitore
-                    pattern = self.crea_pattern_da_testo(testo_estratto, f"{new_num}\\s+{new_data}", "numero_data")
-                    if pattern:
+                    # Crea un pattern specifico per questo fornitore, validato sui campioni già salvati
+                    pattern = self.crea_pattern_da_testo(testo_estratto, (new_num, new_data), "numero_data", new_denom)
+                    if pattern and self.conferma_pattern(pattern, "numero_data", new_denom):
                         self.pattern_db.add_fornitore_pattern(new_denom, {
                             "numero_data": pattern
                         })
+                    self.pattern_db.add_campione(new_denom, testo_estratto, new_num, new_data)
+
+            return new_denom, new_num, new_data, True
+
+        return denominazione, numero_fattura, data_fattura, False
+
+    def conferma_fornitore_simile(self, denominazione, fornitore):
+        """
+        Chiede se una denominazione indica un fornitore già noto con un nome simile.
+
+        Args:
+            denominazione (str): Denominazione confermata dall'utente
+            fornitore (str): Fornitore noto con il nome più simile
+
+        Returns:
+            bool: True se si tratta dello stesso fornitore
+        """
+        risposta = QMessageBox.question(
+            self, "Fornitore simile",
+            f"La denominazione:\n{denominazione}\n\nè simile al fornitore già noto:\n{fornitore}\n\n"
+            "Si tratta dello stesso fornitore? Le prossime fatture con questa denominazione "
+            "verranno attribuite al fornitore noto.",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+            QMessageBox.StandardButton.No
+        )
+        return risposta == QMessageBox.StandardButton.Yes
+
+    def conferma_pattern(self, pattern, tipo, denominazione=None):
+        """
+        Verifica un pattern candidato sulle fatture già elaborate e chiede se salvarlo.
 
-            return new_denom, new_num, new_data
+        Il pattern viene provato sui testi della cache (vedi `backtest.verifica_pattern`)
+        e l'utente vede percentuale di corrispondenze, corrispondenze su altri
+        fornitori e costo per file. Senza fatture in cache il pattern viene
+        salvato senza chiedere.
 
-        return denominazione, numero_fattura, data_fattura
+        Args:
+            pattern (str): Pattern candidato
+            tipo (str): Tipo di pattern (denominazione, numero_data)
+            denominazione (str, optional): Fornitore del pattern "numero_data"
 
-    def crea_pattern_da_testo(self, testo, valore, tipo):
+        Returns:
+            bool: True se il pattern va salvato
+        """
+        QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+        try:
+            risultato = verifica_pattern(pattern, tipo, self.pattern_db, denominazione,
+                                         in_attesa=QApplication.processEvents)
+        except Exception as e:
+            # La verifica non deve impedire l'apprendimento
+            logging.error("Errore nella verifica del pattern %s: %s", pattern, e)
+            return True
+        finally:
+            QApplication.restoreOverrideCursor()
+
+        if not risultato.documenti and not risultato.errore:
+            logging.info("Nessuna fattura in cache su cui verificare il pattern %s", pattern)
+            return True
+
+        problemi = risultato.problemi
+        testo = f"Nuovo pattern ({tipo}):\n{pattern}\n\n{risultato.riepilogo()}"
+        if problemi:
+            testo += "\n\nProblemi rilevati:\n- " + "\n- ".join(problemi)
+        risposta = QMessageBox.question(
+            self, "Verifica del pattern", testo + "\n\nSalvare il pattern?",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+            QMessageBox.StandardButton.No if problemi else QMessageBox.StandardButton.Yes
+        )
+        salva = risposta == QMessageBox.StandardButton.Yes
+        logging.info("Pattern %s %s dopo la verifica", pattern, "salvato" if salva else "scartato")
+        return salva
+
+    def crea_pattern_da_testo(self, testo, valore, tipo, denominazione=None):
         """
         Crea un pattern regex basato sul testo e sul valore estratto.
 
         Args:
             testo (str): Testo completo
-            valore (str): Valore da cercare nel testo
+            valore (str | tuple): Valore da cercare nel testo; per "numero_data" la coppia (numero, data)
             tipo (str): Tipo di pattern (denominazione, numero_data)
+            denominazione (str, optional): Fornitore i cui campioni servono a validare il pattern "numero_data"
 
         Returns:
             str: Pattern regex creato o None se non è possibile crearlo
         """
         try:
-            # Escape dei caratteri speciali nel valore
-            escaped_value = re.escape(valore)
-
             if tipo == "denominazione":
                 # Cerca il valore nel testo e crea un pattern con il contesto
                 index = testo.find(valore)
@@ -934,14 +1217,14 @@ class FatturaRenamer(QMainWindow):
                     return f"{re.escape(prefix)}(.+)"
 
             elif tipo == "numero_data":
-                # Per numero e data, crea un pattern che cattura entrambi
-                parts = escaped_value.split("\\s+")
-                if len(parts) == 2:
-                    return f"({parts[0]})\\s+({parts[1]})"
+                # Per numero e data, generalizza i valori e valida il pattern sui campioni del fornitore
+                numero, data = valore
+                campioni = self.pattern_db.get_campioni(denominazione) if denominazione else []
+                return induci_pattern_numero_data(testo, numero, data, campioni)
 
             return None
         except Exception as e:
-            logging.error(f"Errore nella creazione del pattern: {str(e)}")
+            logging.error("Errore nella creazione del pattern: %s", e)
             return None
 
     def apri_gestore_pattern(self):
@@ -950,6 +1233,9 @@ class FatturaRenamer(QMainWindow):
         """
         from PyQt6.QtWidgets import QDialog, QVBoxLayout, QTabWidget, QTableWidget, QTableWidgetItem, QPushButton, QHBoxLayout
 
+        # Mostra anche i pattern salvati da altre istanze nel frattempo
+        self.pattern_db.ricarica_se_modificato()
+
         dialog = QDialog(self)
         dialog.setWindowTitle("Gestione Pattern di Estrazione")
         dialog.resize(800, 600)
@@ -999,21 +1285,51 @@ class FatturaRenamer(QMainWindow):
         fornitori_tab = QWidget()
         fornitori_layout = QVBoxLayout()
 
-        fornitori_table = QTableWidget(0, 3)
-        fornitori_table.setHorizontalHeaderLabels(["Fornitore", "Tipo Pattern", "Pattern Regex"])
+        filtro_fornitori = QLineEdit()
+        filtro_fornitori.setPlaceholderText("Filtra per fornitore...")
+        filtro_fornitori.setClearButtonEnabled(True)
+        fornitori_layout.addWidget(filtro_fornitori)
+
+        # Solo una pagina di fornitori alla volta: il database può contenerne decine di migliaia
+        fornitori_model = PatternFornitoriModel(self.pattern_db, dialog)
+        fornitori_table = QTableView()
+        fornitori_table.setModel(fornitori_model)
         fornitori_table.horizontalHeader().setStretchLastSection(True)
+        fornitori_table.verticalHeader().setVisible(False)
+        fornitori_layout.addWidget(fornitori_table)
 
-        # Popola la tabella
-        row = 0
-        for fornitore, patterns in self.pattern_db.patterns["fornitori"].items():
-            for tipo, pattern in patterns.items():
-                fornitori_table.insertRow(row)
-                fornitori_table.setItem(row, 0, QTableWidgetItem(fornitore))
-                fornitori_table.setItem(row, 1, QTableWidgetItem(tipo))
-                fornitori_table.setItem(row, 2, QTableWidgetItem(pattern))
-                row += 1
+        pagine_layout = QHBoxLayout()
+        btn_pagina_precedente = QPushButton("◀ Precedente")
+        btn_pagina_successiva = QPushButton("Successiva ▶")
+        label_pagina = QLabel()
+        pagine_layout.addWidget(btn_pagina_precedente)
+        pagine_layout.addStretch()
+        pagine_layout.addWidget(label_pagina)
+        pagine_layout.addStretch()
+        pagine_layout.addWidget(btn_pagina_successiva)
+        fornitori_layout.addLayout(pagine_layout)
+
+        def aggiorna_pagina():
+            label_pagina.setText(
+                f"Pagina {fornitori_model.pagina + 1} di {fornitori_model.numero_pagine} "
+                f"({fornitori_model.numero_fornitori} fornitori)"
+            )
+            btn_pagina_precedente.setEnabled(fornitori_model.pagina > 0)
+            btn_pagina_successiva.setEnabled(fornitori_model.pagina < fornitori_model.numero_pagine - 1)
+
+        def cambia_pagina(passo):
+            fornitori_model.vai_a_pagina(fornitori_model.pagina + passo)
+            aggiorna_pagina()
+
+        def filtra(testo):
+            fornitori_model.imposta_filtro(testo)
+            aggiorna_pagina()
+
+        filtro_fornitori.textChanged.connect(filtra)
+        btn_pagina_precedente.clicked.connect(lambda: cambia_pagina(-1))
+        btn_pagina_successiva.clicked.connect(lambda: cambia_pagina(1))
+        aggiorna_pagina()
 
-        fornitori_layout.addWidget(fornitori_table)
         fornitori_tab.setLayout(fornitori_layout)
         tab_widget.addTab(fornitori_tab, "Pattern Fornitori")
 
@@ -1029,6 +1345,222 @@ class FatturaRenamer(QMainWindow):
         dialog.setLayout(layout)
         dialog.exec()
 
+    def percorso_destinazione(self, file_path, nuovo_nome, denominazione, usa_cartelle, occupati=None):
+        """
+        Calcola il percorso in cui salvare il documento rinominato.
+
+        Vedi `utils.percorso_destinazione`.
+
+        Raises:
+            OSError: Se non è possibile creare la cartella del fornitore
+        """
+        return percorso_destinazione(file_path, nuovo_nome, denominazione, usa_cartelle, occupati=occupati)
+
+    def salva_documenti_accodati(self, accodati, manifest):
+        """
+        Sposta insieme i documenti rinominati accodati da `processa_file`.
+
+        I file vengono portati nelle destinazioni con `document_source.salva_documenti`:
+        le copie verso un altro volume avvengono in parallelo e ogni cartella di
+        destinazione viene sincronizzata una sola volta. Per ogni documento viene
+        registrata la riga del manifest e aggiornato lo stato nella lista.
+
+        Args:
+            accodati (list): Dizionari con "percorso", "nuovo_percorso", "durata_ms" e i dati della fattura
+            manifest (ManifestLotto): Manifest del batch
+
+        Returns:
+            tuple: (numero di documenti salvati, lista dei nomi dei documenti non salvati)
+        """
+        inizio = time.perf_counter()
+        esiti = salva_documenti([(voce["percorso"], voce["nuovo_percorso"]) for voce in accodati])
+        # Gli spostamenti avvengono insieme: a ogni documento viene attribuita la durata media
+        durata_spostamento_ms = (time.perf_counter() - inizio) * 1000 / max(1, len(accodati))
+
+        successi = 0
+        errori = []
+        for voce, errore in zip(accodati, esiti):
+            file_path = voce["percorso"]
+            if errore is None:
+                logging.info("File rinominato con successo: %s", voce["nuovo_percorso"])
+                successi += 1
+            else:
+                logging.error("Errore durante la rinomina del file %s: %s", file_path, errore)
+                errori.append(nome_documento(file_path))
+            manifest.aggiungi(
+                file_path, ESITO_ERRORE if errore else ESITO_RINOMINATO,
+                nuovo_percorso=None if errore else voce["nuovo_percorso"], denominazione=voce["denominazione"],
+                numero_fattura=voce["numero_fattura"], data_fattura=voce["data_fattura"],
+                origine=voce["origine"], pattern=voce["pattern"],
+                durata_ms=voce["durata_ms"] + durata_spostamento_ms, errore=errore
+            )
+            self.file_model.imposta_stato(file_path, STATO_FALLITO if errore else STATO_RINOMINATO)
+        return successi, errori
+
+    def dividi_documento(self, file_path, tipologia, stagione, anno, genere, generico, usa_cartelle, manifest=None,
+                         occupati=None):
+        """
+        Divide un PDF con più fatture concatenate e salva ogni fattura con il proprio nome.
+
+        Lettura e salvataggio delle pagine avvengono nel processo di estrazione
+        supervisionato, con lo stesso budget e la stessa quarantena dell'estrazione;
+        il file originale non viene modificato. Le fatture di cui non è stato
+        possibile riconoscere tutti i dati vengono salvate con il nome del file
+        originale seguito dal numero della parte.
+
+        Args:
+            file_path (str): Percorso del PDF da dividere
+            tipologia, stagione, anno, genere, generico: Parametri per `genera_nome_file`
+            usa_cartelle (bool): Se True, salva ogni fattura nella cartella del fornitore
+            manifest (ManifestLotto, optional): Manifest in cui registrare una riga per ogni fattura
+            occupati (set, optional): Destinazioni già assegnate ad altri documenti, non ancora
+                salvati; vi vengono aggiunte quelle delle fatture
+
+        Returns:
+            tuple: (numero di fatture salvate con successo, lista dei nomi delle parti non riconosciute)
+
+        Raises:
+            EstrazioneInterrottaError: Se il documento è in quarantena, supera il budget
+                o fa terminare il processo di estrazione
+        """
+        inizio = time.perf_counter()
+        parti = self.estrattore.esegui(trova_fatture_documento, file_path, in_attesa=QApplication.processEvents)
+
+        # Le destinazioni vengono calcolate prima di salvare: quelle già assegnate contano come occupate
+        destinazioni = []
+        assegnate = set() if occupati is None else occupati
+        for numero_parte, parte in enumerate(parti, start=1):
+            if parte.is_completa():
+                nuovo_nome = genera_nome_file(
+                    tipologia, parte.numero_fattura, parte.data_fattura, parte.denominazione,
+                    stagione, anno, genere, generico
+                )
+                destinazione = self.percorso_destinazione(
+                    file_path, nuovo_nome, parte.denominazione, usa_cartelle, occupati=assegnate
+                )
+            else:
+                base = os.path.splitext(os.path.basename(nome_documento(file_path)))[0]
+                destinazione = self.percorso_destinazione(
+                    file_path, f"{base}_parte_{numero_parte}.pdf", None, False, occupati=assegnate
+                )
+            destinazioni.append(destinazione)
+            assegnate.add(destinazione)
+
+        errori_salvataggio = self.estrattore.esegui(
+            salva_parti_documento, file_path, list(zip(parti, destinazioni)), in_attesa=QApplication.processEvents
+        )
+        # Il tempo del documento viene ripartito tra le fatture che contiene
+        durata_ms = (time.perf_counter() - inizio) * 1000 / max(1, len(parti))
+
+        successi = 0
+        errori = []
+        for parte, nuovo_percorso, errore in zip(parti, destinazioni, errori_salvataggio):
+            pagine = f"{parte.prima_pagina + 1}-{parte.ultima_pagina + 1}"
+            if errore is not None:
+                esito, nuovo_percorso = ESITO_ERRORE, None
+                errori.append(f"{nome_documento(file_path)} (pagine {pagine})")
+            elif parte.is_completa():
+                esito = ESITO_RINOMINATO
+                successi += 1
+            else:
+                esito = ESITO_NON_RICONOSCIUTO
+                errori.append(f"{nome_documento(file_path)} (pagine {pagine})")
+
+            if manifest is not None:
+                manifest.aggiungi(
+                    file_path, esito, nuovo_percorso=nuovo_percorso, pagine=pagine,
+                    denominazione=parte.denominazione, numero_fattura=parte.numero_fattura,
+                    data_fattura=parte.data_fattura, origine="divisione",
+                    durata_ms=durata_ms, errore=errore
+                )
+        return successi, errori
+
+    def simula_file(self, parametri_nome, usa_cartelle, dividi):
+        """
+        Calcola il piano di rinomina dei documenti selezionati senza modificare alcun file.
+
+        Il piano viene salvato come JSON nella cartella del primo documento e può
+        essere eseguito in seguito con "Esegui piano di rinomina" (vedi `planner`).
+
+        Args:
+            parametri_nome (dict): Parametri di `genera_nome_file`
+            usa_cartelle (bool): Se True, il piano usa le cartelle dei fornitori
+            dividi (bool): Divisione dei PDF richiesta; non è supportata dalla simulazione
+        """
+        file_paths = self.file_model.percorsi()
+        if dividi:
+            QMessageBox.information(
+                self, "Simulazione",
+                "La simulazione non divide i PDF: ogni documento viene pianificato come una sola fattura."
+            )
+        logging.info("Avvio simulazione di %d documenti", len(file_paths))
+        self.label_output.setText(f"⏳ Simulazione di {len(file_paths)} documenti in corso...")
+
+        piano = calcola_piano(file_paths, parametri_nome, usa_cartelle, in_attesa=QApplication.processEvents)
+        percorso_piano = os.path.join(
+            cartella_documento(file_paths[0]), f"piano_{time.strftime('%Y%m%d_%H%M%S')}.json"
+        )
+        salva_piano(piano, percorso_piano)
+
+        for voce in piano["voci"]:
+            self.file_model.imposta_stato(voce["percorso_originale"], STATO_ESTRATTO)
+        for fallito in piano["falliti"]:
+            self.file_model.imposta_stato(fallito["percorso_originale"], STATO_FALLITO)
+
+        collisioni = sum(1 for voce in piano["voci"] if voce["collisione"])
+        result_text = (
+            f"🔎 Simulazione: {len(piano['voci'])} file da rinominare "
+            f"({collisioni} con nome già occupato), {len(piano['falliti'])} non elaborabili, "
+            f"{len(piano['cartelle_da_creare'])} cartelle da creare."
+        )
+        if piano["falliti"]:
+            nomi = [nome_documento(f["percorso_originale"]) for f in piano["falliti"]]
+            result_text += "\n\nFile non elaborabili:\n" + "\n".join(nomi[:5])
+            if len(nomi) > 5:
+                result_text += f"\n... e altri {len(nomi) - 5} file"
+        result_text += f"\n\n📄 Piano: {percorso_piano}"
+        self.label_output.setText(result_text)
+
+    def esegui_piano_salvato(self):
+        """
+        Rinomina i documenti secondo un piano salvato da una simulazione.
+
+        Salva il manifest dell'esecuzione nella cartella del piano.
+        """
+        percorso_piano, _ = QFileDialog.getOpenFileName(
+            self, "Seleziona il piano di rinomina", "", "Piano di rinomina (*.json)"
+        )
+        if not percorso_piano:
+            return
+        try:
+            piano = carica_piano(percorso_piano)
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "Errore", f"Impossibile leggere il piano:\n\n{str(e)}")
+            return
+
+        risposta = QMessageBox.question(
+            self, "Esegui piano",
+            f"Rinominare {len(piano['voci'])} file secondo il piano del {piano.get('creato', '')}?"
+        )
+        if risposta != QMessageBox.StandardButton.Yes:
+            return
+
+        manifest = ManifestLotto()
+        riusciti, saltati = esegui_piano(piano, manifest)
+        result_text = f"✅ {riusciti} file rinominati dal piano.\n❌ {len(saltati)} file saltati."
+        if saltati:
+            result_text += "\n\nFile saltati:\n" + "\n".join(
+                f"{nome_documento(path)} ({errore})" for path, errore in saltati[:5]
+            )
+            if len(saltati) > 5:
+                result_text += f"\n... e altri {len(saltati) - 5} file"
+        try:
+            scritti = manifest.salva(os.path.dirname(percorso_piano))
+            result_text += f"\n\n📄 Manifest: {scritti[0]}"
+        except Exception as e:
+            logging.error("Errore durante il salvataggio del manifest: %s", e)
+        self.label_output.setText(result_text)
+
     def processa_file(self):
         """
         Elabora tutti i file PDF selezionati per rinominarli.
@@ -1041,14 +1573,26 @@ class FatturaRenamer(QMainWindow):
         Mostra messaggi di errore se non ci sono file selezionati o se mancano
         parametri obbligatori.
 
+        I file rinominati non vengono spostati uno alla volta: vengono accodati e
+        spostati insieme ogni `DOCUMENTI_PER_SPOSTAMENTO` documenti e alla fine
+        del batch (vedi `salva_documenti_accodati`).
+
         Al termine, visualizza un riepilogo dei file elaborati con successo
-        e di quelli non elaborati.
+        e di quelli non elaborati e salva il manifest del batch (vedi `manifest.ManifestLotto`)
+        nella cartella del primo documento.
         """
+        # Durante l'attesa dell'estrazione l'interfaccia resta attiva: evitiamo un secondo avvio
+        self.button_process.setEnabled(False)
+        self.button_reset.setEnabled(False)
         try:
-            if not self.file_paths:
+            if len(self.file_model) == 0:
                 QMessageBox.warning(self, "Errore", "Nessun file selezionato.")
                 return
 
+            if self.scanner is not None:
+                QMessageBox.warning(self, "Attendere", "Scansione della cartella ancora in corso.")
+                return
+
             anno = self.anno_input.text().strip()
             generico = self.generico_checkbox.isChecked()
 
@@ -1061,83 +1605,116 @@ class FatturaRenamer(QMainWindow):
             stagione = self.stagione_combo.currentText()
             genere = self.genere_combo.currentText()
             usa_cartelle = self.cartella_checkbox.isChecked()
+            dividi = self.dividi_checkbox.isChecked()
+
+            if self.simulazione_checkbox.isChecked():
+                parametri_nome = {
+                    "tipologia": tipologia, "stagione": stagione, "anno": anno, "genere": genere, "generico": generico
+                }
+                self.simula_file(parametri_nome, usa_cartelle, dividi)
+                return
 
             # Log dei parametri di elaborazione
-            logging.info(f"Avvio elaborazione con parametri: tipologia={tipologia}, stagione={stagione}, "
-                        f"anno={anno}, genere={genere}, generico={generico}, usa_cartelle={usa_cartelle}")
-            logging.info(f"File da elaborare: {len(self.file_paths)}")
+            logging.info("Avvio elaborazione con parametri: tipologia=%s, stagione=%s, anno=%s, genere=%s, "
+                         "generico=%s, usa_cartelle=%s, dividi=%s",
+                         tipologia, stagione, anno, genere, generico, usa_cartelle, dividi)
+            file_paths = self.file_model.percorsi()
+            logging.info("File da elaborare: %s", len(file_paths))
 
             success_count = 0
             fail_count = 0
             error_files = []
-
-            for file_path in self.file_paths:
+            manifest = ManifestLotto()
+            # Le cartelle dei fornitori vengono lette una volta per lotto, non per ogni file
+            azzera_indice_cartelle()
+            # Documenti rinominati in attesa di essere spostati e destinazioni già assegnate
+            accodati = []
+            assegnate = set()
+
+            for file_path in file_paths:
+                if len(accodati) >= DOCUMENTI_PER_SPOSTAMENTO:
+                    successi, errori = self.salva_documenti_accodati(accodati, manifest)
+                    success_count += successi
+                    fail_count += len(errori)
+                    error_files.extend(errori)
+                    accodati = []
+                    QApplication.processEvents()
+
+                falliti_prima = fail_count
+                inizio = time.perf_counter()
+                # Il tempo passato nel dialog di conferma non fa parte della durata dell'elaborazione
+                attesa_utente = 0.0
+                dettagli = {}
+                denominazione = numero_fattura = data_fattura = nuovo_percorso = errore = None
+                diviso = accodato = False
                 try:
-                    logging.info(f"Elaborazione file: {file_path}")
+                    logging.info("Elaborazione file: %s", file_path)
+
+                    # Modalità divisione: ogni fattura contenuta nel PDF diventa un file separato
+                    if dividi and not is_fattura_elettronica(file_path):
+                        if self.estrattore.quarantena.contiene(file_path):
+                            raise EstrazioneInterrottaError(f"Documento in quarantena: {file_path}")
+                        diviso = True
+                        successi, errori = self.dividi_documento(
+                            file_path, tipologia, stagione, anno, genere, generico, usa_cartelle, manifest,
+                            occupati=assegnate
+                        )
+                        success_count += successi
+                        fail_count += len(errori)
+                        error_files.extend(errori)
+                        continue
 
                     # Estrai informazioni dal PDF con feedback mode
-                    denominazione, numero_fattura, data_fattura, testo_estratto = estrai_info_da_pdf(file_path, feedback_mode=True)
+                    # L'estrazione avviene in un processo separato: un PDF che blocca o fa
+                    # terminare MuPDF costa al massimo il budget di tempo, non l'intero batch
+                    denominazione, numero_fattura, data_fattura, testo_estratto = self.estrattore.estrai(
+                        file_path, dettagli, in_attesa=QApplication.processEvents
+                    )
 
                     if all([denominazione, numero_fattura, data_fattura]):
-                        logging.info(f"Informazioni estratte: denominazione={denominazione}, "
-                                    f"numero_fattura={numero_fattura}, data_fattura={data_fattura}")
+                        logging.info("Informazioni estratte: denominazione=%s, numero_fattura=%s, data_fattura=%s",
+                                     denominazione, numero_fattura, data_fattura)
+                        self.file_model.imposta_stato(file_path, STATO_ESTRATTO)
 
                         # Chiedi conferma e migliora i pattern solo se l'apprendimento automatico è abilitato
                         if self.ml_checkbox.isChecked():
-                            denominazione, numero_fattura, data_fattura = self.mostra_dialog_feedback(
+                            inizio_dialog = time.perf_counter()
+                            denominazione, numero_fattura, data_fattura, confermato = self.mostra_dialog_feedback(
                                 file_path, denominazione, numero_fattura, data_fattura, testo_estratto
                             )
+                            attesa_utente += time.perf_counter() - inizio_dialog
+                            # Solo un fornitore confermato dall'utente diventa l'impronta del layout
+                            if confermato and denominazione:
+                                self.pattern_db.registra_impronta(dettagli.get("impronta"), denominazione, confermata=True)
 
                         # Genera il nuovo nome file
                         nuovo_nome = genera_nome_file(
-                            tipologia, numero_fattura, data_fattura, denominazione, stagione, anno, genere, generico
+                            tipologia, numero_fattura, data_fattura, denominazione, stagione, anno, genere, generico,
+                            estensione_documento(file_path)
                         )
-                        logging.info(f"Nuovo nome generato: {nuovo_nome}")
-
-                        base_dir = os.path.dirname(file_path)
-                        destinazione = base_dir
-
-                        # Gestione delle cartelle
-                        if usa_cartelle:
-                            destinazione = os.path.join(base_dir, denominazione.replace(" ", "_"))
-                            try:
-                                os.makedirs(destinazione, exist_ok=True)
-                                logging.info(f"Cartella creata/verificata: {destinazione}")
-                            except Exception as e:
-                                logging.error(f"Errore nella creazione della cartella {destinazione}: {str(e)}")
-                                raise
-
-                        nuovo_percorso = os.path.join(destinazione, nuovo_nome)
-
-                        # Verifica se il file di destinazione esiste già
-                        if os.path.exists(nuovo_percorso):
-                            logging.warning(f"Il file di destinazione esiste già: {nuovo_percorso}")
-                            # Aggiungi un suffisso al nome file per evitare sovrascritture
-                            base, ext = os.path.splitext(nuovo_nome)
-                            timestamp = datetime.now().strftime("%H%M%S")
-                            nuovo_nome = f"{base}_{timestamp}{ext}"
-                            nuovo_percorso = os.path.join(destinazione, nuovo_nome)
-                            logging.info(f"Nuovo nome con timestamp: {nuovo_nome}")
-
-                        # Rinomina il file
-                        try:
-                            os.rename(file_path, nuovo_percorso)
-                            logging.info(f"File rinominato con successo: {nuovo_percorso}")
-                            success_count += 1
-                        except Exception as e:
-                            logging.error(f"Errore durante la rinomina del file {file_path}: {str(e)}")
-                            error_files.append(os.path.basename(file_path))
-                            fail_count += 1
+                        logging.info("Nuovo nome generato: %s", nuovo_nome)
+
+                        nuovo_percorso = self.percorso_destinazione(
+                            file_path, nuovo_nome, denominazione, usa_cartelle, occupati=assegnate
+                        )
+                        assegnate.add(nuovo_percorso)
+                        accodato = True
                     else:
                         # Se l'estrazione è fallita ma abbiamo il testo, chiedi all'utente di inserire manualmente
                         if testo_estratto:
-                            logging.info(f"Estrazione fallita ma testo disponibile")
+                            logging.info("Estrazione fallita ma testo disponibile")
                             # Mostra il dialog solo se l'apprendimento automatico è abilitato
                             if self.ml_checkbox.isChecked():
-                                logging.info(f"Richiedo input manuale per miglioramento")
-                                denominazione, numero_fattura, data_fattura = self.mostra_dialog_feedback(
+                                logging.info("Richiedo input manuale per miglioramento")
+                                inizio_dialog = time.perf_counter()
+                                denominazione, numero_fattura, data_fattura, confermato = self.mostra_dialog_feedback(
                                     file_path, None, None, None, testo_estratto
                                 )
+                                attesa_utente += time.perf_counter() - inizio_dialog
+                                if confermato and denominazione:
+                                    self.pattern_db.registra_impronta(
+                                        dettagli.get("impronta"), denominazione, confermata=True
+                                    )
                             else:
                                 # Se l'apprendimento automatico è disabilitato, non mostrare il dialog
                                 denominazione, numero_fattura, data_fattura = None, None, None
@@ -1146,58 +1723,63 @@ class FatturaRenamer(QMainWindow):
                             if all([denominazione, numero_fattura, data_fattura]):
                                 # Genera il nuovo nome file
                                 nuovo_nome = genera_nome_file(
-                                    tipologia, numero_fattura, data_fattura, denominazione, stagione, anno, genere, generico
+                                    tipologia, numero_fattura, data_fattura, denominazione, stagione, anno, genere, generico,
+                                    estensione_documento(file_path)
+                                )
+                                logging.info("Nuovo nome generato manualmente: %s", nuovo_nome)
+
+                                dettagli = {"origine": "manuale"}
+                                nuovo_percorso = self.percorso_destinazione(
+                                    file_path, nuovo_nome, denominazione, usa_cartelle, occupati=assegnate
                                 )
-                                logging.info(f"Nuovo nome generato manualmente: {nuovo_nome}")
-
-                                base_dir = os.path.dirname(file_path)
-                                destinazione = base_dir
-
-                                # Gestione delle cartelle
-                                if usa_cartelle:
-                                    destinazione = os.path.join(base_dir, denominazione.replace(" ", "_"))
-                                    try:
-                                        os.makedirs(destinazione, exist_ok=True)
-                                        logging.info(f"Cartella creata/verificata: {destinazione}")
-                                    except Exception as e:
-                                        logging.error(f"Errore nella creazione della cartella {destinazione}: {str(e)}")
-                                        raise
-
-                                nuovo_percorso = os.path.join(destinazione, nuovo_nome)
-
-                                # Verifica se il file di destinazione esiste già
-                                if os.path.exists(nuovo_percorso):
-                                    logging.warning(f"Il file di destinazione esiste già: {nuovo_percorso}")
-                                    # Aggiungi un suffisso al nome file per evitare sovrascritture
-                                    base, ext = os.path.splitext(nuovo_nome)
-                                    timestamp = datetime.now().strftime("%H%M%S")
-                                    nuovo_nome = f"{base}_{timestamp}{ext}"
-                                    nuovo_percorso = os.path.join(destinazione, nuovo_nome)
-                                    logging.info(f"Nuovo nome con timestamp: {nuovo_nome}")
-
-                                # Rinomina il file
-                                try:
-                                    os.rename(file_path, nuovo_percorso)
-                                    logging.info(f"File rinominato con successo: {nuovo_percorso}")
-                                    success_count += 1
-                                except Exception as e:
-                                    logging.error(f"Errore durante la rinomina del file {file_path}: {str(e)}")
-                                    error_files.append(os.path.basename(file_path))
-                                    fail_count += 1
+                                assegnate.add(nuovo_percorso)
+                                accodato = True
                             else:
-                                logging.warning(f"L'utente non ha fornito dati sufficienti per la rinomina")
-                                error_files.append(os.path.basename(file_path))
+                                logging.warning("L'utente non ha fornito dati sufficienti per la rinomina")
+                                error_files.append(nome_documento(file_path))
                                 fail_count += 1
                         else:
-                            logging.warning(f"Impossibile estrarre tutte le informazioni dal file: {file_path}")
-                            error_files.append(os.path.basename(file_path))
+                            logging.warning("Impossibile estrarre tutte le informazioni dal file: %s", file_path)
+                            error_files.append(nome_documento(file_path))
                             fail_count += 1
 
                 except Exception as e:
-                    logging.error(f"Errore durante l'elaborazione del file {file_path}: {str(e)}")
-                    logging.debug(traceback.format_exc())
-                    error_files.append(os.path.basename(file_path))
+                    logging.error("Errore durante l'elaborazione del file %s: %s", file_path, e)
+                    logging.debug("Traceback dell'errore:", exc_info=True)
+                    error_files.append(nome_documento(file_path))
                     fail_count += 1
+                    errore = str(e)
+
+                finally:
+                    riuscito = fail_count == falliti_prima
+                    durata_ms = (time.perf_counter() - inizio - attesa_utente) * 1000
+                    if accodato and not errore:
+                        # Riga del manifest e stato vengono registrati dopo lo spostamento
+                        accodati.append({
+                            "percorso": file_path, "nuovo_percorso": nuovo_percorso, "denominazione": denominazione,
+                            "numero_fattura": numero_fattura, "data_fattura": data_fattura,
+                            "origine": dettagli.get("origine"), "pattern": dettagli.get("pattern"),
+                            "durata_ms": durata_ms,
+                        })
+                    # Le fatture ottenute dalla divisione hanno già le proprie righe
+                    elif not diviso or errore:
+                        manifest.aggiungi(
+                            file_path, ESITO_RINOMINATO if riuscito else (ESITO_ERRORE if errore else ESITO_NON_RICONOSCIUTO),
+                            nuovo_percorso=nuovo_percorso, denominazione=denominazione,
+                            numero_fattura=numero_fattura, data_fattura=data_fattura,
+                            origine=dettagli.get("origine"), pattern=dettagli.get("pattern"),
+                            durata_ms=durata_ms, errore=errore
+                        )
+                    # Aggiorna lo stato della riga e lascia ridisegnare la lista durante il batch
+                    if not accodato or errore:
+                        self.file_model.imposta_stato(file_path, STATO_RINOMINATO if riuscito else STATO_FALLITO)
+                    QApplication.processEvents()
+
+            if accodati:
+                successi, errori = self.salva_documenti_accodati(accodati, manifest)
+                success_count += successi
+                fail_count += len(errori)
+                error_files.extend(errori)
 
             # Aggiorna l'interfaccia con il risultato
             result_text = f"✅ {success_count} file rinominati correttamente.\n❌ {fail_count} file non elaborati."
@@ -1209,12 +1791,22 @@ class FatturaRenamer(QMainWindow):
                     error_files_text += f"\n... e altri {len(error_files) - 5} file"
                 result_text += error_files_text
 
+            # Il manifest permette di riconciliare il batch senza riaprire i documenti
+            try:
+                scritti = manifest.salva(cartella_documento(file_paths[0]))
+                result_text += f"\n\n📄 Manifest: {scritti[0]}"
+            except Exception as e:
+                logging.error("Errore durante il salvataggio del manifest: %s", e)
+
             self.label_output.setText(result_text)
-            logging.info(f"Elaborazione completata: {success_count} successi, {fail_count} fallimenti")
+            logging.info("Elaborazione completata: %d successi, %d fallimenti", success_count, fail_count)
 
         except Exception as e:
             # Gestione degli errori generali
-            logging.error(f"Errore generale durante l'elaborazione dei file: {str(e)}")
-            logging.debug(traceback.format_exc())
+            logging.error("Errore generale durante l'elaborazione dei file: %s", e)
+            logging.debug("Traceback dell'errore:", exc_info=True)
             QMessageBox.critical(self, "Errore", f"Si è verificato un errore durante l'elaborazione:\n\n{str(e)}")
             self.label_output.setText("❌ Errore durante l'elaborazione. Controlla il file di log per i dettagli.")
+        finally:
+            self.button_process.setEnabled(True)
+            self.button_reset.setEnabled(True)
@@ -7,39 +7,133 @@ grafica PyQt6 e avvia l'applicazione.
 
 import sys
 import os
+import json
+import time
+import queue
+import atexit
 import logging
 import traceback
-from datetime import datetime
+import multiprocessing
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from PyQt6.QtWidgets import QApplication, QMessageBox
 from gui import FatturaRenamer
+from config import get_impostazioni
+
+# Dimensione massima di un file di log e numero di file ruotati conservati
+LOG_MAX_BYTES = get_impostazioni().log_max_byte
+LOG_BACKUP_COUNT = get_impostazioni().log_copie
+
+# I vecchi log con timestamp (uno per avvio) più vecchi di questi giorni vengono eliminati
+LOG_GIORNI_CONSERVAZIONE = get_impostazioni().log_giorni_conservazione
+
+
+class FormatterJson(logging.Formatter):
+    """
+    Formatta ogni record come una riga JSON, adatta all'analisi automatica dei log.
+    """
+
+    def format(self, record):
+        voce = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "livello": record.levelname,
+            "logger": record.name,
+            "modulo": record.module,
+            "funzione": record.funcName,
+            "thread": record.threadName,
+            "messaggio": record.getMessage(),
+        }
+        if record.exc_info:
+            voce["eccezione"] = self.formatException(record.exc_info)
+        return json.dumps(voce, ensure_ascii=False)
+
+
+class HandlerCoda(QueueHandler):
+    """
+    Accoda i record senza formattarli.
+
+    Il `QueueHandler` standard formatta messaggio e traceback nel thread che
+    scrive il log; qui la formattazione avviene nel thread del `QueueListener`,
+    con il formatter del file. La coda è interna al processo, quindi il record
+    non deve essere serializzato; gli argomenti del messaggio vengono letti
+    quando il record viene scritto.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def _elimina_vecchi_log(log_dir):
+    """Elimina i file di log per avvio (comprese le copie ruotate) più vecchi di LOG_GIORNI_CONSERVAZIONE giorni."""
+    limite = time.time() - LOG_GIORNI_CONSERVAZIONE * 86400
+    for nome in os.listdir(log_dir):
+        if not nome.startswith(("error_log_", "invoicereader")) or not (".log" in nome or ".jsonl" in nome):
+            continue
+        percorso = os.path.join(log_dir, nome)
+        try:
+            if os.path.getmtime(percorso) < limite:
+                os.remove(percorso)
+        except OSError:
+            pass
+
 
 # Configurazione del sistema di logging
 def setup_logging():
     """
     Configura il sistema di logging per salvare i dettagli degli errori in un file.
 
-    Crea una directory 'logs' se non esiste e configura il logger per scrivere
-    in un file con timestamp nel nome.
+    Crea una directory 'logs' se non esiste. I messaggi vengono accodati da un
+    `QueueHandler` e scritti su disco da un `QueueListener` in un thread separato,
+    così l'elaborazione non attende mai il disco. Ogni istanza scrive nel proprio
+    file (data di avvio e PID nel nome), che viene ruotato in base alla dimensione
+    conservando solo le ultime copie; i log dei processi di estrazione arrivano
+    allo stesso file tramite il processo principale. I file più vecchi di
+    LOG_GIORNI_CONSERVAZIONE giorni vengono eliminati all'avvio.
+
+    Livello, formato e cartelle vengono letti dalle impostazioni (vedi `config`),
+    comprese le variabili d'ambiente:
+    - INVOICEREADER_LOG_LEVEL: livello minimo (DEBUG, INFO, WARNING, ...), predefinito INFO
+    - INVOICEREADER_LOG_JSON: se "1", scrive una riga JSON per messaggio (file .jsonl)
+
+    Returns:
+        str: Percorso del file di log
     """
     # Crea la directory dei log se non esiste
-    log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'logs')
+    impostazioni = get_impostazioni()
+    log_dir = impostazioni.cartella_log
     os.makedirs(log_dir, exist_ok=True)
 
     # Crea anche la directory data se non esiste
-    data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
-    os.makedirs(data_dir, exist_ok=True)
-
-    # Crea un nome file con timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    log_file = os.path.join(log_dir, f"error_log_{timestamp}.log")
-
-    # Configura il logger
-    logging.basicConfig(
-        filename=log_file,
-        level=logging.DEBUG,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
+    os.makedirs(impostazioni.cartella_dati, exist_ok=True)
+
+    _elimina_vecchi_log(log_dir)
+
+    livello = impostazioni.livello_log_numerico
+    formato_json = impostazioni.log_json
+
+    # Un file per processo: più istanze aperte insieme non ruotano né scrivono lo stesso file
+    nome_log = f"invoicereader_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+    log_file = os.path.join(log_dir, nome_log + (".jsonl" if formato_json else ".log"))
+    file_handler = RotatingFileHandler(
+        log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
     )
+    if formato_json:
+        file_handler.setFormatter(FormatterJson())
+    else:
+        file_handler.setFormatter(logging.Formatter(
+            '%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S'
+        ))
+
+    # Il logger principale si limita ad accodare i record; la scrittura avviene nel listener
+    coda = queue.SimpleQueue()
+    listener = QueueListener(coda, file_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(HandlerCoda(coda))
+    root.setLevel(livello)
 
     return log_file
 
@@ -66,7 +160,7 @@ def handle_exception(exc_type, exc_value, exc_traceback):
     tb_text = ''.join(tb_lines)
 
     # Log dettagliato
-    logging.error(f"Dettagli dell'errore:\n{tb_text}")
+    logging.error("Dettagli dell'errore:\n%s", tb_text)
 
     # Mostra un messaggio all'utente
     error_msg = f"Si è verificato un errore imprevisto.\n\nDettagli: {str(exc_value)}\n\nL'errore è stato registrato nel file di log."
@@ -78,6 +172,9 @@ def handle_exception(exc_type, exc_value, exc_traceback):
         print(error_msg)
 
 if __name__ == "__main__":
+    # Necessario per i processi worker nell'eseguibile generato con PyInstaller
+    multiprocessing.freeze_support()
+
     # Configura il logging
     log_file = setup_logging()
 
@@ -96,7 +193,7 @@ if __name__ == "__main__":
         sys.exit(app.exec())
     except Exception as e:
         # Cattura qualsiasi eccezione durante l'avvio dell'applicazione
-        logging.error(f"Errore durante l'avvio dell'applicazione: {str(e)}", exc_info=True)
+        logging.error("Errore durante l'avvio dell'applicazione: %s", e, exc_info=True)
 
         # Mostra un messaggio all'utente
         error_msg = f"Si è verificato un errore durante l'avvio dell'applicazione.\n\nDettagli: {str(e)}\n\nL'errore è stato registrato nel file: {log_file}"
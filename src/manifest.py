@@ -0,0 +1,100 @@
+"""
+Manifest dei risultati di un'elaborazione batch.
+
+Per ogni documento elaborato viene registrata una riga con percorso originale,
+nuovo percorso, dati estratti, pattern usato, tempo impiegato ed esito. Le righe
+vengono accumulate per colonna e scritte in un'unica operazione con pandas,
+in CSV e in Parquet (con pyarrow, incluso nei requisiti; senza un motore Parquet
+solo in CSV): la riconciliazione contabile può così unire i dati senza riaprire i PDF.
+"""
+
+import os
+import logging
+from datetime import datetime
+import pandas as pd
+
+# Colonne del manifest, nell'ordine in cui vengono scritte
+COLONNE_MANIFEST = (
+    "percorso_originale", "nuovo_percorso", "pagine", "denominazione", "numero_fattura",
+    "data_fattura", "origine", "pattern", "durata_ms", "stato", "errore",
+)
+
+# Esiti possibili di una riga del manifest
+ESITO_RINOMINATO = "rinominato"
+ESITO_NON_RICONOSCIUTO = "non_riconosciuto"
+ESITO_ERRORE = "errore"
+
+
+class ManifestLotto:
+    """
+    Raccoglie i risultati di un batch e li salva in formato tabellare.
+
+    Attributes:
+        inizio (datetime): Momento di avvio del batch, usato nel nome dei file
+    """
+
+    def __init__(self):
+        self.inizio = datetime.now()
+        self._colonne = {colonna: [] for colonna in COLONNE_MANIFEST}
+
+    def __len__(self):
+        return len(self._colonne["percorso_originale"])
+
+    def aggiungi(self, percorso_originale, stato, nuovo_percorso=None, denominazione=None, numero_fattura=None,
+                 data_fattura=None, origine=None, pattern=None, durata_ms=None, pagine=None, errore=None):
+        """
+        Registra il risultato dell'elaborazione di un documento.
+
+        Args:
+            percorso_originale (str): Percorso del documento elaborato
+            stato (str): Uno tra ESITO_RINOMINATO, ESITO_NON_RICONOSCIUTO, ESITO_ERRORE
+            nuovo_percorso (str, optional): Percorso del file salvato
+            denominazione, numero_fattura, data_fattura (str, optional): Dati estratti
+            origine (str, optional): Provenienza dei dati (vedi `estrai_info_da_file`)
+            pattern (str, optional): Espressione regolare che ha riconosciuto numero e data
+            durata_ms (float, optional): Tempo di elaborazione del documento in millisecondi,
+                escluse le attese dell'utente (dialog di conferma)
+            pagine (str, optional): Intervallo di pagine, per le fatture ottenute dalla divisione di un PDF
+            errore (str, optional): Descrizione dell'errore
+        """
+        valori = locals()
+        for colonna in COLONNE_MANIFEST:
+            self._colonne[colonna].append(valori[colonna])
+
+    def to_dataframe(self):
+        """
+        Restituisce il manifest come DataFrame pandas.
+
+        Returns:
+            pandas.DataFrame: Una riga per documento, con le colonne di COLONNE_MANIFEST
+        """
+        df = pd.DataFrame(self._colonne, columns=list(COLONNE_MANIFEST))
+        df["durata_ms"] = pd.to_numeric(df["durata_ms"]).round(1)
+        return df
+
+    def salva(self, cartella):
+        """
+        Scrive il manifest in CSV e, se possibile, in Parquet.
+
+        Args:
+            cartella (str): Cartella in cui creare i file
+
+        Returns:
+            list: Percorsi dei file scritti
+        """
+        os.makedirs(cartella, exist_ok=True)
+        base = os.path.join(cartella, f"manifest_{self.inizio.strftime('%Y%m%d_%H%M%S')}")
+        df = self.to_dataframe()
+
+        # utf-8-sig e ";" per l'apertura diretta in Excel con impostazioni italiane
+        scritti = [f"{base}.csv"]
+        df.to_csv(scritti[0], index=False, sep=";", encoding="utf-8-sig")
+
+        try:
+            df.to_parquet(f"{base}.parquet", index=False)
+            scritti.append(f"{base}.parquet")
+        except ImportError:
+            logging.warning("Nessun motore Parquet installato (pyarrow o fastparquet): manifest salvato solo in CSV")
+
+        logging.info("Manifest di %d documenti salvato: %s", len(df), ", ".join(scritti))
+        return scritti
@@ -0,0 +1,319 @@
+"""
+Spostamento dei file rinominati, anche tra volumi diversi.
+
+`os.rename` funziona solo all'interno dello stesso volume: se la cartella di
+destinazione è su un altro disco o su una condivisione di rete fallisce con
+EXDEV. In quel caso il file viene copiato in un file temporaneo ".part" accanto
+alla destinazione, con `copy_file_range` o `sendfile` quando disponibili (la
+copia avviene nel kernel, senza passare dalla memoria del processo), reso
+persistente con fsync e solo allora rinominato e rimosso dall'origine. Un'interruzione
+lascia quindi al più un file ".part", mai un file di destinazione incompleto.
+
+Su POSIX `os.rename` sostituisce silenziosamente un file esistente: le rinomine
+avvengono quindi con `os.link` seguito da `os.unlink` (o con renameat2 e
+RENAME_NOREPLACE dove i collegamenti non sono supportati), che falliscono con
+EEXIST se la destinazione è stata creata nel frattempo.
+"""
+
+import os
+import sys
+import errno
+import ctypes
+import shutil
+import logging
+import filecmp
+from concurrent.futures import ThreadPoolExecutor
+from config import get_impostazioni
+
+# Numero massimo di copie tra volumi diversi eseguite contemporaneamente
+MAX_COPIE_CONCORRENTI = get_impostazioni().max_copie_concorrenti
+
+# Byte copiati per ogni chiamata di sistema
+DIMENSIONE_BLOCCO_COPIA = 8 * 1024 * 1024
+
+# Suffisso del file temporaneo scritto durante la copia
+SUFFISSO_PARZIALE = ".part"
+
+
+def _volume(path):
+    """Restituisce il dispositivo del percorso o, se non esiste, della prima cartella esistente."""
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        genitore = os.path.dirname(path)
+        if genitore == path:
+            break
+        path = genitore
+    return os.stat(path).st_dev
+
+
+def stesso_volume(sorgente, destinazione):
+    """
+    Verifica se sorgente e destinazione si trovano sullo stesso volume.
+
+    Args:
+        sorgente (str): File da spostare
+        destinazione (str): Percorso di destinazione, anche non ancora esistente
+
+    Returns:
+        bool: True se basta `os.rename` per spostare il file
+    """
+    return _volume(sorgente) == _volume(os.path.dirname(os.path.abspath(destinazione)))
+
+
+# Flag di renameat2 che impedisce di sostituire la destinazione (Linux)
+RENAME_NOREPLACE = 1
+_AT_FDCWD = -100
+
+# Errori di os.link dovuti al file system che non supporta i collegamenti
+_ERRORI_LINK_NON_SUPPORTATO = (errno.EPERM, errno.ENOTSUP, errno.EOPNOTSUPP, errno.ENOSYS, errno.EMLINK)
+
+
+def _renameat2_senza_sostituire(sorgente, destinazione):
+    """
+    Rinomina con renameat2 e RENAME_NOREPLACE.
+
+    Returns:
+        bool: False se la chiamata non è disponibile nel sistema o nel file system
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        renameat2 = ctypes.CDLL(None, use_errno=True).renameat2
+    except (OSError, AttributeError):
+        return False
+    esito = renameat2(_AT_FDCWD, os.fsencode(sorgente), _AT_FDCWD, os.fsencode(destinazione),
+                      ctypes.c_uint(RENAME_NOREPLACE))
+    if esito == 0:
+        return True
+    codice = ctypes.get_errno()
+    if codice in (errno.ENOSYS, errno.EINVAL, errno.ENOTSUP):
+        return False
+    raise OSError(codice, os.strerror(codice), destinazione)
+
+
+def rinomina_senza_sostituire(sorgente, destinazione):
+    """
+    Rinomina un file senza mai sostituire una destinazione esistente.
+
+    Il controllo e la rinomina sono un'unica operazione atomica: un file creato
+    nella destinazione da un altro processo non viene sovrascritto.
+
+    Args:
+        sorgente (str): File da rinominare
+        destinazione (str): Nuovo percorso, sullo stesso volume
+
+    Raises:
+        FileExistsError: Se la destinazione esiste già
+        OSError: Se la rinomina non riesce (EXDEV se i percorsi sono su volumi diversi)
+    """
+    if os.name == "nt":
+        # Su Windows os.rename non sostituisce mai la destinazione
+        os.rename(sorgente, destinazione)
+        return
+    try:
+        os.link(sorgente, destinazione, follow_symlinks=False)
+    except FileExistsError:
+        raise
+    except OSError as e:
+        if e.errno not in _ERRORI_LINK_NON_SUPPORTATO:
+            raise
+        if _renameat2_senza_sostituire(sorgente, destinazione):
+            return
+        # Nessuna primitiva atomica disponibile: resta solo il controllo preventivo
+        if os.path.lexists(destinazione):
+            raise FileExistsError(errno.EEXIST, "Il file di destinazione esiste già", destinazione)
+        os.rename(sorgente, destinazione)
+        return
+    try:
+        os.unlink(sorgente)
+    except OSError:
+        os.unlink(destinazione)
+        raise
+
+
+def _copia_contenuto(fsrc, fdst):
+    """Copia il contenuto tra due file aperti, nel kernel quando possibile."""
+    in_fd, out_fd = fsrc.fileno(), fdst.fileno()
+    for funzione in ("copy_file_range", "sendfile"):
+        copia = getattr(os, funzione, None)
+        if copia is None:
+            continue
+        try:
+            while True:
+                if funzione == "copy_file_range":
+                    copiati = copia(in_fd, out_fd, DIMENSIONE_BLOCCO_COPIA)
+                else:
+                    copiati = copia(out_fd, in_fd, None, DIMENSIONE_BLOCCO_COPIA)
+                if copiati == 0:
+                    return
+        except OSError as e:
+            # File system o kernel che non supportano la chiamata: si riparte dall'inizio
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.ENOTSUP, errno.EBADF):
+                raise
+            fsrc.seek(0)
+            fdst.seek(0)
+            fdst.truncate()
+    shutil.copyfileobj(fsrc, fdst, DIMENSIONE_BLOCCO_COPIA)
+
+
+def _sincronizza_cartella(cartella):
+    """Rende persistenti le voci di una cartella (rinomine e nuovi file)."""
+    if os.name == "nt":
+        return
+    fd = os.open(cartella, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _copia_parziale(sorgente, destinazione):
+    """
+    Copia la sorgente nel file ".part" della destinazione e lo sincronizza su disco.
+
+    Returns:
+        str: Percorso del file ".part"
+    """
+    parziale = destinazione + SUFFISSO_PARZIALE
+    try:
+        # Un ".part" rimasto da un'interruzione precedente viene sovrascritto
+        with open(sorgente, "rb") as fsrc, open(parziale, "wb") as fdst:
+            _copia_contenuto(fsrc, fdst)
+            fdst.flush()
+            os.fsync(fdst.fileno())
+        shutil.copystat(sorgente, parziale)
+    except BaseException:
+        if os.path.exists(parziale):
+            os.remove(parziale)
+        raise
+    return parziale
+
+
+def _completa_spostamento(sorgente, destinazione, parziale):
+    """Rinomina il file ".part" nella destinazione; in caso di errore lo rimuove."""
+    try:
+        rinomina_senza_sostituire(parziale, destinazione)
+    except BaseException:
+        if os.path.exists(parziale):
+            os.remove(parziale)
+        raise
+
+
+def _rimuovi_origine(sorgente, destinazione):
+    """Rimuove l'origine dopo la copia; se non è possibile, la copia resta valida."""
+    try:
+        os.remove(sorgente)
+    except OSError as e:
+        logging.warning("File copiato in %s ma impossibile rimuovere l'origine %s: %s", destinazione, sorgente, e)
+
+
+def _spostamento_gia_completato(sorgente, destinazione):
+    """
+    Verifica se uno spostamento interrotto dopo la copia aveva già prodotto la destinazione.
+
+    Succede se il processo termina tra la rinomina del ".part" e la rimozione
+    dell'origine: i due file sono identici e basta rimuovere l'origine.
+    """
+    try:
+        return (os.path.getsize(sorgente) == os.path.getsize(destinazione)
+                and filecmp.cmp(sorgente, destinazione, shallow=False))
+    except OSError:
+        return False
+
+
+def sposta_file(sorgente, destinazione):
+    """
+    Sposta un file, copiandolo se la destinazione è su un altro volume.
+
+    Non sovrascrive mai un file esistente.
+
+    Args:
+        sorgente (str): File da spostare
+        destinazione (str): Percorso completo di destinazione
+
+    Raises:
+        FileExistsError: Se la destinazione esiste già
+        OSError: Se la copia o la rinomina non riescono; l'origine resta intatta
+    """
+    sposta_file_multipli([(sorgente, destinazione)], riconcilia=False, solleva=True)
+
+
+def sposta_file_multipli(coppie, max_copie=MAX_COPIE_CONCORRENTI, riconcilia=True, solleva=False):
+    """
+    Sposta più file, con al più `max_copie` copie tra volumi diversi in parallelo.
+
+    I file sullo stesso volume vengono rinominati subito. Quelli su un altro
+    volume vengono copiati e sincronizzati nei rispettivi ".part"; poi ogni
+    ".part" viene rinominato, ogni cartella di destinazione viene sincronizzata
+    una sola volta e solo allora le origini vengono rimosse. Se una copia
+    fallisce, il suo ".part" viene rimosso e l'origine resta al suo posto.
+
+    Args:
+        coppie (list): Coppie (sorgente, destinazione)
+        max_copie (int): Numero massimo di copie contemporanee
+        riconcilia (bool): Se True, una destinazione identica all'origine viene considerata
+            uno spostamento interrotto dopo la copia e l'origine viene rimossa
+        solleva (bool): Se True, il primo errore viene sollevato invece di essere restituito
+
+    Returns:
+        list: Un errore (str) o None per ogni coppia, nello stesso ordine
+    """
+    errori = [None] * len(coppie)
+    tra_volumi = []
+
+    for indice, (sorgente, destinazione) in enumerate(coppie):
+        try:
+            if os.path.exists(destinazione):
+                if riconcilia and _spostamento_gia_completato(sorgente, destinazione):
+                    logging.info("Spostamento già completato in precedenza, rimuovo l'origine: %s", sorgente)
+                    _rimuovi_origine(sorgente, destinazione)
+                    continue
+                raise FileExistsError(errno.EEXIST, "Il file di destinazione esiste già", destinazione)
+            if stesso_volume(sorgente, destinazione):
+                try:
+                    rinomina_senza_sostituire(sorgente, destinazione)
+                    continue
+                except OSError as e:
+                    if e.errno != errno.EXDEV:
+                        raise
+            tra_volumi.append(indice)
+        except OSError as e:
+            if solleva:
+                raise
+            errori[indice] = str(e)
+
+    if not tra_volumi:
+        return errori
+    logging.info("%d file da copiare su un altro volume", len(tra_volumi))
+
+    # Copia: le chiamate di sistema rilasciano il GIL, i thread bastano
+    parziali = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_copie)) as pool:
+        futuri = {indice: pool.submit(_copia_parziale, *coppie[indice]) for indice in tra_volumi}
+    for indice, futuro in futuri.items():
+        try:
+            parziali[indice] = futuro.result()
+        except OSError as e:
+            if solleva:
+                raise
+            errori[indice] = str(e)
+            logging.error("Errore nella copia di %s: %s", coppie[indice][0], e)
+
+    # Completamento: rinomina dei ".part" e una sola sincronizzazione per cartella
+    completati = []
+    for indice, parziale in parziali.items():
+        sorgente, destinazione = coppie[indice]
+        try:
+            _completa_spostamento(sorgente, destinazione, parziale)
+            completati.append(indice)
+        except OSError as e:
+            if solleva:
+                raise
+            errori[indice] = str(e)
+    for cartella in {os.path.dirname(os.path.abspath(coppie[indice][1])) for indice in completati}:
+        _sincronizza_cartella(cartella)
+
+    # Solo ora che le copie sono persistenti le origini possono essere rimosse
+    for indice in completati:
+        _rimuovi_origine(*coppie[indice])
+    return errori
@@ -0,0 +1,173 @@
+"""
+Misura dei tempi del database dei pattern con molti fornitori.
+
+Genera in una cartella temporanea un database sintetico con il numero di
+fornitori indicato (ognuno con i propri pattern, campioni e impronte) e misura
+le operazioni che l'applicazione esegue più spesso: apertura del database,
+ricerca esatta del fornitore, suggerimento per somiglianza, lettura dei pattern e dei
+campioni, salvataggio di un campione e di un'impronta, elenco filtrato e prima
+pagina del gestore dei pattern.
+
+Con --formato-precedente il database viene generato con i campioni nel file
+principale, come nelle versioni precedenti: l'apertura include allora la
+migrazione dei campioni nei file separati.
+
+Uso da riga di comando:
+    python src/pattern_benchmark.py [--fornitori 10000] [--campioni 10] [--formato-precedente]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+import tempfile
+from collections import defaultdict
+from pattern_db import PatternDatabase
+
+# Forme giuridiche e parole usate per comporre i nomi sintetici
+_FORME = ("SRL", "S.R.L.", "SPA", "S.p.A.", "SNC", "SAS")
+_PAROLE = ("ALFA", "BETA", "GAMMA", "DELTA", "NORD", "SUD", "TESSILE", "MODA", "SERVIZI", "COMMERCIALE",
+           "ITALIA", "GLOBAL", "TRASPORTI", "LOGISTICA", "IMPIANTI", "FORNITURE", "CALZATURE", "PELLETTERIA")
+
+
+def _nome_fornitore(indice, rng):
+    """Genera un nome di fornitore univoco e realistico."""
+    return f"{rng.choice(_PAROLE)} {rng.choice(_PAROLE)} {indice:05d} {rng.choice(_FORME)}"
+
+
+def genera_database(cartella, fornitori, campioni, formato_precedente=False, seme=0):
+    """
+    Scrive un database sintetico nella cartella.
+
+    Args:
+        cartella (str): Cartella in cui creare patterns.json (e i campioni)
+        fornitori (int): Numero di fornitori
+        campioni (int): Campioni di testo per fornitore
+        formato_precedente (bool): Se True, i campioni restano nel file principale
+        seme (int): Seme del generatore casuale
+
+    Returns:
+        tuple: (percorso di patterns.json, lista dei nomi dei fornitori)
+    """
+    rng = random.Random(seme)
+    percorso = os.path.join(cartella, "patterns.json")
+    nomi = [_nome_fornitore(i, rng) for i in range(fornitori)]
+    dati = {
+        "globali": {"denominazione": [], "numero_data": []},
+        "fornitori": {},
+        "pattern_segnalati": {},
+        "impronte": {},
+        "alias_fornitori": {},
+        "last_updated": "",
+    }
+    tutti_campioni = {}
+    for i, nome in enumerate(nomi):
+        dati["fornitori"][nome] = {
+            "numero_data": rf"FATTURA\s+N\.\s*(\d+)\s+DEL\s+(\d{{2}}/\d{{2}}/\d{{4}})\s+F{i}",
+        }
+        dati["impronte"][f"{i:016x}"] = {"denominazione": nome, "numero_data": dati["fornitori"][nome]["numero_data"]}
+        testo = " ".join(rng.choice(_PAROLE) for _ in range(250))[:2000]
+        tutti_campioni[nome] = [
+            {"testo": testo, "numero": str(n), "data": "01/02/2025"} for n in range(campioni)
+        ]
+
+    if formato_precedente:
+        dati["campioni"] = tutti_campioni
+    with open(percorso, 'w', encoding='utf-8') as f:
+        json.dump(dati, f, indent=4, ensure_ascii=False)
+
+    if not formato_precedente:
+        # I file dei campioni vengono scritti direttamente, un fornitore alla volta sarebbe troppo lento
+        db = PatternDatabase(percorso, sola_lettura=True)
+        per_file = defaultdict(dict)
+        for nome, lista in tutti_campioni.items():
+            per_file[db._percorso_campioni(nome)][nome] = lista
+        os.makedirs(db.cartella_campioni, exist_ok=True)
+        for file_campioni, contenuto in per_file.items():
+            with open(file_campioni, 'w', encoding='utf-8') as f:
+                json.dump({"campioni": contenuto}, f, ensure_ascii=False)
+    return percorso, nomi
+
+
+def _misura(risultati, descrizione, funzione, ripetizioni=1, operazioni=1):
+    """Esegue la funzione e registra il tempo medio di un'operazione in millisecondi."""
+    inizio = time.perf_counter()
+    for _ in range(ripetizioni):
+        valore = funzione()
+    risultati.append((descrizione, (time.perf_counter() - inizio) * 1000 / (ripetizioni * operazioni)))
+    return valore
+
+
+def esegui_benchmark(fornitori=10000, campioni=10, formato_precedente=False):
+    """
+    Genera un database sintetico e misura le operazioni principali.
+
+    Args:
+        fornitori (int): Numero di fornitori
+        campioni (int): Campioni di testo per fornitore
+        formato_precedente (bool): Se True, misura anche la migrazione dei campioni
+
+    Returns:
+        list: Coppie (descrizione, millisecondi)
+    """
+    cartella = tempfile.mkdtemp(prefix="pattern_benchmark_")
+    risultati = []
+    try:
+        percorso, nomi = genera_database(cartella, fornitori, campioni, formato_precedente)
+        risultati.append(("dimensione patterns.json (MB)", os.path.getsize(percorso) / 1024 / 1024))
+        rng = random.Random(1)
+        campione = rng.sample(nomi, min(100, len(nomi)))
+
+        db = _misura(risultati, "apertura del database", lambda: PatternDatabase(percorso))
+        risultati.append(("dimensione patterns.json dopo l'apertura (MB)", os.path.getsize(percorso) / 1024 / 1024))
+        _misura(risultati, "costruzione dell'indice dei fornitori", lambda: db.risolvi_fornitore(nomi[0].lower()))
+        _misura(risultati, "ricerca esatta (media)",
+                lambda: [db.risolvi_fornitore(nome.lower()) for nome in campione], operazioni=len(campione))
+        _misura(risultati, "suggerimento per somiglianza (media)",
+                lambda: [db.suggerisci_fornitore(nome[:-1] + "X") for nome in campione], operazioni=len(campione))
+        _misura(risultati, "pattern di un fornitore", lambda: db.get_fornitore_patterns(campione[0]), 100)
+        _misura(risultati, "campioni di un fornitore (prima lettura)", lambda: db.get_campioni(campione[1]))
+        _misura(risultati, "campioni di un fornitore (in memoria)", lambda: db.get_campioni(campione[1]), 100)
+        _misura(risultati, "salvataggio di un campione",
+                lambda: db.add_campione(campione[2], "FATTURA N. 999 DEL 01/02/2025", "999", "01/02/2025"))
+        _misura(risultati, "salvataggio di un'impronta",
+                lambda: db.registra_impronta("f" * 16, campione[3], confermata=True))
+        _misura(risultati, "elenco ordinato dei fornitori", db.elenca_fornitori)
+        _misura(risultati, "elenco filtrato dei fornitori", lambda: db.elenca_fornitori("moda 0"), 10)
+
+        try:
+            from pattern_model import PatternFornitoriModel
+        except ImportError:
+            logging.warning("PyQt6 non disponibile: il modello del gestore dei pattern non viene misurato")
+        else:
+            modello = _misura(risultati, "prima pagina del gestore dei pattern", lambda: PatternFornitoriModel(db))
+            _misura(risultati, "cambio di pagina del gestore", lambda: modello.vai_a_pagina(modello.pagina + 1), 10)
+            _misura(risultati, "filtro del gestore", lambda: modello.imposta_filtro("TESSILE"), 10)
+    finally:
+        shutil.rmtree(cartella, ignore_errors=True)
+    return risultati
+
+
+def main():
+    """Esegue il benchmark dalla riga di comando e stampa i tempi."""
+    parser = argparse.ArgumentParser(description="Tempi del database dei pattern con molti fornitori")
+    parser.add_argument("--fornitori", type=int, default=10000, help="Numero di fornitori (predefinito: 10000)")
+    parser.add_argument("--campioni", type=int, default=10, help="Campioni per fornitore (predefinito: 10)")
+    parser.add_argument("--formato-precedente", action="store_true",
+                        help="Genera i campioni nel file principale e misura la migrazione")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s - %(message)s')
+    print(f"Database sintetico: {args.fornitori} fornitori, {args.campioni} campioni ciascuno")
+    for descrizione, valore in esegui_benchmark(args.fornitori, args.campioni, args.formato_precedente):
+        unita = "" if descrizione.endswith("(MB)") else " ms"
+        print(f"  {descrizione:<56} {valore:10.2f}{unita}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,79 +1,812 @@
 import json
 import os
+import re
+import atexit
+import hashlib
 import logging
+import tempfile
+import threading
 from datetime import datetime
+from filelock import FileLock, Timeout
+from supplier_index import IndiceFornitori, chiave_fornitore
+from config import get_impostazioni
+
+try:
+    # Parser delle espressioni regolari della libreria standard (Python 3.11+)
+    from re import _parser as _sre_parse
+except ImportError:
+    import sre_parse as _sre_parse
+
+# Numero massimo di campioni di testo conservati per ogni fornitore
+MAX_CAMPIONI_FORNITORE = 10
+
+# Caratteri di contesto conservati prima e dopo i valori confermati in un campione
+CONTESTO_CAMPIONE = 2000
+
+# Tempo massimo (in secondi) di attesa del lock sul file condiviso dei pattern
+LOCK_TIMEOUT = 10
+
+# Secondi entro cui le modifiche apprese automaticamente (es. impronte) vengono salvate tutte insieme
+INTERVALLO_SALVATAGGIO = get_impostazioni().intervallo_salvataggio_pattern
+
+# Numero di file in cui vengono suddivisi i campioni dei fornitori
+NUMERO_FILE_CAMPIONI = 256
+
+# Lunghezza minima di un letterale obbligatorio perché valga la pena cercarlo prima della regex
+MIN_LUNGHEZZA_LETTERALE = 3
+
+# Ripetizioni il cui contenuto può comparire anche una sola volta
+_RIPETIZIONI = tuple(
+    getattr(_sre_parse, nome) for nome in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT") if hasattr(_sre_parse, nome)
+)
+
+
+def _scrivi_json(percorso, dati):
+    """Scrive un file JSON in modo atomico: i lettori vedono il file vecchio o quello nuovo."""
+    cartella = os.path.dirname(percorso)
+    fd, percorso_tmp = tempfile.mkstemp(prefix=".patterns_", suffix=".tmp", dir=cartella)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(dati, f, indent=4, ensure_ascii=False)
+        os.replace(percorso_tmp, percorso)
+    except Exception:
+        if os.path.exists(percorso_tmp):
+            os.remove(percorso_tmp)
+        raise
+
+
+def _firma_file(percorso):
+    """Restituisce (mtime in nanosecondi, dimensione) del file, oppure None se non esiste."""
+    try:
+        stat = os.stat(percorso)
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+
+def _raccogli_letterali(sequenza, letterali):
+    """Aggiunge a `letterali` le sequenze di caratteri obbligatorie di un ramo dell'albero della regex."""
+    corrente = []
+    for operazione, argomento in sequenza:
+        if operazione is _sre_parse.LITERAL:
+            corrente.append(chr(argomento))
+            continue
+        # Qualsiasi altro elemento interrompe la sequenza contigua di caratteri
+        if corrente:
+            letterali.append("".join(corrente))
+            corrente = []
+        if operazione is _sre_parse.SUBPATTERN:
+            _, flag_aggiunti, _, contenuto = argomento
+            if not flag_aggiunti & re.IGNORECASE:
+                _raccogli_letterali(contenuto, letterali)
+        elif operazione in _RIPETIZIONI and argomento[0] >= 1:
+            _raccogli_letterali(argomento[2], letterali)
+        elif operazione is getattr(_sre_parse, "ATOMIC_GROUP", None):
+            _raccogli_letterali(argomento, letterali)
+        elif operazione is _sre_parse.ASSERT:
+            # Anche un lookahead o lookbehind positivo richiede il testo nel documento
+            _raccogli_letterali(argomento[1], letterali)
+        # Alternative, ripetizioni facoltative e lookaround negativi non garantiscono nulla
+    if corrente:
+        letterali.append("".join(corrente))
+
+
+def letterali_obbligatori(regex):
+    """
+    Estrae le sequenze di caratteri presenti in ogni testo in cui la regex trova una corrispondenza.
+
+    Ad esempio per "Fattura N\\. (\\d+) del (\\S+)" restituisce ["Fattura N. ", " del "].
+    Le regex che ignorano maiuscole e minuscole non hanno letterali obbligatori.
+
+    Args:
+        regex (re.Pattern): Espressione compilata
+
+    Returns:
+        list: Sequenze di caratteri obbligatorie, nell'ordine in cui compaiono nella regex
+    """
+    if not _PARSER_VERIFICATO or not isinstance(regex.pattern, str) or regex.flags & re.IGNORECASE:
+        return []
+    return _estrai_letterali(regex)
+
+
+def _estrai_letterali(regex):
+    """Estrae i letterali obbligatori dall'albero del parser interno, senza controlli preliminari."""
+    letterali = []
+    try:
+        _raccogli_letterali(_sre_parse.parse(regex.pattern, regex.flags), letterali)
+    except Exception:
+        # Parser interno della libreria standard: in caso di dubbio nessun filtro
+        return []
+    return letterali
+
+
+# Regex di riferimento con un testo in cui trovano corrispondenza, per verificare all'avvio
+# che la struttura dell'albero del parser interno sia quella attesa
+_CASI_VERIFICA_PARSER = (
+    (r"Fattura N\. (\d+) del (\S+)", "Fattura N. 12 del 01/02/2025"),
+    (r"(?:Rif)+ Ordine{1,2}:? (\w+)", "RifRif Ordinee AB1"),
+    (r"(?=Totale)Tot(?:ale)? (\d+)", "Totale 5"),
+    (r"(?i:fattura) Numero (\d+)", "FATTURA Numero 7"),
+    (r"Cliente|Fornitore: (.+)", "Fornitore: ACME"),
+    (r"Da(?!ta)\w+ (\d+)", "Dal 5"),
+    (r"(?>Documento)\s*n\.?+ (\d++)", "Documento n 42"),
+)
+
+
+def _verifica_parser():
+    """
+    Verifica l'estrazione dei letterali sulle regex di riferimento.
+
+    `re._parser` non è un'API pubblica e la struttura dei suoi nodi cambia
+    tra le versioni di Python: se anche un solo letterale estratto non compare
+    nel testo in cui la regex corrisponde, il filtro dei letterali viene
+    disattivato (le regex vengono comunque eseguite tutte).
+
+    Returns:
+        bool: True se l'estrazione dei letterali è affidabile
+    """
+    verificati = 0
+    for pattern, testo in _CASI_VERIFICA_PARSER:
+        try:
+            regex = re.compile(pattern)
+        except re.error:
+            # Sintassi non disponibile in questa versione di Python (es. gruppi atomici prima della 3.11)
+            continue
+        if regex.search(testo) is None:
+            continue
+        letterali = _estrai_letterali(regex)
+        if not all(letterale in testo for letterale in letterali):
+            logging.warning("Filtro dei letterali disattivato: risultato inatteso del parser delle regex per %s: %s",
+                            pattern, letterali)
+            return False
+        verificati += 1
+    # Il primo caso ha sempre letterali: se non ne vengono trovati, il parser non è quello atteso
+    if not verificati or not _estrai_letterali(re.compile(_CASI_VERIFICA_PARSER[0][0])):
+        logging.warning("Filtro dei letterali disattivato: parser delle regex non riconosciuto")
+        return False
+    return True
+
+
+_PARSER_VERIFICATO = _verifica_parser()
+
+
+class PatternCompilato:
+    """
+    Pattern regex già compilato e pronto per l'uso.
+
+    Attributes:
+        pattern (str): Espressione regolare originale
+        regex (re.Pattern): Espressione compilata
+        letterali (tuple): Sequenze di caratteri obbligatorie (vedi `letterali_obbligatori`)
+            di almeno MIN_LUNGHEZZA_LETTERALE caratteri, dalla più lunga
+    """
+    __slots__ = ("pattern", "regex", "letterali")
+
+    def __init__(self, pattern, regex):
+        self.pattern = pattern
+        self.regex = regex
+        self.letterali = tuple(sorted(
+            {l for l in letterali_obbligatori(regex) if len(l) >= MIN_LUNGHEZZA_LETTERALE}, key=len, reverse=True
+        ))
+
+    def puo_corrispondere(self, testo):
+        """
+        Verifica con semplici ricerche di sottostringhe se la regex può corrispondere al testo.
+
+        Se manca anche un solo letterale obbligatorio la regex non può trovare
+        nulla e non serve eseguirla; True non garantisce una corrispondenza.
+
+        Args:
+            testo (str): Testo del documento
+
+        Returns:
+            bool: False se la regex non può corrispondere al testo
+        """
+        return all(letterale in testo for letterale in self.letterali)
+
 
 class PatternDatabase:
     """
     Gestisce un database di pattern di estrazione per migliorare il riconoscimento
     delle informazioni nei PDF nel tempo.
+
+    Il file viene ricaricato automaticamente quando cambia su disco e i pattern
+    compilati vengono mantenuti in cache, ricompilando solo quelli nuovi.
+
+    Più istanze dell'applicazione possono condividere lo stesso file: ogni
+    salvataggio avviene sotto lock e rilegge il file per unire le modifiche
+    locali a quelle salvate nel frattempo dalle altre istanze.
+
+    I campioni di testo dei fornitori, che occupano quasi tutto lo spazio, non
+    stanno nel file principale ma in NUMERO_FILE_CAMPIONI file nella cartella
+    "campioni" accanto ad esso, scelti in base alla chiave del fornitore: vengono
+    letti solo quando servono e ogni salvataggio riscrive un solo file piccolo.
     """
-    def __init__(self):
-        self.db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'patterns.json')
+    def __init__(self, db_path=None, sola_lettura=False):
+        """
+        Args:
+            db_path (str, optional): File JSON dei pattern; predefinito patterns.json nella cartella dei dati
+            sola_lettura (bool, optional): Se True, le modifiche (pattern appresi, impronte, alias)
+                vengono ignorate: il database resta identico al file, ad esempio per confrontare
+                due versioni dei pattern (vedi `evaluation`)
+        """
+        self.db_path = db_path or os.path.join(get_impostazioni().cartella_dati, 'patterns.json')
+        self.sola_lettura = sola_lettura
+        self.cartella_campioni = os.path.join(os.path.dirname(self.db_path), 'campioni')
+        self._cache_campioni = {}
+        self._campioni_in_attesa = []
+        self._nomi_ordinati = None
+        self._firma = None
+        self._modifiche = []
+        self._listeners = []
+        self._compilati = {}
+        self._liste_compilate = {}
+        self._indice_fornitori = None
+        self._timeout_pattern = {}
+        self._timer_salvataggio = None
+        self._lock = threading.RLock()
         self.patterns = self._load_patterns()
-        
+        self._completa_sezioni()
+        self._migra_campioni()
+
+    def _completa_sezioni(self):
+        """Aggiunge le sezioni introdotte nelle versioni successive ai database esistenti."""
+        self.patterns.setdefault("fornitori", {})
+        self.patterns.setdefault("regex_patterns", {})
+        self.patterns.setdefault("pattern_segnalati", {})
+        self.patterns.setdefault("impronte", {})
+        self.patterns.setdefault("alias_fornitori", {})
+        # Il contenuto è cambiato: l'indice dei fornitori va ricostruito
+        self._indice_fornitori = None
+        self._nomi_ordinati = None
+
+    def _migra_campioni(self):
+        """Sposta i campioni dei database delle versioni precedenti nei file dei campioni."""
+        campioni = self.patterns.get("campioni")
+        if self.sola_lettura or not campioni:
+            return
+        totale = sum(len(lista) for lista in campioni.values())
+        logging.info("Spostamento di %d campioni di %d fornitori in %s", totale, len(campioni), self.cartella_campioni)
+        if self._salva_campioni([(nome, c) for nome, lista in campioni.items() for c in lista]):
+            self._registra_modifica(("campioni_migrati",))
+
+    def _leggi_firma(self):
+        """
+        Restituisce la firma del file su disco usata per rilevare le modifiche.
+
+        Returns:
+            tuple: (mtime in nanosecondi, dimensione) oppure None se il file non esiste
+        """
+        return _firma_file(self.db_path)
+
+    def _leggi_file(self):
+        """Legge il file JSON aggiornando la firma; le eccezioni vengono propagate."""
+        self._firma = self._leggi_firma()
+        with open(self.db_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
     def _load_patterns(self):
         """Carica i pattern dal file JSON."""
         try:
             os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
             if os.path.exists(self.db_path):
-                with open(self.db_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                return self._leggi_file()
             return {
                 "fornitori": {},
                 "regex_patterns": {
                     "denominazione": [r"Denominazione:\s*(.+)"],
                     "numero_data": [r"([A-Z0-9/\-]+)\s+(\d{2}-\d{2}-\d{4})"]
                 },
+                "pattern_segnalati": {},
+                "impronte": {},
+                "alias_fornitori": {},
                 "last_updated": datetime.now().isoformat()
             }
         except Exception as e:
-            logging.error(f"Errore nel caricamento del database dei pattern: {str(e)}")
+            logging.error("Errore nel caricamento del database dei pattern: %s", e)
             return {
                 "fornitori": {},
                 "regex_patterns": {
                     "denominazione": [r"Denominazione:\s*(.+)"],
                     "numero_data": [r"([A-Z0-9/\-]+)\s+(\d{2}-\d{2}-\d{4})"]
                 },
+                "pattern_segnalati": {},
+                "impronte": {},
+                "alias_fornitori": {},
                 "last_updated": datetime.now().isoformat()
             }
     
+    def ricarica_se_modificato(self):
+        """
+        Ricarica il database se il file su disco è stato modificato da un altro processo.
+
+        Il controllo costa un solo `os.stat`, quindi può essere eseguito prima di ogni file.
+
+        Returns:
+            bool: True se il database è stato ricaricato
+        """
+        with self._lock:
+            firma = self._leggi_firma()
+            if firma is None or firma == self._firma:
+                return False
+            logging.info("Database dei pattern modificato su disco, ricaricamento: %s", self.db_path)
+            self.patterns = self._load_patterns()
+            self._completa_sezioni()
+            # Le modifiche locali non ancora salvate restano valide
+            for modifica in self._modifiche:
+                self._applica_modifica(self.patterns, modifica)
+            self._liste_compilate.clear()
+        self._notifica("ricaricato")
+        return True
+
+    def aggiungi_listener(self, callback):
+        """
+        Registra una funzione chiamata a ogni modifica del database.
+
+        Args:
+            callback (callable): Funzione con firma `callback(evento, dettagli)`, dove
+                evento è una stringa (es. "pattern_aggiunto", "ricaricato") e
+                dettagli un dizionario
+        """
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+
+    def rimuovi_listener(self, callback):
+        """
+        Rimuove una funzione registrata con `aggiungi_listener`.
+
+        Args:
+            callback (callable): Funzione da rimuovere
+        """
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notifica(self, evento, **dettagli):
+        """Notifica una modifica a tutti i listener registrati."""
+        for callback in list(self._listeners):
+            try:
+                callback(evento, dettagli)
+            except Exception as e:
+                logging.error("Errore nel listener del database dei pattern: %s", e)
+
+    def _compila(self, pattern):
+        """
+        Restituisce il pattern compilato, compilandolo solo alla prima richiesta.
+
+        I pattern non validi vengono segnalati e restituiti come None.
+        """
+        compilato = self._compilati.get(pattern)
+        if compilato is None and pattern not in self._compilati:
+            try:
+                compilato = PatternCompilato(pattern, re.compile(pattern))
+            except re.error as e:
+                logging.error("Pattern non valido %s: %s", pattern, e)
+                self.segnala_pattern(pattern, "non valido")
+            self._compilati[pattern] = compilato
+        return compilato
+
+    def get_pattern_compilato(self, pattern):
+        """
+        Restituisce un pattern compilato, compilandolo solo alla prima richiesta.
+
+        Args:
+            pattern (str): Espressione regolare, anche non presente tra i pattern globali
+
+        Returns:
+            PatternCompilato: Pattern compilato, oppure None se non è un'espressione valida
+        """
+        with self._lock:
+            return self._compila(pattern)
+
+    def get_pattern_compilati(self, pattern_type):
+        """
+        Ottiene i pattern globali compilati di un tipo, esclusi quelli segnalati.
+
+        La lista viene ricostruita solo dopo una modifica; la compilazione avviene
+        una sola volta per ogni pattern, anche dopo un ricaricamento del file.
+
+        Args:
+            pattern_type (str): Tipo di pattern (es. "denominazione", "numero_data")
+
+        Returns:
+            list: Lista di PatternCompilato nell'ordine del database
+        """
+        with self._lock:
+            lista = self._liste_compilate.get(pattern_type)
+            if lista is None:
+                lista = []
+                for pattern in self.get_global_patterns(pattern_type):
+                    compilato = self._compila(pattern)
+                    if compilato is not None and not self.is_pattern_segnalato(pattern):
+                        lista.append(compilato)
+                self._liste_compilate[pattern_type] = lista
+            return lista
+
+    def _applica_modifica(self, dati, modifica):
+        """
+        Applica una modifica al dizionario dei pattern in modo idempotente.
+
+        Le stesse modifiche vengono riapplicate sul contenuto del file al momento
+        del salvataggio, così da non perdere quelle delle altre istanze.
+
+        Args:
+            dati (dict): Contenuto del database da modificare
+            modifica (tuple): Tipo di modifica seguito dai suoi argomenti
+        """
+        tipo = modifica[0]
+        if tipo == "fornitore":
+            _, denominazione, pattern_info = modifica
+            dati["fornitori"].setdefault(denominazione, {}).update(pattern_info)
+        elif tipo == "globale":
+            _, pattern_type, regex = modifica
+            lista = dati["regex_patterns"].setdefault(pattern_type, [])
+            if regex not in lista:
+                lista.append(regex)
+        elif tipo == "segnalato":
+            _, regex, info = modifica
+            dati["pattern_segnalati"].setdefault(regex, info)
+        elif tipo == "campione":
+            _, denominazione, campione = modifica
+            campioni = dati["campioni"].setdefault(denominazione, [])
+            if campione not in campioni:
+                campioni.append(campione)
+            del campioni[:-MAX_CAMPIONI_FORNITORE]
+        elif tipo == "impronta":
+            _, impronta, voce = modifica
+            dati["impronte"][impronta] = voce
+        elif tipo == "alias":
+            _, chiave, denominazione = modifica
+            dati["alias_fornitori"].setdefault(chiave, denominazione)
+        elif tipo == "campioni_migrati":
+            dati.pop("campioni", None)
+
+    def _registra_modifica(self, modifica, differita=False):
+        """
+        Applica una modifica in memoria e la salva unendola al file condiviso.
+
+        Le modifiche differite (apprese automaticamente a ogni documento) non
+        riscrivono subito il file: vengono salvate tutte insieme entro
+        INTERVALLO_SALVATAGGIO secondi o con `salva_modifiche_in_attesa`.
+        """
+        if self.sola_lettura:
+            logging.debug("Database dei pattern in sola lettura, modifica ignorata: %s", modifica[0])
+            return
+        with self._lock:
+            self._applica_modifica(self.patterns, modifica)
+            if modifica[0] in ("fornitore", "alias"):
+                self._indice_fornitori = None
+                self._nomi_ordinati = None
+            self._modifiche.append(modifica)
+            if not differita:
+                self.save_patterns()
+            elif self._timer_salvataggio is None:
+                self._timer_salvataggio = threading.Timer(INTERVALLO_SALVATAGGIO, self.salva_modifiche_in_attesa)
+                self._timer_salvataggio.daemon = True
+                self._timer_salvataggio.start()
+
+    def salva_modifiche_in_attesa(self):
+        """
+        Salva le modifiche differite non ancora scritte nel file condiviso.
+
+        Va chiamata prima di terminare un processo che ha estratto dei documenti;
+        se il file è bloccato il salvataggio viene riprogrammato.
+        """
+        with self._lock:
+            if self._timer_salvataggio is not None:
+                self._timer_salvataggio.cancel()
+                self._timer_salvataggio = None
+            if not self._modifiche:
+                return
+            logging.debug("Salvataggio di %d modifiche in attesa del database dei pattern", len(self._modifiche))
+            self.save_patterns()
+            if self._modifiche:
+                self._timer_salvataggio = threading.Timer(INTERVALLO_SALVATAGGIO, self.salva_modifiche_in_attesa)
+                self._timer_salvataggio.daemon = True
+                self._timer_salvataggio.start()
+
+    def _scrivi_file(self, dati):
+        """Scrive il database in modo atomico: i lettori vedono il file vecchio o quello nuovo."""
+        _scrivi_json(self.db_path, dati)
+
+    def _percorso_campioni(self, denominazione):
+        """Restituisce il file dei campioni che contiene il fornitore."""
+        chiave = chiave_fornitore(denominazione) or denominazione
+        numero = int(hashlib.sha1(chiave.encode("utf-8")).hexdigest()[:8], 16) % NUMERO_FILE_CAMPIONI
+        return os.path.join(self.cartella_campioni, f"{numero:03d}.json")
+
+    def _leggi_campioni(self, percorso):
+        """
+        Legge un file dei campioni, riusando la copia in memoria se il file non è cambiato.
+
+        Returns:
+            dict: Contenuto del file, con la sezione "campioni" (vuota se il file non esiste)
+        """
+        firma = _firma_file(percorso)
+        if firma is None:
+            return {"campioni": {}}
+        voce = self._cache_campioni.get(percorso)
+        if voce is not None and voce[0] == firma:
+            return voce[1]
+        with open(percorso, 'r', encoding='utf-8') as f:
+            dati = json.load(f)
+        dati.setdefault("campioni", {})
+        self._cache_campioni[percorso] = (firma, dati)
+        return dati
+
+    def _salva_campioni(self, nuovi):
+        """
+        Aggiunge campioni ai rispettivi file, ciascuno sotto il proprio lock.
+
+        Ogni file viene riletto sotto lock prima della scrittura, così i campioni
+        salvati nel frattempo da altre istanze non vanno persi. Se un lock non è
+        disponibile, i campioni restano in attesa del salvataggio successivo.
+
+        Args:
+            nuovi (list): Coppie (fornitore, campione)
+
+        Returns:
+            bool: True se tutti i campioni (compresi quelli in attesa) sono stati salvati
+        """
+        with self._lock:
+            per_file = {}
+            for denominazione, campione in self._campioni_in_attesa + list(nuovi):
+                per_file.setdefault(self._percorso_campioni(denominazione), []).append((denominazione, campione))
+            self._campioni_in_attesa = []
+            os.makedirs(self.cartella_campioni, exist_ok=True)
+
+            for percorso, voci in per_file.items():
+                try:
+                    with FileLock(percorso + ".lock", timeout=LOCK_TIMEOUT):
+                        # Copia: la versione in cache resta valida se la scrittura fallisce
+                        dati = json.loads(json.dumps(self._leggi_campioni(percorso)))
+                        for denominazione, campione in voci:
+                            self._applica_modifica(dati, ("campione", denominazione, campione))
+                        dati["last_updated"] = datetime.now().isoformat()
+                        _scrivi_json(percorso, dati)
+                        self._cache_campioni[percorso] = (_firma_file(percorso), dati)
+                except Timeout:
+                    logging.error("File dei campioni bloccato da un'altra istanza, salvataggio rimandato: %s", percorso)
+                    self._campioni_in_attesa.extend(voci)
+                except Exception as e:
+                    logging.error("Errore nel salvataggio dei campioni %s: %s", percorso, e)
+                    self._campioni_in_attesa.extend(voci)
+            return not self._campioni_in_attesa
+
     def save_patterns(self):
-        """Salva i pattern nel file JSON."""
+        """
+        Salva i pattern nel file JSON.
+
+        Sotto lock, se il file è stato modificato da un'altra istanza viene riletto
+        e le modifiche locali vengono riapplicate prima della scrittura.
+        Se il lock non è disponibile le modifiche restano in attesa del salvataggio successivo.
+        """
         try:
-            self.patterns["last_updated"] = datetime.now().isoformat()
-            with open(self.db_path, 'w', encoding='utf-8') as f:
-                json.dump(self.patterns, f, indent=4, ensure_ascii=False)
-            logging.info(f"Database dei pattern salvato con successo: {self.db_path}")
+            with self._lock, FileLock(self.db_path + ".lock", timeout=LOCK_TIMEOUT):
+                if self._leggi_firma() not in (None, self._firma):
+                    # Se il file non è leggibile l'eccezione interrompe il salvataggio senza sovrascriverlo
+                    self.patterns = self._leggi_file()
+                    self._completa_sezioni()
+                    for modifica in self._modifiche:
+                        self._applica_modifica(self.patterns, modifica)
+                    self._liste_compilate.clear()
+                    logging.info("Modifiche di altre istanze unite al database dei pattern")
+
+                self.patterns["last_updated"] = datetime.now().isoformat()
+                self._scrivi_file(self.patterns)
+                self._firma = self._leggi_firma()
+                self._modifiche.clear()
+            logging.info("Database dei pattern salvato con successo: %s", self.db_path)
+        except Timeout:
+            logging.error("Database dei pattern bloccato da un'altra istanza, salvataggio rimandato: %s", self.db_path)
         except Exception as e:
-            logging.error(f"Errore nel salvataggio del database dei pattern: {str(e)}")
-    
+            logging.error("Errore nel salvataggio del database dei pattern: %s", e)
+
+    def _trova_fornitore(self, denominazione):
+        """Cerca la denominazione nell'indice dei fornitori, costruendolo se necessario."""
+        with self._lock:
+            if self._indice_fornitori is None:
+                self._indice_fornitori = IndiceFornitori(self.patterns["fornitori"], self.patterns["alias_fornitori"])
+            return self._indice_fornitori.trova(denominazione)
+
+    def risolvi_fornitore(self, denominazione):
+        """
+        Trova il fornitore noto che corrisponde a una denominazione letta da un documento.
+
+        Le denominazioni vengono confrontate per chiave canonica (vedi
+        `supplier_index.chiave_fornitore`) e tra gli alias confermati. Un
+        fornitore solo simile non viene restituito: va proposto all'utente con
+        `suggerisci_fornitore` e confermato con `conferma_alias`.
+
+        Args:
+            denominazione (str): Denominazione letta dal documento
+
+        Returns:
+            str: Nome del fornitore come salvato nel database, oppure None se non è noto
+        """
+        if not denominazione:
+            return None
+        if denominazione in self.patterns["fornitori"]:
+            return denominazione
+        fornitore, esatto = self._trova_fornitore(denominazione)
+        return fornitore if esatto else None
+
+    def suggerisci_fornitore(self, denominazione):
+        """
+        Cerca un fornitore noto simile a una denominazione che non corrisponde a nessuno.
+
+        Args:
+            denominazione (str): Denominazione letta dal documento
+
+        Returns:
+            str: Nome del fornitore simile, oppure None se la denominazione è già
+                 nota o non ha fornitori simili
+        """
+        if not denominazione or denominazione in self.patterns["fornitori"]:
+            return None
+        fornitore, esatto = self._trova_fornitore(denominazione)
+        return None if esatto else fornitore
+
+    def conferma_alias(self, denominazione, fornitore):
+        """
+        Registra una denominazione, confermata dall'utente, come alias di un fornitore noto.
+
+        Args:
+            denominazione (str): Denominazione letta dal documento
+            fornitore (str): Nome del fornitore come salvato nel database
+        """
+        chiave = chiave_fornitore(denominazione)
+        if not chiave or chiave == chiave_fornitore(fornitore):
+            return
+        logging.info("Denominazione '%s' confermata come alias del fornitore '%s'", denominazione, fornitore)
+        self._registra_modifica(("alias", chiave, fornitore))
+
     def add_fornitore_pattern(self, denominazione, pattern_info):
         """
         Aggiunge o aggiorna un pattern specifico per un fornitore.
+
+        Se la denominazione corrisponde a un fornitore già noto, il pattern
+        viene salvato sotto il nome esistente.
         
         Args:
             denominazione (str): Nome del fornitore
             pattern_info (dict): Informazioni sul pattern (regex, posizione, ecc.)
         """
-        if denominazione not in self.patterns["fornitori"]:
-            self.patterns["fornitori"][denominazione] = {}
-        
-        self.patterns["fornitori"][denominazione].update(pattern_info)
-        self.save_patterns()
+        denominazione = self.risolvi_fornitore(denominazione) or denominazione
+        self._registra_modifica(("fornitore", denominazione, dict(pattern_info)))
+        self._notifica("pattern_fornitore_aggiunto", denominazione=denominazione)
     
     def get_fornitore_patterns(self, denominazione):
         """
         Ottiene i pattern specifici per un fornitore.
         
+        La denominazione non deve coincidere esattamente con quella salvata:
+        viene risolta con `risolvi_fornitore`.
+
         Args:
             denominazione (str): Nome del fornitore
             
         Returns:
             dict: Pattern specifici per il fornitore o None se non trovati
         """
-        return self.patterns["fornitori"].get(denominazione)
+        fornitore = self.risolvi_fornitore(denominazione)
+        return self.patterns["fornitori"].get(fornitore) if fornitore else None
     
+    def add_campione(self, denominazione, testo, numero, data):
+        """
+        Salva un campione di testo con i valori confermati per un fornitore.
+
+        I campioni servono a validare i pattern indotti per lo stesso fornitore.
+        Viene conservata solo la porzione di testo attorno ai valori confermati.
+
+        Args:
+            denominazione (str): Nome del fornitore
+            testo (str): Testo completo della fattura
+            numero (str): Numero fattura confermato
+            data (str): Data fattura confermata
+        """
+        if not testo:
+            return
+        denominazione = self.risolvi_fornitore(denominazione) or denominazione
+        indice = testo.find(data)
+        fine = len(testo) if indice < 0 else min(len(testo), indice + len(data) + CONTESTO_CAMPIONE // 4)
+        inizio = max(0, fine - CONTESTO_CAMPIONE)
+
+        campione = {"testo": testo[inizio:fine], "numero": numero, "data": data}
+        if self.sola_lettura:
+            return
+        self._salva_campioni([(denominazione, campione)])
+        self._notifica("campione_aggiunto", denominazione=denominazione)
+
+    def get_campioni(self, denominazione):
+        """
+        Ottiene i campioni di testo salvati per un fornitore.
+
+        Viene letto solo il file dei campioni che contiene il fornitore.
+
+        Args:
+            denominazione (str): Nome del fornitore
+
+        Returns:
+            list: Dizionari con chiavi "testo", "numero" e "data"
+        """
+        fornitore = self.risolvi_fornitore(denominazione) or denominazione
+        # Campioni di un database non ancora migrato (es. aperto in sola lettura)
+        campioni = list(self.patterns.get("campioni", {}).get(fornitore, []))
+        with self._lock:
+            try:
+                salvati = self._leggi_campioni(self._percorso_campioni(fornitore))["campioni"].get(fornitore, [])
+            except (OSError, ValueError) as e:
+                logging.error("Errore nella lettura dei campioni di %s: %s", fornitore, e)
+                salvati = []
+        # I campioni non migrati sono i più vecchi
+        return (campioni + [c for c in salvati if c not in campioni])[-MAX_CAMPIONI_FORNITORE:]
+
+    def registra_impronta(self, impronta, denominazione, confermata=False):
+        """
+        Associa l'impronta del layout di un documento a un fornitore.
+
+        Un'impronta riconosciuta automaticamente per fornitori diversi viene
+        marcata come ambigua e non viene più usata; un'associazione confermata
+        dall'utente sostituisce sempre quella esistente.
+
+        Args:
+            impronta (str): Impronta calcolata da `fingerprint.calcola_impronta`
+            denominazione (str): Nome del fornitore
+            confermata (bool): True se il fornitore è stato confermato dall'utente
+        """
+        if not impronta or not denominazione:
+            return
+        attuale = self.patterns["impronte"].get(impronta)
+        if confermata:
+            voce = {"fornitore": denominazione, "confermata": True, "ambigua": False}
+            if attuale == voce:
+                return
+        elif attuale is None:
+            voce = {"fornitore": denominazione, "confermata": False, "ambigua": False}
+        elif attuale.get("fornitore") == denominazione or attuale.get("ambigua") or attuale.get("confermata"):
+            # Già associata, già ambigua o confermata dall'utente: niente da cambiare
+            return
+        else:
+            logging.info("Impronta %s associata a più fornitori, non verrà più usata", impronta)
+            voce = {"fornitore": None, "confermata": False, "ambigua": True}
+        # Le impronte apprese durante l'estrazione vengono salvate a gruppi, non a ogni documento
+        self._registra_modifica(("impronta", impronta, voce), differita=not confermata)
+
+    def get_fornitore_da_impronta(self, impronta):
+        """
+        Restituisce il fornitore associato all'impronta del layout di un documento.
+
+        Args:
+            impronta (str): Impronta del documento
+
+        Returns:
+            str: Nome del fornitore, oppure None se l'impronta è sconosciuta o ambigua
+        """
+        voce = self.patterns["impronte"].get(impronta)
+        return voce.get("fornitore") if voce else None
+
+    def elenca_fornitori(self, filtro=""):
+        """
+        Elenca i fornitori con pattern specifici in ordine alfabetico.
+
+        L'elenco ordinato viene calcolato una sola volta e riusato fino alla
+        modifica successiva dei fornitori.
+
+        Args:
+            filtro (str, optional): Testo che deve comparire nel nome (maiuscole e minuscole indifferenti)
+
+        Returns:
+            list: Nomi dei fornitori
+        """
+        with self._lock:
+            if self._nomi_ordinati is None:
+                self._nomi_ordinati = sorted(self.patterns["fornitori"], key=str.casefold)
+            nomi = self._nomi_ordinati
+        filtro = (filtro or "").strip().casefold()
+        if not filtro:
+            return nomi
+        return [nome for nome in nomi if filtro in nome.casefold()]
+
     def add_global_pattern(self, pattern_type, regex):
         """
         Aggiunge un nuovo pattern regex globale.
@@ -82,12 +815,10 @@ class PatternDatabase:
             pattern_type (str): Tipo di pattern (es. "denominazione", "numero_data")
             regex (str): Espressione regolare da aggiungere
         """
-        if pattern_type not in self.patterns["regex_patterns"]:
-            self.patterns["regex_patterns"][pattern_type] = []
-        
-        if regex not in self.patterns["regex_patterns"][pattern_type]:
-            self.patterns["regex_patterns"][pattern_type].append(regex)
-            self.save_patterns()
+        if regex not in self.patterns["regex_patterns"].get(pattern_type, []):
+            self._liste_compilate.pop(pattern_type, None)
+            self._registra_modifica(("globale", pattern_type, regex))
+            self._notifica("pattern_aggiunto", tipo=pattern_type, regex=regex)
     
     def get_global_patterns(self, pattern_type):
         """
@@ -99,4 +830,85 @@ class PatternDatabase:
         Returns:
             list: Lista di pattern regex
         """
-        return self.patterns["regex_patterns"].get(pattern_type, [])
\ No newline at end of file
+        return self.patterns["regex_patterns"].get(pattern_type, [])
+
+    def segnala_pattern(self, regex, motivo):
+        """
+        Segnala un pattern problematico in modo che venga ignorato nelle estrazioni successive.
+
+        Args:
+            regex (str): Espressione regolare da segnalare
+            motivo (str): Motivo della segnalazione (es. "timeout", "non valido")
+        """
+        if regex in self.patterns["pattern_segnalati"]:
+            return
+        logging.warning("Pattern segnalato (%s): %s", motivo, regex)
+        self._liste_compilate.clear()
+        self._registra_modifica(("segnalato", regex, {
+            "motivo": motivo,
+            "data": datetime.now().isoformat()
+        }))
+        self._notifica("pattern_segnalato", regex=regex, motivo=motivo)
+
+    def registra_timeout(self, regex):
+        """
+        Conta una ricerca scaduta di un pattern e lo segnala dopo `timeout_per_segnalazione` scadenze.
+
+        Una sola scadenza può dipendere dal carico della macchina o da un
+        documento anomalo: il pattern viene segnalato, e quindi ignorato in
+        modo permanente, solo se continua a superare il budget.
+
+        Args:
+            regex (str): Espressione regolare la cui ricerca ha superato il budget
+
+        Returns:
+            bool: True se il pattern è stato segnalato
+        """
+        with self._lock:
+            scadenze = self._timeout_pattern.get(regex, 0) + 1
+            self._timeout_pattern[regex] = scadenze
+        if scadenze < get_impostazioni().timeout_per_segnalazione:
+            logging.warning("Ricerca scaduta per il pattern (%d di %d prima della segnalazione): %s",
+                            scadenze, get_impostazioni().timeout_per_segnalazione, regex)
+            return False
+        self.segnala_pattern(regex, "timeout")
+        return True
+
+    def is_pattern_segnalato(self, regex):
+        """
+        Verifica se un pattern è stato segnalato come problematico.
+
+        Args:
+            regex (str): Espressione regolare da verificare
+
+        Returns:
+            bool: True se il pattern deve essere ignorato
+        """
+        return regex in self.patterns["pattern_segnalati"]
+
+
+# Istanza condivisa da tutta l'applicazione
+_pattern_db = None
+
+
+def get_pattern_db(db_path=None, sola_lettura=False):
+    """
+    Restituisce l'istanza del database dei pattern condivisa nel processo.
+
+    GUI ed estrazione usano la stessa istanza, così i pattern appresi sono
+    disponibili già dal file successivo senza riavviare l'applicazione.
+
+    Args:
+        db_path (str, optional): File dei pattern, considerato solo alla creazione dell'istanza
+        sola_lettura (bool, optional): Vedi `PatternDatabase`; considerato solo alla creazione
+
+    Returns:
+        PatternDatabase: Istanza condivisa
+    """
+    global _pattern_db
+    if _pattern_db is None:
+        _pattern_db = PatternDatabase(db_path, sola_lettura)
+        atexit.register(_pattern_db.salva_modifiche_in_attesa)
+    elif db_path is not None and os.path.abspath(db_path) != os.path.abspath(_pattern_db.db_path):
+        logging.warning("Database dei pattern già in uso (%s): %s ignorato", _pattern_db.db_path, db_path)
+    return _pattern_db
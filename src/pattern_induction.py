@@ -0,0 +1,220 @@
+"""
+Induzione di pattern regex generalizzati a partire dai valori confermati dall'utente.
+
+Invece di salvare il numero e la data letterali di una singola fattura, i valori
+vengono trasformati in "forme" (cifre, lettere, separatori) ancorate al testo
+dell'etichetta che li precede. I pattern candidati vengono poi validati sui
+campioni di testo già salvati per lo stesso fornitore.
+"""
+
+import re
+import logging
+
+# Lunghezza massima dell'etichetta usata come ancora prima del numero fattura
+MAX_LUNGHEZZA_ETICHETTA = 30
+
+# Distanza massima (in caratteri) tra numero e data per considerarli una coppia
+MAX_DISTANZA_NUMERO_DATA = 120
+
+_RE_SEGMENTI = re.compile(r"\d+|[A-Z]+|[a-z]+|[À-ÿ]+|\s+|.", re.DOTALL)
+_RE_ETICHETTA = re.compile(r"[A-Za-zÀ-ÿ][A-Za-zÀ-ÿ .°:#/]*$")
+
+
+def generalizza_valore(valore, precisa=True):
+    """
+    Trasforma un valore letterale in un'espressione regolare basata sulla sua forma.
+
+    Esempio: "FT/2025/12" diventa "[A-Z]{2}[-/]\\d{4}[-/]\\d{2}" in modalità precisa
+    e "[A-Z]+[-/]\\d+[-/]\\d+" in modalità larga.
+
+    Args:
+        valore (str): Valore confermato (numero fattura o data)
+        precisa (bool): Se True mantiene la lunghezza esatta di ogni segmento
+
+    Returns:
+        str: Espressione regolare senza gruppi di cattura
+    """
+    parti = []
+    for segmento in _RE_SEGMENTI.findall(valore.strip()):
+        if segmento.isdigit():
+            classe = r"\d"
+        elif segmento.isascii() and segmento.isupper():
+            classe = "[A-Z]"
+        elif segmento.isascii() and segmento.islower():
+            classe = "[a-z]"
+        elif segmento.isalpha():
+            classe = r"[^\W\d_]"
+        elif segmento.isspace():
+            parti.append(r"\s+")
+            continue
+        elif segmento in "-/":
+            # Il numero confermato ha già "/" sostituito da "-": accettiamo entrambi
+            parti.append("[-/]")
+            continue
+        else:
+            parti.append(re.escape(segmento))
+            continue
+
+        if precisa:
+            parti.append(f"{classe}{{{len(segmento)}}}" if len(segmento) > 1 else classe)
+        else:
+            parti.append(f"{classe}+")
+    return "".join(parti)
+
+
+def _regex_letterale(valore):
+    """Crea una regex che trova il valore letterale nel testo tollerando "-"/"/" e spazi."""
+    parti = []
+    for carattere in valore.strip():
+        if carattere in "-/":
+            parti.append("[-/]")
+        elif carattere.isspace():
+            parti.append(r"\s+")
+        else:
+            parti.append(re.escape(carattere))
+    return r"(?<![A-Za-z0-9])" + "".join(parti) + r"(?![A-Za-z0-9])"
+
+
+def _generalizza_intermezzo(testo):
+    """Generalizza il testo tra due valori: spazi → \\s+, cifre → \\d+, resto letterale."""
+    parti = []
+    for segmento in _RE_SEGMENTI.findall(testo):
+        if segmento.isspace():
+            parti.append(r"\s+")
+        elif segmento.isdigit():
+            parti.append(r"\d+")
+        else:
+            parti.append(re.escape(segmento))
+    return "".join(parti)
+
+
+def _etichetta_prima(testo, inizio):
+    """
+    Restituisce le ancore testuali che precedono la posizione indicata.
+
+    Returns:
+        list: Regex delle ancore candidate, dalla più specifica (etichetta sulla
+              stessa riga) alla riga di intestazione precedente
+    """
+    ancore = []
+    inizio_riga = testo.rfind("\n", 0, inizio) + 1
+    riga = testo[inizio_riga:inizio].rstrip()
+
+    match = _RE_ETICHETTA.search(riga[-MAX_LUNGHEZZA_ETICHETTA:])
+    if match and match.group(0).strip():
+        etichetta = re.sub(r"\s+", " ", match.group(0).strip())
+        ancore.append(re.escape(etichetta).replace(r"\ ", r"\s+") + r"\s*")
+
+    # Intestazione di tabella sulla riga non vuota precedente (es. "Numero   Data")
+    if not riga.strip():
+        righe_precedenti = [r for r in testo[:inizio_riga].splitlines() if r.strip()]
+        if righe_precedenti:
+            intestazione = re.sub(r"\s+", " ", righe_precedenti[-1].strip())[-MAX_LUNGHEZZA_ETICHETTA:].strip()
+            if intestazione and not any(c.isdigit() for c in intestazione):
+                ancore.append(re.escape(intestazione).replace(r"\ ", r"\s+") + r"\s*\n\s*")
+    return ancore
+
+
+def _trova_coppie(testo, numero, data):
+    """
+    Trova le occorrenze vicine di numero e data nel testo.
+
+    Returns:
+        list: Tuple (match_numero, match_data) ordinate per distanza crescente
+    """
+    coppie = []
+    occorrenze_numero = list(re.finditer(_regex_letterale(numero), testo))
+    occorrenze_data = list(re.finditer(_regex_letterale(data), testo))
+    for m_num in occorrenze_numero:
+        for m_data in occorrenze_data:
+            if m_num.end() <= m_data.start():
+                distanza = m_data.start() - m_num.end()
+            elif m_data.end() <= m_num.start():
+                distanza = m_num.start() - m_data.end()
+            else:
+                continue
+            if distanza <= MAX_DISTANZA_NUMERO_DATA:
+                coppie.append((distanza, m_num, m_data))
+    coppie.sort(key=lambda c: c[0])
+    return [(m_num, m_data) for _, m_num, m_data in coppie]
+
+
+def _candidati_numero_data(testo, numero, data):
+    """Genera i pattern candidati dal più generale ancorato al meno specifico."""
+    candidati = []
+    for m_num, m_data in _trova_coppie(testo, numero, data):
+        numero_prima = m_num.start() < m_data.start()
+        primo, secondo = (m_num, m_data) if numero_prima else (m_data, m_num)
+        intermezzo = testo[primo.end():secondo.start()]
+        if len(intermezzo) > 40:
+            # Intermezzo lungo (es. colonne di tabella): basta limitarne la lunghezza
+            intermezzo_regex = f"[\\s\\S]{{0,{len(intermezzo) + 20}}}?"
+        else:
+            intermezzo_regex = _generalizza_intermezzo(intermezzo)
+
+        ancore = _etichetta_prima(testo, primo.start()) + [""]
+        for ancora in ancore:
+            for precisa in (False, True):
+                forma_num = generalizza_valore(numero, precisa)
+                forma_data = generalizza_valore(data, precisa)
+                if numero_prima:
+                    pattern = f"{ancora}({forma_num}){intermezzo_regex}({forma_data})"
+                else:
+                    # Il gruppo 1 deve restare il numero: lo catturiamo in un lookahead
+                    pattern = f"{ancora}(?={forma_data}{intermezzo_regex}({forma_num}))({forma_data})"
+                if ancora == "" and not precisa:
+                    # Un pattern senza ancora e senza lunghezze è troppo generico
+                    continue
+                if pattern not in candidati:
+                    candidati.append(pattern)
+    return candidati
+
+
+def _verifica(pattern, testo, numero, data):
+    """Verifica che il pattern estragga esattamente numero e data dal testo."""
+    try:
+        match = re.search(pattern, testo)
+    except re.error:
+        return False
+    if not match or len(match.groups()) < 2:
+        return False
+    return (match.group(1).strip().replace("/", "-") == numero.strip().replace("/", "-")
+            and match.group(2).strip().replace("/", "-") == data.strip().replace("/", "-"))
+
+
+def induci_pattern_numero_data(testo, numero, data, campioni=None):
+    """
+    Crea un pattern generalizzato per numero e data di un fornitore.
+
+    Il pattern scelto è il primo candidato che estrae i valori corretti sia dal
+    testo corrente sia da tutti i campioni salvati; in mancanza, quello che ne
+    soddisfa il maggior numero.
+
+    Args:
+        testo (str): Testo completo della fattura corrente
+        numero (str): Numero fattura confermato
+        data (str): Data fattura confermata
+        campioni (list, optional): Campioni salvati del fornitore, dizionari
+            con chiavi "testo", "numero" e "data"
+
+    Returns:
+        str: Pattern regex con gruppo 1 = numero e gruppo 2 = data, oppure None
+    """
+    if not testo or not numero or not data:
+        return None
+
+    campioni = campioni or []
+    migliore, punteggio_migliore = None, -1
+    for pattern in _candidati_numero_data(testo, numero, data):
+        if not _verifica(pattern, testo, numero, data):
+            continue
+        punteggio = sum(1 for c in campioni if _verifica(pattern, c["testo"], c["numero"], c["data"]))
+        if punteggio == len(campioni):
+            logging.info("Pattern numero/data indotto e validato su %s campioni: %s", len(campioni), pattern)
+            return pattern
+        if punteggio > punteggio_migliore:
+            migliore, punteggio_migliore = pattern, punteggio
+
+    if migliore:
+        logging.info("Pattern numero/data indotto (valido su %s/%s campioni): %s", punteggio_migliore, len(campioni), migliore)
+    return migliore
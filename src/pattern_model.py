@@ -0,0 +1,109 @@
+"""
+Modello Qt paginato dei pattern specifici dei fornitori.
+
+Con decine di migliaia di fornitori una QTableWidget popolata cella per cella
+blocca l'apertura del gestore dei pattern per secondi. Il modello mostra una
+pagina di fornitori alla volta, presa dall'elenco ordinato e già filtrato del
+database: le righe della pagina vengono costruite solo quando la pagina cambia.
+"""
+
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex
+
+# Fornitori mostrati in ogni pagina
+FORNITORI_PER_PAGINA = 200
+
+
+class PatternFornitoriModel(QAbstractTableModel):
+    """
+    Modello a tre colonne (fornitore, tipo, pattern) con filtro e paginazione.
+
+    Ogni fornitore occupa una riga per ciascuno dei suoi pattern; la pagina
+    contiene al più `FORNITORI_PER_PAGINA` fornitori.
+    """
+
+    INTESTAZIONI = ("Fornitore", "Tipo Pattern", "Pattern Regex")
+
+    def __init__(self, pattern_db, parent=None, fornitori_per_pagina=FORNITORI_PER_PAGINA):
+        super().__init__(parent)
+        self._pattern_db = pattern_db
+        self._per_pagina = max(1, fornitori_per_pagina)
+        self._filtro = ""
+        self._nomi = pattern_db.elenca_fornitori()
+        self._pagina = 0
+        self._righe = []
+        self._carica_pagina()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._righe)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.INTESTAZIONI)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.ToolTipRole):
+            return self._righe[index.row()][index.column()]
+        return None
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.INTESTAZIONI[section]
+        return None
+
+    def _carica_pagina(self):
+        """Costruisce le righe della pagina corrente."""
+        fornitori = self._pattern_db.patterns["fornitori"]
+        inizio = self._pagina * self._per_pagina
+        righe = []
+        for nome in self._nomi[inizio:inizio + self._per_pagina]:
+            for tipo, pattern in fornitori.get(nome, {}).items():
+                righe.append((nome, tipo, pattern))
+        self.beginResetModel()
+        self._righe = righe
+        self.endResetModel()
+
+    @property
+    def pagina(self):
+        """int: Pagina corrente, a partire da 0."""
+        return self._pagina
+
+    @property
+    def numero_pagine(self):
+        """int: Numero di pagine (almeno 1, anche senza fornitori)."""
+        return max(1, -(-len(self._nomi) // self._per_pagina))
+
+    @property
+    def numero_fornitori(self):
+        """int: Fornitori che soddisfano il filtro corrente."""
+        return len(self._nomi)
+
+    def imposta_filtro(self, testo):
+        """
+        Mostra solo i fornitori il cui nome contiene il testo, tornando alla prima pagina.
+
+        Args:
+            testo (str): Testo da cercare (maiuscole e minuscole indifferenti)
+        """
+        self._filtro = testo or ""
+        self._nomi = self._pattern_db.elenca_fornitori(self._filtro)
+        self._pagina = 0
+        self._carica_pagina()
+
+    def vai_a_pagina(self, pagina):
+        """
+        Mostra la pagina indicata, limitata all'intervallo valido.
+
+        Args:
+            pagina (int): Pagina da mostrare, a partire da 0
+        """
+        pagina = min(max(0, pagina), self.numero_pagine - 1)
+        if pagina != self._pagina:
+            self._pagina = pagina
+            self._carica_pagina()
+
+    def aggiorna(self):
+        """Rilegge l'elenco dei fornitori dal database mantenendo filtro e pagina."""
+        self._nomi = self._pattern_db.elenca_fornitori(self._filtro)
+        self._pagina = min(self._pagina, self.numero_pagine - 1)
+        self._carica_pagina()
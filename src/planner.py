@@ -0,0 +1,346 @@
+"""
+Simulazione di un'elaborazione batch e piano di rinomina riutilizzabile.
+
+Prima di rinominare migliaia di file su una cartella condivisa è utile vedere
+esattamente cosa succederà. La simulazione esegue l'estrazione in un gruppo di
+processi worker supervisionati (vedi `workers.GruppoEstrattori`), con lo stesso
+budget di tempo e la stessa quarantena dell'interfaccia, genera i nomi con `genera_nome_file` e calcola cartelle di
+destinazione e collisioni, senza rinominare file né creare cartelle. I worker della
+simulazione non modificano i dati: il database dei pattern è in sola lettura
+(nessuna impronta o segnalazione salvata) e la cache dei testi non riceve nuove voci. Il piano
+ottenuto (JSON) elenca i documenti da rinominare e quelli non riconosciuti e può
+essere eseguito in seguito così com'è: i documenti modificati dopo la simulazione
+e le destinazioni nel frattempo occupate vengono saltati.
+
+Uso da riga di comando:
+    python src/planner.py simula CARTELLA_O_FILE... --anno 2025 [--cartelle] [--output piano.json]
+    python src/planner.py esegui piano.json
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from utils import genera_nome_file, estensione_documento, percorso_destinazione, azzera_indice_cartelle
+from document_source import (
+    esiste_documento, firma_documento, salva_documento, nome_documento, is_membro_zip, dimentica_documento
+)
+from mover import sposta_file_multipli, MAX_COPIE_CONCORRENTI
+from manifest import ManifestLotto, ESITO_RINOMINATO, ESITO_NON_RICONOSCIUTO, ESITO_ERRORE
+from workers import Quarantena, GruppoEstrattori, estrai_dati, WORKER_PREDEFINITI
+from config import get_impostazioni
+
+# Versione del formato del piano salvato
+VERSIONE_PIANO = 1
+
+# Intervallo (in secondi) tra due chiamate della funzione di attesa
+INTERVALLO_ATTESA = 0.1
+
+
+def _attendi_risultati(futuri, in_attesa=None):
+    """
+    Attende il completamento dei futuri, chiamando `in_attesa` a intervalli regolari.
+
+    Returns:
+        dict: Futuro -> (risultato, errore)
+    """
+    risultati = {}
+    in_corso = set(futuri)
+    while in_corso:
+        completati, in_corso = wait(in_corso, timeout=INTERVALLO_ATTESA if in_attesa else None,
+                                    return_when=FIRST_COMPLETED)
+        for futuro in completati:
+            try:
+                risultati[futuro] = (futuro.result(), None)
+            except Exception as e:
+                risultati[futuro] = (None, str(e))
+        if in_attesa:
+            in_attesa()
+    return risultati
+
+
+def calcola_piano(percorsi, parametri_nome, usa_cartelle=False, cartella_base=None, worker=WORKER_PREDEFINITI,
+                  in_attesa=None):
+    """
+    Simula l'elaborazione dei documenti e restituisce il piano di rinomina.
+
+    L'estrazione avviene in parallelo nei processi worker, con il budget di
+    tempo e la quarantena di `workers.EstrattoreIsolato`; destinazioni e
+    collisioni vengono calcolate poi nell'ordine dei documenti, così il piano
+    è deterministico. Nessun file viene rinominato e nessuna cartella creata;
+    i worker non salvano impronte, segnalazioni dei pattern né testi in cache.
+
+    Args:
+        percorsi (list): Percorsi dei file o percorsi virtuali dei membri ZIP
+        parametri_nome (dict): tipologia, stagione, anno, genere e generico per `genera_nome_file`
+        usa_cartelle (bool): Se True, ogni documento va nella cartella del fornitore
+        cartella_base (str, optional): Cartella di destinazione; se None è quella di ogni documento
+        worker (int): Numero di processi worker
+        in_attesa (callable, optional): Funzione chiamata periodicamente durante l'attesa,
+            ad esempio per mantenere reattiva l'interfaccia
+
+    Returns:
+        dict: Piano con le chiavi "versione", "creato", "parametri", "voci" (documenti
+              da rinominare), "falliti" (documenti non riconosciuti o in errore) e
+              "cartelle_da_creare"
+    """
+    inizio = time.perf_counter()
+    quarantena = Quarantena()
+    azzera_indice_cartelle()
+    piano = {
+        "versione": VERSIONE_PIANO,
+        "creato": datetime.now().isoformat(timespec="seconds"),
+        "parametri": dict(parametri_nome, usa_cartelle=usa_cartelle, cartella_base=cartella_base),
+        "voci": [],
+        "falliti": [],
+    }
+
+    da_estrarre = []
+    for path in percorsi:
+        if quarantena.contiene(path):
+            piano["falliti"].append({"percorso_originale": path, "stato": ESITO_ERRORE,
+                                     "errore": "Documento in quarantena"})
+        else:
+            da_estrarre.append(path)
+
+    # Ogni thread attende un worker supervisionato: un documento che blocca o fa terminare
+    # MuPDF viene interrotto dopo il budget e messo in quarantena, senza fermare gli altri
+    estrattori = GruppoEstrattori(worker, quarantena=quarantena, sola_lettura=True)
+    try:
+        with ThreadPoolExecutor(max_workers=len(estrattori.estrattori)) as pool:
+            futuri = [pool.submit(estrattori.esegui, estrai_dati, path) for path in da_estrarre]
+            risultati = _attendi_risultati(futuri, in_attesa)
+    finally:
+        estrattori.chiudi()
+
+    occupati = set()
+    cartelle_previste = {}
+    cartelle_nuove = set()
+    for path, futuro in zip(da_estrarre, futuri):
+        dati, errore = risultati[futuro]
+        if errore is not None:
+            piano["falliti"].append({"percorso_originale": path, "stato": ESITO_ERRORE, "errore": errore})
+            continue
+        if not all([dati["denominazione"], dati["numero_fattura"], dati["data_fattura"]]):
+            piano["falliti"].append(dict(dati, percorso_originale=path, stato=ESITO_NON_RICONOSCIUTO, errore=None))
+            continue
+
+        try:
+            nuovo_nome = genera_nome_file(
+                numero_fattura=dati["numero_fattura"], data_fattura=dati["data_fattura"],
+                denominazione=dati["denominazione"], estensione=estensione_documento(path), **parametri_nome
+            )
+            nuovo_percorso = percorso_destinazione(
+                path, nuovo_nome, dati["denominazione"], usa_cartelle, cartella_base,
+                crea_cartella=False, occupati=occupati, cartelle_previste=cartelle_previste
+            )
+            firma = list(firma_documento(path))
+        except Exception as e:
+            piano["falliti"].append({"percorso_originale": path, "stato": ESITO_ERRORE, "errore": str(e)})
+            continue
+
+        occupati.add(nuovo_percorso)
+        cartella = os.path.dirname(nuovo_percorso)
+        if not os.path.isdir(cartella):
+            cartelle_nuove.add(cartella)
+        piano["voci"].append(dict(
+            dati, percorso_originale=path, nuovo_percorso=nuovo_percorso, firma=firma,
+            collisione=os.path.basename(nuovo_percorso) != nuovo_nome
+        ))
+
+    piano["cartelle_da_creare"] = sorted(cartelle_nuove)
+    logging.info("Simulazione di %d documenti completata in %.1f s: %d da rinominare, %d non elaborabili",
+                 len(percorsi), time.perf_counter() - inizio, len(piano["voci"]), len(piano["falliti"]))
+    return piano
+
+
+def salva_piano(piano, percorso):
+    """
+    Scrive il piano in formato JSON.
+
+    Args:
+        piano (dict): Piano restituito da `calcola_piano`
+        percorso (str): File di destinazione
+    """
+    with open(percorso, 'w', encoding='utf-8') as f:
+        json.dump(piano, f, indent=2, ensure_ascii=False)
+    logging.info("Piano di rinomina salvato: %s", percorso)
+
+
+def carica_piano(percorso):
+    """
+    Legge un piano salvato con `salva_piano`.
+
+    Args:
+        percorso (str): File JSON del piano
+
+    Returns:
+        dict: Piano di rinomina
+
+    Raises:
+        ValueError: Se il file non è un piano di rinomina in un formato supportato
+    """
+    with open(percorso, 'r', encoding='utf-8') as f:
+        piano = json.load(f)
+    if not isinstance(piano, dict) or piano.get("versione") != VERSIONE_PIANO or "voci" not in piano:
+        raise ValueError(f"Il file {percorso} non è un piano di rinomina valido")
+    return piano
+
+
+def esegui_piano(piano, manifest=None, max_copie=MAX_COPIE_CONCORRENTI):
+    """
+    Rinomina i documenti secondo un piano calcolato in precedenza.
+
+    Un documento viene saltato se non esiste più, se è stato modificato dopo la
+    simulazione o se la destinazione prevista è stata occupata nel frattempo:
+    il piano non sovrascrive mai un file. I file su disco vengono spostati
+    insieme con `mover.sposta_file_multipli`, che copia in parallelo quelli
+    diretti su un altro volume e completa gli spostamenti interrotti di
+    un'esecuzione precedente dello stesso piano.
+
+    Args:
+        piano (dict): Piano restituito da `calcola_piano` o `carica_piano`
+        manifest (ManifestLotto, optional): Manifest in cui registrare una riga per ogni voce
+        max_copie (int): Numero massimo di copie contemporanee tra volumi diversi
+
+    Returns:
+        tuple: (numero di documenti rinominati, lista di (percorso, errore) dei documenti saltati)
+    """
+    errori = {}
+    da_spostare = []
+    for indice, voce in enumerate(piano["voci"]):
+        path, nuovo_percorso = voce["percorso_originale"], voce["nuovo_percorso"]
+        try:
+            if not esiste_documento(path):
+                errori[indice] = "Documento non più presente"
+            elif list(firma_documento(path)) != voce.get("firma"):
+                errori[indice] = "Documento modificato dopo la simulazione"
+            elif is_membro_zip(path):
+                if os.path.exists(nuovo_percorso):
+                    errori[indice] = "Destinazione già esistente"
+                else:
+                    os.makedirs(os.path.dirname(nuovo_percorso), exist_ok=True)
+                    salva_documento(path, nuovo_percorso)
+            else:
+                os.makedirs(os.path.dirname(nuovo_percorso), exist_ok=True)
+                da_spostare.append(indice)
+        except Exception as e:
+            errori[indice] = str(e)
+
+    inizio = time.perf_counter()
+    esiti = sposta_file_multipli(
+        [(piano["voci"][i]["percorso_originale"], piano["voci"][i]["nuovo_percorso"]) for i in da_spostare],
+        max_copie
+    )
+    for indice, errore in zip(da_spostare, esiti):
+        if errore is not None:
+            errori[indice] = errore
+        else:
+            dimentica_documento(piano["voci"][indice]["percorso_originale"])
+    # Gli spostamenti avvengono insieme: a ogni voce viene attribuita la durata media
+    durata_ms = (time.perf_counter() - inizio) * 1000 / max(1, len(da_spostare))
+    spostati = set(da_spostare)
+
+    saltati = []
+    for indice, voce in enumerate(piano["voci"]):
+        path, errore = voce["percorso_originale"], errori.get(indice)
+        if errore is None:
+            logging.info("File rinominato dal piano: %s -> %s", path, voce["nuovo_percorso"])
+        else:
+            logging.warning("Voce del piano saltata (%s): %s", errore, path)
+            saltati.append((path, errore))
+        if manifest is not None:
+            manifest.aggiungi(
+                path, ESITO_ERRORE if errore else ESITO_RINOMINATO,
+                nuovo_percorso=None if errore else voce["nuovo_percorso"], denominazione=voce.get("denominazione"),
+                numero_fattura=voce.get("numero_fattura"), data_fattura=voce.get("data_fattura"),
+                origine=voce.get("origine"), pattern=voce.get("pattern"),
+                durata_ms=durata_ms if indice in spostati else None, errore=errore
+            )
+    return len(piano["voci"]) - len(saltati), saltati
+
+
+def _elenca_documenti(argomenti, includi, escludi):
+    """Espande le cartelle indicate da riga di comando nei documenti che contengono."""
+    from scanner import scansiona_cartella, dividi_filtri
+
+    percorsi = []
+    for argomento in argomenti:
+        if os.path.isdir(argomento):
+            percorsi.extend(scansiona_cartella(argomento, dividi_filtri(includi) if includi else None,
+                                               dividi_filtri(escludi)))
+        else:
+            percorsi.append(argomento)
+    return percorsi
+
+
+def main():
+    """Simula un'elaborazione o esegue un piano dalla riga di comando."""
+    parser = argparse.ArgumentParser(description="Simulazione e piano di rinomina di InvoiceReader")
+    comandi = parser.add_subparsers(dest="comando", required=True)
+
+    simula = comandi.add_parser("simula", help="Calcola il piano senza modificare alcun file")
+    simula.add_argument("percorsi", nargs="+", help="File o cartelle da elaborare")
+    simula.add_argument("--anno", default="", help="Anno di riferimento (obbligatorio senza --generico)")
+    simula.add_argument("--tipologia", default="FATT", choices=["FATT", "NC"])
+    simula.add_argument("--stagione", default="")
+    simula.add_argument("--genere", default="")
+    simula.add_argument("--generico", action="store_true", help="Formato di nome semplificato")
+    simula.add_argument("--cartelle", action="store_true", help="Sposta i file nelle cartelle dei fornitori")
+    simula.add_argument("--destinazione", help="Cartella di destinazione (predefinita: quella di ogni documento)")
+    simula.add_argument("--includi", help="Filtri di inclusione per le cartelle, separati da ';'")
+    simula.add_argument("--escludi", default="", help="Filtri di esclusione per le cartelle, separati da ';'")
+    simula.add_argument("--worker", type=int, default=WORKER_PREDEFINITI, help="Numero di processi worker")
+    simula.add_argument("--output", default="piano.json", help="File in cui salvare il piano")
+
+    esegui = comandi.add_parser("esegui", help="Rinomina i documenti secondo un piano salvato")
+    esegui.add_argument("piano", help="File JSON del piano")
+    esegui.add_argument("--copie", type=int, default=MAX_COPIE_CONCORRENTI,
+                        help="Copie contemporanee verso un altro volume")
+    esegui.add_argument("--manifest", help="Cartella in cui salvare il manifest (predefinita: quella del piano)")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=get_impostazioni().livello_log_numerico,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+    if args.comando == "simula":
+        if not args.anno and not args.generico:
+            parser.error("--anno è obbligatorio se non si usa --generico")
+        parametri_nome = {
+            "tipologia": args.tipologia, "stagione": args.stagione, "anno": args.anno,
+            "genere": args.genere, "generico": args.generico,
+        }
+        percorsi = _elenca_documenti(args.percorsi, args.includi, args.escludi)
+        piano = calcola_piano(percorsi, parametri_nome, args.cartelle, args.destinazione, args.worker)
+        salva_piano(piano, args.output)
+
+        for voce in piano["voci"]:
+            segno = " (collisione)" if voce["collisione"] else ""
+            print(f"{voce['percorso_originale']} -> {voce['nuovo_percorso']}{segno}")
+        for fallito in piano["falliti"]:
+            print(f"NON ELABORABILE: {fallito['percorso_originale']} ({fallito['errore'] or fallito['stato']})")
+        print(f"\n{len(piano['voci'])} da rinominare, {len(piano['falliti'])} non elaborabili, "
+              f"{len(piano['cartelle_da_creare'])} cartelle da creare. Piano: {args.output}")
+        return 0
+
+    piano = carica_piano(args.piano)
+    manifest = ManifestLotto()
+    riusciti, saltati = esegui_piano(piano, manifest, args.copie)
+    manifest.salva(args.manifest or os.path.dirname(os.path.abspath(args.piano)))
+    for path, errore in saltati:
+        print(f"SALTATO: {nome_documento(path)} ({errore})")
+    print(f"\n{riusciti} file rinominati, {len(saltati)} saltati.")
+    return 1 if saltati else 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
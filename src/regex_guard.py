@@ -0,0 +1,203 @@
+"""
+Esecuzione controllata delle espressioni regolari.
+
+Il modulo `re` di Python non può essere interrotto da un altro thread: un pattern
+con backtracking catastrofico (es. `(a+)+$`) applicato a un testo lungo può
+bloccare l'intero processo. Questo modulo esegue le ricerche in un processo
+separato che viene terminato se una ricerca supera il budget di tempo previsto.
+"""
+
+import re
+import logging
+import threading
+import multiprocessing
+from config import get_impostazioni
+
+# Budget di tempo (in secondi) concesso a ogni singola ricerca regex
+REGEX_TIMEOUT = get_impostazioni().regex_timeout
+
+# Numero massimo di pattern compilati mantenuti in cache dal processo worker
+MAX_PATTERN_COMPILATI = get_impostazioni().max_pattern_compilati
+
+# Tempo massimo (in secondi) di avvio del processo worker, escluso dal budget delle ricerche
+TIMEOUT_AVVIO_WORKER = get_impostazioni().timeout_avvio_worker
+
+
+class RegexTimeoutError(Exception):
+    """Sollevata quando una ricerca regex supera il budget di tempo."""
+
+
+class RegexWorkerError(RuntimeError):
+    """
+    Sollevata quando il processo delle regex non si avvia o termina in modo anomalo.
+
+    A differenza di `RegexTimeoutError` non indica un problema del pattern.
+    """
+
+
+def _ciclo_worker(conn):
+    """
+    Ciclo principale del processo worker.
+
+    Segnala ("pronto", None) dopo l'avvio, poi riceve comandi dalla pipe:
+    ("testo", testo) imposta il testo corrente, ("cerca", pattern) esegue la
+    ricerca e risponde con i gruppi catturati.
+
+    Args:
+        conn: Estremità della pipe lato worker
+    """
+    testo = ""
+    compilati = {}
+    conn.send(("pronto", None))
+    while True:
+        try:
+            comando, valore = conn.recv()
+        except (EOFError, OSError):
+            # Il processo principale è terminato: usciamo
+            break
+
+        if comando == "testo":
+            testo = valore
+        elif comando == "cerca":
+            try:
+                regex = compilati.get(valore)
+                if regex is None:
+                    if len(compilati) >= MAX_PATTERN_COMPILATI:
+                        compilati.clear()
+                    regex = re.compile(valore)
+                    compilati[valore] = regex
+                match = regex.search(testo)
+                conn.send(("ok", match.groups() if match else None))
+            except re.error as e:
+                conn.send(("errore", str(e)))
+        elif comando == "stop":
+            break
+
+
+class RegexGuard:
+    """
+    Esegue ricerche regex in un processo worker terminabile con un budget di tempo.
+
+    Il testo viene inviato al worker una sola volta per documento tramite
+    `imposta_testo`; le ricerche successive inviano solo il pattern.
+    Se una ricerca supera il budget il worker viene terminato e ricreato
+    alla richiesta successiva.
+
+    Attributes:
+        ricerche (int): Numero di ricerche eseguite dalla creazione, usato nelle statistiche
+    """
+
+    def __init__(self, timeout=REGEX_TIMEOUT):
+        """
+        Args:
+            timeout (float): Budget di tempo in secondi per ogni ricerca
+        """
+        self.timeout = timeout
+        self._processo = None
+        self._conn = None
+        self._testo = ""
+        self._testo_inviato = False
+        self._lock = threading.Lock()
+        self.ricerche = 0
+
+    def _avvia_worker(self):
+        """
+        Avvia il processo worker se non è già attivo e attende che sia pronto.
+
+        L'avvio (con "spawn" può richiedere secondi) non rientra nel budget
+        delle ricerche: un avvio lento non deve far segnalare il pattern.
+
+        Raises:
+            RegexWorkerError: Se il worker non è pronto entro TIMEOUT_AVVIO_WORKER
+        """
+        if self._processo is not None and self._processo.is_alive():
+            return
+        conn_padre, conn_figlio = multiprocessing.Pipe()
+        self._processo = multiprocessing.Process(target=_ciclo_worker, args=(conn_figlio,), daemon=True)
+        self._processo.start()
+        conn_figlio.close()
+        self._conn = conn_padre
+        self._testo_inviato = False
+
+        try:
+            pronto = self._conn.poll(TIMEOUT_AVVIO_WORKER) and self._conn.recv()[0] == "pronto"
+        except (EOFError, OSError):
+            pronto = False
+        if not pronto:
+            self._termina_worker()
+            raise RegexWorkerError("Impossibile avviare il processo delle regex")
+
+    def _termina_worker(self):
+        """Termina forzatamente il processo worker."""
+        if self._processo is not None:
+            self._processo.kill()
+            self._processo.join()
+        if self._conn is not None:
+            self._conn.close()
+        self._processo = None
+        self._conn = None
+        self._testo_inviato = False
+
+    def imposta_testo(self, testo):
+        """
+        Imposta il testo su cui verranno eseguite le ricerche successive.
+
+        Args:
+            testo (str): Testo del documento corrente
+        """
+        with self._lock:
+            self._testo = testo or ""
+            self._testo_inviato = False
+
+    def cerca(self, pattern):
+        """
+        Esegue `re.search(pattern, testo)` nel worker entro il budget di tempo.
+
+        Args:
+            pattern (str): Espressione regolare da cercare
+
+        Returns:
+            tuple: Gruppi catturati dal match, oppure None se non c'è corrispondenza
+
+        Raises:
+            RegexTimeoutError: Se la ricerca supera il budget di tempo
+            re.error: Se il pattern non è un'espressione regolare valida
+            RegexWorkerError: Se il processo worker non si avvia o termina in modo anomalo
+        """
+        with self._lock:
+            self.ricerche += 1
+            self._avvia_worker()
+            try:
+                if not self._testo_inviato:
+                    self._conn.send(("testo", self._testo))
+                    self._testo_inviato = True
+                self._conn.send(("cerca", pattern))
+            except OSError:
+                self._termina_worker()
+                raise RegexWorkerError("Processo delle regex terminato in modo anomalo")
+
+            if not self._conn.poll(self.timeout):
+                logging.warning("Timeout (%ss) durante la ricerca del pattern: %s", self.timeout, pattern)
+                self._termina_worker()
+                raise RegexTimeoutError(pattern)
+
+            try:
+                esito, valore = self._conn.recv()
+            except (EOFError, OSError):
+                # Il worker è terminato in modo anomalo: non è un timeout del pattern
+                self._termina_worker()
+                raise RegexWorkerError(f"Processo delle regex terminato durante la ricerca del pattern: {pattern}")
+
+            if esito == "errore":
+                raise re.error(valore)
+            return valore
+
+    def chiudi(self):
+        """Arresta il processo worker."""
+        with self._lock:
+            if self._conn is not None:
+                try:
+                    self._conn.send(("stop", None))
+                except OSError:
+                    pass
+            self._termina_worker()
@@ -0,0 +1,151 @@
+"""
+Ricerca ricorsiva dei documenti da elaborare all'interno di una cartella.
+
+La scansione usa `os.scandir` in modo iterativo (nessuna ricorsione, nessuna
+chiamata `stat` aggiuntiva) e può essere eseguita in un thread separato:
+i documenti trovati vengono consegnati a blocchi, così l'interfaccia resta
+reattiva anche con decine di migliaia di file.
+"""
+
+import os
+import time
+import logging
+import fnmatch
+from PyQt6.QtCore import QThread, pyqtSignal
+from document_source import elenca_documenti_zip
+from config import get_impostazioni
+
+# Filtri predefiniti per la scansione delle cartelle
+FILTRI_INCLUSIONE_PREDEFINITI = "*.pdf;*.xml;*.p7m;*.zip"
+FILTRI_ESCLUSIONE_PREDEFINITI = ""
+
+# Dimensione massima di un blocco e intervallo massimo (in secondi) tra due consegne
+DIMENSIONE_BLOCCO = get_impostazioni().dimensione_blocco_scansione
+INTERVALLO_BLOCCO = 0.25
+
+
+def dividi_filtri(testo):
+    """
+    Converte una stringa di filtri separati da ";" o "," in una lista di glob.
+
+    Args:
+        testo (str): Filtri inseriti dall'utente, ad esempio "*.pdf; fatture_*"
+
+    Returns:
+        list: Glob in minuscolo, senza spazi e senza elementi vuoti
+    """
+    return [f.strip().lower() for f in testo.replace(",", ";").split(";") if f.strip()]
+
+
+def _corrisponde(nome, percorso_relativo, filtri):
+    """Verifica se il nome o il percorso relativo soddisfa uno dei glob."""
+    return any(fnmatch.fnmatchcase(nome, f) or fnmatch.fnmatchcase(percorso_relativo, f) for f in filtri)
+
+
+def scansiona_cartella(cartella, includi=None, escludi=None, interrotta=None):
+    """
+    Percorre ricorsivamente una cartella e restituisce i documenti che soddisfano i filtri.
+
+    Le cartelle escluse non vengono visitate; gli archivi ZIP inclusi vengono
+    espansi nei documenti che contengono. I collegamenti simbolici a cartelle
+    non vengono seguiti, per evitare cicli.
+
+    Args:
+        cartella (str): Cartella da cui iniziare la scansione
+        includi (list, optional): Glob dei file da includere (predefiniti se None)
+        escludi (list, optional): Glob di file o cartelle da escludere
+        interrotta (callable, optional): Funzione che restituisce True per fermare la scansione
+
+    Yields:
+        str: Percorso del documento o percorso virtuale del membro ZIP
+    """
+    includi = dividi_filtri(FILTRI_INCLUSIONE_PREDEFINITI) if includi is None else includi
+    escludi = escludi or []
+    da_visitare = [cartella]
+
+    while da_visitare:
+        if interrotta is not None and interrotta():
+            return
+        corrente = da_visitare.pop()
+        try:
+            with os.scandir(corrente) as voci:
+                # Ordine stabile all'interno di ogni cartella
+                voci = sorted(voci, key=lambda v: v.name.lower())
+        except OSError as e:
+            logging.warning("Impossibile leggere la cartella %s: %s", corrente, e)
+            continue
+
+        sottocartelle = []
+        for voce in voci:
+            nome = voce.name.lower()
+            try:
+                is_cartella = voce.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            # Percorso relativo nella forma "/sotto/cartella/" o "/sotto/file.pdf",
+            # così un filtro come "*/archivio/*" esclude la cartella a qualsiasi livello
+            relativo = "/" + os.path.relpath(voce.path, cartella).replace(os.sep, "/").lower()
+            if is_cartella:
+                relativo += "/"
+
+            if escludi and _corrisponde(nome, relativo, escludi):
+                continue
+            if is_cartella:
+                sottocartelle.append(voce.path)
+            elif _corrisponde(nome, relativo, includi):
+                if nome.endswith(".zip"):
+                    yield from elenca_documenti_zip(voce.path)
+                else:
+                    yield voce.path
+
+        # Le sottocartelle vengono visitate in ordine alfabetico
+        da_visitare.extend(reversed(sottocartelle))
+
+
+class ScannerCartella(QThread):
+    """
+    Thread che esegue `scansiona_cartella` e consegna i documenti trovati a blocchi.
+
+    Signals:
+        documenti_trovati (list): Blocco di percorsi appena trovati
+        scansione_terminata (int): Numero totale di documenti trovati
+    """
+
+    documenti_trovati = pyqtSignal(list)
+    scansione_terminata = pyqtSignal(int)
+
+    def __init__(self, cartella, includi=None, escludi=None, parent=None):
+        super().__init__(parent)
+        self.cartella = cartella
+        self.includi = includi
+        self.escludi = escludi
+        self._interrotta = False
+
+    def interrompi(self):
+        """Chiede al thread di fermare la scansione il prima possibile."""
+        self._interrotta = True
+
+    def run(self):
+        totale = 0
+        blocco = []
+        ultima_consegna = time.monotonic()
+        inizio = ultima_consegna
+        try:
+            for path in scansiona_cartella(self.cartella, self.includi, self.escludi, lambda: self._interrotta):
+                if self._interrotta:
+                    break
+                blocco.append(path)
+                ora = time.monotonic()
+                if len(blocco) >= DIMENSIONE_BLOCCO or ora - ultima_consegna >= INTERVALLO_BLOCCO:
+                    totale += len(blocco)
+                    self.documenti_trovati.emit(blocco)
+                    blocco = []
+                    ultima_consegna = ora
+        except Exception as e:
+            logging.error("Errore durante la scansione di %s: %s", self.cartella, e)
+        finally:
+            if blocco:
+                totale += len(blocco)
+                self.documenti_trovati.emit(blocco)
+            logging.info("Scansione di %s terminata: %s documenti in %.1fs", self.cartella, totale, time.monotonic() - inizio)
+            self.scansione_terminata.emit(totale)
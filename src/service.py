@@ -0,0 +1,405 @@
+"""
+Servizio HTTP locale per l'estrazione e la rinomina delle fatture.
+
+Permette a programmi esterni (es. l'ERP) di usare InvoiceReader senza avviare
+l'interfaccia grafica per ogni documento. Le estrazioni vengono eseguite da un
+gruppo di processi worker supervisionati (vedi `workers.GruppoEstrattori`),
+avviati una sola volta, che mantengono caricati PyMuPDF, il database dei
+pattern con le regex compilate e il processo della `RegexGuard`. Un documento
+che supera il budget di tempo o fa terminare MuPDF costa solo il proprio
+worker, che viene sostituito, e finisce in quarantena.
+
+Endpoint (risposte in JSON, con il campo "latenza_ms"):
+- GET  /stato: verifica che il servizio sia attivo
+- POST /estrai: estrae denominazione, numero e data di un documento
+- POST /genera-nome: genera il nome del file a partire dai dati della fattura
+- POST /rinomina: estrae i dati e salva il documento con il nuovo nome
+
+Il documento può essere indicato con un corpo JSON {"percorso": "..."} oppure
+inviato direttamente come corpo della richiesta (Content-Type diverso da JSON),
+indicandone il nome con il parametro "nome" nella query string, ad esempio
+`POST /estrai?nome=fattura.pdf`. Gli altri parametri di /rinomina vanno nel
+JSON o, per i documenti inviati, nella query string.
+
+Avvio: python src/service.py [--host 127.0.0.1] [--porta 8765] [--worker 2]
+"""
+
+import os
+import json
+import time
+import uuid
+import logging
+import queue
+import argparse
+import tempfile
+import multiprocessing
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from utils import genera_nome_file, estensione_documento, percorso_destinazione
+from document_source import salva_documento
+from workers import GruppoEstrattori, EstrazioneInterrottaError, estrai_dati, WORKER_PREDEFINITI
+from config import get_impostazioni
+
+HOST_PREDEFINITO = "127.0.0.1"
+PORTA_PREDEFINITA = 8765
+
+# Dimensione massima (in byte) di un documento inviato nel corpo della richiesta
+MAX_BYTE_UPLOAD = get_impostazioni().max_byte_upload
+
+# Dimensione (in byte) dei blocchi con cui viene scartato un corpo non letto
+DIMENSIONE_BLOCCO_SCARTO = 64 * 1024
+
+# Tempo massimo (in secondi) di attesa di un worker libero per una richiesta
+TIMEOUT_RICHIESTA = get_impostazioni().timeout_richiesta
+
+
+class ErroreRichiesta(Exception):
+    """Errore dovuto alla richiesta del client, restituito con il codice HTTP indicato."""
+
+    def __init__(self, messaggio, codice=400):
+        super().__init__(messaggio)
+        self.codice = codice
+
+
+def _rinomina(path, parametri_nome, usa_cartelle, cartella_base):
+    """
+    Estrae i dati di un documento e lo salva con il nuovo nome, nel processo worker.
+
+    Returns:
+        dict: Come `workers.estrai_dati`, più "nuovo_percorso" (None se i dati non sono completi)
+    """
+    risultato = estrai_dati(path)
+    risultato["nuovo_percorso"] = None
+    if not all([risultato["denominazione"], risultato["numero_fattura"], risultato["data_fattura"]]):
+        return risultato
+
+    nuovo_nome = genera_nome_file(
+        numero_fattura=risultato["numero_fattura"], data_fattura=risultato["data_fattura"],
+        denominazione=risultato["denominazione"], estensione=estensione_documento(path), **parametri_nome
+    )
+    nuovo_percorso = percorso_destinazione(path, nuovo_nome, risultato["denominazione"], usa_cartelle, cartella_base)
+    salva_documento(path, nuovo_percorso)
+    logging.info("File rinominato dal servizio: %s -> %s", path, nuovo_percorso)
+    risultato["nuovo_percorso"] = nuovo_percorso
+    return risultato
+
+
+def _leggi_booleano(valore):
+    """Interpreta un valore JSON o della query string come booleano."""
+    if isinstance(valore, str):
+        return valore.strip().lower() in ("1", "true", "si", "sì", "yes")
+    return bool(valore)
+
+
+def _parametri_nome(dati):
+    """
+    Legge i parametri di `genera_nome_file` dalla richiesta.
+
+    Raises:
+        ErroreRichiesta: Se manca l'anno in modalità non generica
+    """
+    generico = _leggi_booleano(dati.get("generico", False))
+    parametri = {
+        "tipologia": dati.get("tipologia") or "FATT",
+        "stagione": dati.get("stagione") or "",
+        "anno": str(dati.get("anno") or ""),
+        "genere": dati.get("genere") or "",
+        "generico": generico,
+    }
+    if not generico and not parametri["anno"]:
+        raise ErroreRichiesta("Il parametro 'anno' è obbligatorio se 'generico' non è attivo")
+    return parametri
+
+
+class ServizioEstrazione:
+    """
+    Servizio HTTP con un gruppo di worker di estrazione già avviati.
+
+    Attributes:
+        worker (int): Numero di processi worker
+        httpd (ThreadingHTTPServer): Server HTTP, disponibile dopo `avvia`
+    """
+
+    def __init__(self, host=HOST_PREDEFINITO, porta=PORTA_PREDEFINITA, worker=WORKER_PREDEFINITI):
+        self.host = host
+        self.porta = porta
+        self.worker = worker
+        self.httpd = None
+        self._estrattori = None
+
+    def avvia(self):
+        """
+        Avvia i worker, attende che siano pronti e apre il socket del server.
+
+        Returns:
+            tuple: (host, porta) effettivamente in ascolto
+        """
+        self._estrattori = GruppoEstrattori(self.worker)
+        inizio = time.perf_counter()
+        self._estrattori.avvia()
+        logging.info("%d worker avviati in %.0f ms", self.worker, (time.perf_counter() - inizio) * 1000)
+
+        self.httpd = ThreadingHTTPServer((self.host, self.porta), GestoreRichieste)
+        self.httpd.daemon_threads = True
+        self.httpd.servizio = self
+        return self.httpd.server_address[:2]
+
+    def serve_forever(self):
+        """Gestisce le richieste fino alla chiamata di `chiudi`."""
+        self.httpd.serve_forever()
+
+    def chiudi(self):
+        """Arresta il server HTTP e i worker."""
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+        if self._estrattori is not None:
+            self._estrattori.chiudi()
+
+    def esegui(self, funzione, path, *args, temporaneo=False):
+        """
+        Esegue funzione(path, *args) in un worker e ne attende il risultato.
+
+        Args:
+            temporaneo (bool): Se True il documento è un file temporaneo, che non
+                viene messo in quarantena
+
+        Raises:
+            ErroreRichiesta: Se il documento è in quarantena (422), nessun worker si libera
+                entro TIMEOUT_RICHIESTA (503) o l'elaborazione viene interrotta (504)
+        """
+        if not temporaneo and self._estrattori.quarantena.contiene(path):
+            raise ErroreRichiesta(f"Documento in quarantena: {path}", 422)
+        try:
+            return self._estrattori.esegui(funzione, path, *args, attesa_massima=TIMEOUT_RICHIESTA,
+                                           usa_quarantena=not temporaneo)
+        except queue.Empty:
+            raise ErroreRichiesta("Nessun worker disponibile, riprovare più tardi", 503)
+        except EstrazioneInterrottaError as e:
+            raise ErroreRichiesta(str(e), 504)
+
+
+class GestoreRichieste(BaseHTTPRequestHandler):
+    """
+    Gestisce le richieste HTTP del servizio di estrazione.
+    """
+
+    server_version = "InvoiceReader"
+    protocol_version = "HTTP/1.1"
+
+    def parse_request(self):
+        # Ogni richiesta della connessione parte con il corpo ancora da leggere
+        self._corpo_letto = False
+        return super().parse_request()
+
+    def do_GET(self):
+        percorso = urlparse(self.path).path
+        if percorso == "/stato":
+            self._rispondi(time.perf_counter(), 200, {"stato": "ok", "worker": self.server.servizio.worker})
+        else:
+            self._rispondi(time.perf_counter(), 404, {"errore": f"Endpoint non trovato: {percorso}"})
+
+    def do_POST(self):
+        inizio = time.perf_counter()
+        url = urlparse(self.path)
+        gestori = {
+            "/estrai": self._estrai,
+            "/genera-nome": self._genera_nome,
+            "/rinomina": self._rinomina,
+        }
+        gestore = gestori.get(url.path)
+        try:
+            if gestore is None:
+                raise ErroreRichiesta(f"Endpoint non trovato: {url.path}", 404)
+            query = {chiave: valori[-1] for chiave, valori in parse_qs(url.query).items()}
+            self._rispondi(inizio, 200, gestore(query))
+        except ErroreRichiesta as e:
+            self._rispondi(inizio, e.codice, {"errore": str(e)})
+        except Exception as e:
+            logging.error("Errore durante la richiesta %s: %s", self.path, e, exc_info=True)
+            self._rispondi(inizio, 500, {"errore": str(e)})
+
+    def _lunghezza_corpo(self):
+        """
+        Restituisce la lunghezza dichiarata del corpo della richiesta.
+
+        Raises:
+            ErroreRichiesta: Se l'intestazione Content-Length non è valida
+        """
+        try:
+            lunghezza = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            lunghezza = -1
+        if lunghezza < 0:
+            # Senza una lunghezza valida il corpo non può essere separato dalla richiesta successiva
+            self.close_connection = True
+            raise ErroreRichiesta("Intestazione Content-Length non valida")
+        return lunghezza
+
+    def _leggi_corpo(self):
+        """Legge il corpo della richiesta rispettando MAX_BYTE_UPLOAD."""
+        lunghezza = self._lunghezza_corpo()
+        if lunghezza > MAX_BYTE_UPLOAD:
+            raise ErroreRichiesta(f"Documento troppo grande (massimo {MAX_BYTE_UPLOAD} byte)", 413)
+        self._corpo_letto = True
+        return self.rfile.read(lunghezza)
+
+    def _scarta_corpo(self):
+        """
+        Legge e scarta il corpo non ancora letto, perché sulla connessione
+        persistente non venga interpretato come la richiesta successiva.
+
+        Un corpo più grande di MAX_BYTE_UPLOAD (o di lunghezza non valida) non
+        viene letto: la connessione viene chiusa dopo la risposta.
+        """
+        if self._corpo_letto or self.close_connection:
+            return
+        self._corpo_letto = True
+        try:
+            lunghezza = self._lunghezza_corpo()
+        except ErroreRichiesta:
+            return
+        if lunghezza > MAX_BYTE_UPLOAD:
+            self.close_connection = True
+            return
+        while lunghezza > 0:
+            blocco = self.rfile.read(min(lunghezza, DIMENSIONE_BLOCCO_SCARTO))
+            if not blocco:
+                self.close_connection = True
+                return
+            lunghezza -= len(blocco)
+
+    def _is_json(self):
+        return (self.headers.get("Content-Type") or "").split(";")[0].strip() == "application/json"
+
+    def _leggi_json(self):
+        try:
+            dati = json.loads(self._leggi_corpo() or b"{}")
+        except ValueError as e:
+            raise ErroreRichiesta(f"JSON non valido: {str(e)}")
+        if not isinstance(dati, dict):
+            raise ErroreRichiesta("Il corpo JSON deve essere un oggetto")
+        return dati
+
+    def _salva_upload(self, query, cartella=None):
+        """
+        Scrive su disco il documento inviato nel corpo della richiesta.
+
+        Il nome temporaneo mantiene l'estensione del nome indicato, da cui
+        dipende il tipo di estrazione.
+
+        Returns:
+            str: Percorso del file temporaneo
+        """
+        nome = os.path.basename(query.get("nome") or "documento.pdf")
+        dati = self._leggi_corpo()
+        if not dati:
+            raise ErroreRichiesta("Nessun documento nel corpo della richiesta")
+        cartella = cartella or tempfile.gettempdir()
+        path = os.path.join(cartella, f".invoicereader_{uuid.uuid4().hex}_{nome}")
+        with open(path, "xb") as f:
+            f.write(dati)
+        return path
+
+    def _percorso_esistente(self, dati):
+        path = dati.get("percorso")
+        if not path:
+            raise ErroreRichiesta("Indicare 'percorso' nel JSON oppure inviare il documento nel corpo")
+        if not os.path.isfile(path):
+            raise ErroreRichiesta(f"File non trovato: {path}", 404)
+        return path
+
+    def _estrai(self, query):
+        if self._is_json():
+            return self.server.servizio.esegui(estrai_dati, self._percorso_esistente(self._leggi_json()))
+
+        path = self._salva_upload(query)
+        try:
+            return self.server.servizio.esegui(estrai_dati, path, temporaneo=True)
+        finally:
+            os.remove(path)
+
+    def _genera_nome(self, query):
+        dati = self._leggi_json() if self._is_json() else query
+        mancanti = [c for c in ("denominazione", "numero_fattura", "data_fattura") if not dati.get(c)]
+        if mancanti:
+            raise ErroreRichiesta(f"Parametri mancanti: {', '.join(mancanti)}")
+        nome = genera_nome_file(
+            numero_fattura=dati["numero_fattura"], data_fattura=dati["data_fattura"],
+            denominazione=dati["denominazione"], estensione=dati.get("estensione") or ".pdf",
+            **_parametri_nome(dati)
+        )
+        return {"nome": nome}
+
+    def _rinomina(self, query):
+        if self._is_json():
+            dati = self._leggi_json()
+            path = self._percorso_esistente(dati)
+            temporaneo = False
+        else:
+            dati = query
+            # I documenti inviati vengono scritti direttamente nella cartella di destinazione
+            if not dati.get("destinazione") or not os.path.isdir(dati["destinazione"]):
+                raise ErroreRichiesta("Per i documenti inviati indicare una cartella 'destinazione' esistente")
+            path = self._salva_upload(query, dati["destinazione"])
+            temporaneo = True
+
+        try:
+            risultato = self.server.servizio.esegui(
+                _rinomina, path, _parametri_nome(dati), _leggi_booleano(dati.get("usa_cartelle", False)),
+                dati.get("destinazione"), temporaneo=temporaneo
+            )
+        except BaseException:
+            if temporaneo and os.path.exists(path):
+                os.remove(path)
+            raise
+        if temporaneo and risultato["nuovo_percorso"] is None:
+            os.remove(path)
+        return risultato
+
+    def _rispondi(self, inizio, codice, risposta):
+        self._scarta_corpo()
+        latenza_ms = round((time.perf_counter() - inizio) * 1000, 1)
+        risposta["latenza_ms"] = latenza_ms
+        corpo = json.dumps(risposta, ensure_ascii=False).encode("utf-8")
+        self.send_response(codice)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.send_header("X-Latenza-Ms", str(latenza_ms))
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, format, *args):
+        logging.info("%s - " + format, self.address_string(), *args)
+
+
+def main():
+    """Avvia il servizio dalla riga di comando."""
+    parser = argparse.ArgumentParser(description="Servizio HTTP locale di InvoiceReader")
+    parser.add_argument("--host", default=HOST_PREDEFINITO, help="Indirizzo di ascolto (predefinito: solo locale)")
+    parser.add_argument("--porta", type=int, default=PORTA_PREDEFINITA, help="Porta di ascolto")
+    parser.add_argument("--worker", type=int, default=WORKER_PREDEFINITI, help="Numero di processi worker")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=get_impostazioni().livello_log_numerico,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+    servizio = ServizioEstrazione(args.host, args.porta, max(1, args.worker))
+    host, porta = servizio.avvia()
+    logging.info("Servizio InvoiceReader in ascolto su http://%s:%d", host, porta)
+    try:
+        servizio.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servizio.chiudi()
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,142 @@
+"""
+Divisione dei PDF che contengono più fatture concatenate.
+
+Le stazioni di scansione producono spesso un unico PDF per ogni risma di fatture.
+Le pagine vengono lette una sola volta e i confini tra le fatture vengono
+riconosciuti dai pattern trovati su ogni pagina: una nuova denominazione o una
+nuova coppia numero/data indicano l'inizio di una nuova fattura.
+
+L'interfaccia esegue la divisione nel processo di estrazione supervisionato
+(vedi `workers.EstrattoreIsolato.esegui`) con `trova_fatture_documento` e
+`salva_parti_documento`: un PDF che blocca MuPDF non blocca l'interfaccia.
+"""
+
+import logging
+import fitz  # PyMuPDF
+from utils import estrai_info_da_testo, apri_pdf
+
+
+class ParteFattura:
+    """
+    Intervallo di pagine che compone una singola fattura del PDF.
+
+    Attributes:
+        prima_pagina (int): Indice della prima pagina (da 0)
+        ultima_pagina (int): Indice dell'ultima pagina (inclusa)
+        denominazione (str): Fornitore riconosciuto, oppure None
+        numero_fattura (str): Numero fattura riconosciuto, oppure None
+        data_fattura (str): Data fattura riconosciuta, oppure None
+    """
+
+    def __init__(self, pagina):
+        self.prima_pagina = pagina
+        self.ultima_pagina = pagina
+        self.denominazione = None
+        self.numero_fattura = None
+        self.data_fattura = None
+
+    def is_completa(self):
+        """Indica se sono stati riconosciuti tutti i dati necessari alla rinomina."""
+        return all([self.denominazione, self.numero_fattura, self.data_fattura])
+
+
+def _inizia_nuova_fattura(parte, denominazione, numero_fattura, data_fattura):
+    """
+    Indica se i dati trovati su una pagina appartengono a una fattura diversa da quella corrente.
+
+    Una pagina con numero e data diversi da quelli della fattura corrente apre
+    sempre una nuova fattura, anche se la fattura corrente non ne ha: due
+    fatture dello stesso fornitore, la prima senza numero riconosciuto, non
+    vengono unite. Lo stesso vale per una denominazione diversa.
+    """
+    if numero_fattura and (numero_fattura, data_fattura) != (parte.numero_fattura, parte.data_fattura):
+        return True
+    if denominazione and parte.denominazione and denominazione != parte.denominazione:
+        return True
+    return False
+
+
+def trova_fatture(pdf):
+    """
+    Individua le fatture contenute in un PDF leggendo ogni pagina una sola volta.
+
+    Le pagine senza dati riconoscibili, o con gli stessi dati della fattura
+    corrente, vengono attribuite alla fattura precedente; una denominazione
+    mancante viene completata con quella delle pagine successive.
+
+    Args:
+        pdf (fitz.Document): Documento PDF già aperto
+
+    Returns:
+        list: Lista di ParteFattura in ordine di pagina
+    """
+    parti = []
+    for indice, pagina in enumerate(pdf):
+        denominazione, numero_fattura, data_fattura = estrai_info_da_testo(pagina.get_text())
+
+        if not parti or _inizia_nuova_fattura(parti[-1], denominazione, numero_fattura, data_fattura):
+            parti.append(ParteFattura(indice))
+        parte = parti[-1]
+        parte.ultima_pagina = indice
+
+        if denominazione and not parte.denominazione:
+            parte.denominazione = denominazione
+        if numero_fattura:
+            parte.numero_fattura = numero_fattura
+            parte.data_fattura = data_fattura
+
+    logging.info("Trovate %d fatture in %d pagine", len(parti), len(pdf))
+    return parti
+
+
+def salva_parte(pdf, parte, destinazione):
+    """
+    Salva le pagine di una fattura in un nuovo PDF.
+
+    Args:
+        pdf (fitz.Document): Documento sorgente già aperto
+        parte (ParteFattura): Intervallo di pagine da salvare
+        destinazione (str): Percorso del file da creare
+    """
+    with fitz.open() as nuovo:
+        nuovo.insert_pdf(pdf, from_page=parte.prima_pagina, to_page=parte.ultima_pagina)
+        nuovo.save(destinazione, garbage=3, deflate=True)
+
+
+def trova_fatture_documento(path):
+    """
+    Apre un documento e individua le fatture che contiene (vedi `trova_fatture`).
+
+    Args:
+        path (str): Percorso del file o percorso virtuale del membro ZIP
+
+    Returns:
+        list: Lista di ParteFattura in ordine di pagina
+    """
+    with apri_pdf(path) as pdf:
+        return trova_fatture(pdf)
+
+
+def salva_parti_documento(path, parti):
+    """
+    Salva ogni fattura di un documento nel proprio file, aprendo il documento una sola volta.
+
+    Args:
+        path (str): Percorso del file o percorso virtuale del membro ZIP
+        parti (list): Coppie (ParteFattura, destinazione)
+
+    Returns:
+        list: Per ogni parte, None se è stata salvata oppure la descrizione dell'errore
+    """
+    errori = []
+    with apri_pdf(path) as pdf:
+        for parte, destinazione in parti:
+            try:
+                salva_parte(pdf, parte, destinazione)
+                logging.info("Fattura (pagine %d-%d) salvata: %s", parte.prima_pagina + 1, parte.ultima_pagina + 1, destinazione)
+                errori.append(None)
+            except Exception as e:
+                logging.error("Errore durante il salvataggio delle pagine %d-%d di %s: %s",
+                              parte.prima_pagina + 1, parte.ultima_pagina + 1, path, e)
+                errori.append(str(e))
+    return errori
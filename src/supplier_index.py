@@ -0,0 +1,205 @@
+"""
+Normalizzazione dei nomi dei fornitori e ricerca del fornitore già noto.
+
+La denominazione letta dai documenti varia da una fattura all'altra: spazi,
+punteggiatura della forma giuridica ("S.R.L.", "S.r.l.", "SRL"), accenti o
+testo aggiuntivo sulla stessa riga ("ACME SRL - Via Roma 1"). Ogni nome viene
+ridotto a una chiave canonica di token; l'indice trova il fornitore con la
+stessa chiave, anche senza forma giuridica ("ROSSI MARIO" e "Rossi Mario S.r.l."),
+oppure suggerisce, tra quelli che condividono almeno un token, il più simile.
+Un fornitore simile è solo un suggerimento: "ALFA 2 SRL" e "ALFA 3 SRL" sono
+aziende diverse, quindi deve essere l'utente a confermare che si tratta dello
+stesso fornitore.
+"""
+
+import re
+import difflib
+import unicodedata
+
+# Forme giuridiche riconosciute, dopo la rimozione della punteggiatura
+FORME_GIURIDICHE = {
+    "SRL": "SRL", "SRLS": "SRLS", "SPA": "SPA", "SAS": "SAS", "SNC": "SNC", "SAPA": "SAPA",
+    "SS": "SS", "SCARL": "SCARL", "SCRL": "SCARL", "COOP": "COOP", "SCPA": "SCPA",
+    "GMBH": "GMBH", "AG": "AG", "LTD": "LTD", "LLC": "LLC", "INC": "INC", "SA": "SA",
+    "SARL": "SARL", "SL": "SL", "BV": "BV", "NV": "NV",
+}
+
+# Numero massimo di token considerati quando il nome non contiene una forma giuridica
+MAX_TOKEN_CHIAVE = 6
+
+# Somiglianza minima (0-1) tra le chiavi perché due nomi indichino lo stesso fornitore
+SOGLIA_SIMILARITA = 0.88
+
+# Oltre questo numero di fornitori un token è troppo comune per generare candidati
+MAX_CANDIDATI_TOKEN = 200
+
+_RE_NON_ALFANUMERICI = re.compile(r"[^A-Z0-9 ]+")
+
+_FORME_CANONICHE = frozenset(FORME_GIURIDICHE.values())
+
+
+def _token(nome):
+    """Divide un nome in token maiuscoli senza accenti né punteggiatura."""
+    nome = unicodedata.normalize("NFKD", nome).encode("ascii", "ignore").decode("ascii").upper()
+    # Il punto unisce le sigle ("S.R.L." -> "SRL"), gli altri segni separano le parole
+    nome = nome.replace(".", "")
+    nome = _RE_NON_ALFANUMERICI.sub(" ", nome)
+    token = []
+    sigla = ""
+    for parola in nome.split():
+        # Lettere isolate consecutive formano una sigla ("S R L" -> "SRL")
+        if len(parola) == 1 and parola.isalpha():
+            sigla += parola
+            continue
+        if sigla:
+            token.append(sigla)
+            sigla = ""
+        token.append(parola)
+    if sigla:
+        token.append(sigla)
+    return token
+
+
+def chiave_fornitore(nome):
+    """
+    Calcola la chiave canonica di un nome di fornitore.
+
+    Il testo che segue la forma giuridica viene ignorato, così
+    "Acme S.r.l. - Via Roma 1" e "ACME SRL" hanno la stessa chiave.
+
+    Args:
+        nome (str): Denominazione del fornitore
+
+    Returns:
+        str: Token normalizzati separati da uno spazio (stringa vuota se il nome è vuoto)
+    """
+    token = []
+    for parola in _token(nome or ""):
+        forma = FORME_GIURIDICHE.get(parola)
+        if forma is not None and token:
+            token.append(forma)
+            break
+        token.append(parola)
+    else:
+        token = token[:MAX_TOKEN_CHIAVE]
+    return " ".join(token)
+
+
+def _separa_forma(chiave):
+    """Divide una chiave canonica in (nome senza forma giuridica, forma giuridica o None)."""
+    token = chiave.split()
+    if len(token) > 1 and token[-1] in _FORME_CANONICHE:
+        return " ".join(token[:-1]), token[-1]
+    return chiave, None
+
+
+def chiavi_equivalenti(chiave_a, chiave_b):
+    """
+    Indica se due chiavi canoniche indicano lo stesso fornitore.
+
+    Le chiavi sono equivalenti se coincidono, oppure se differiscono solo per
+    la forma giuridica presente in una delle due ("ROSSI MARIO" e
+    "ROSSI MARIO SRL"); "ACME SRL" e "ACME SPA" restano fornitori diversi.
+
+    Args:
+        chiave_a (str): Chiave canonica (vedi `chiave_fornitore`)
+        chiave_b (str): Chiave canonica
+
+    Returns:
+        bool: True se le chiavi sono equivalenti
+    """
+    if chiave_a == chiave_b:
+        return bool(chiave_a)
+    nome_a, forma_a = _separa_forma(chiave_a)
+    nome_b, forma_b = _separa_forma(chiave_b)
+    return nome_a == nome_b and (forma_a is None or forma_b is None)
+
+
+def _numeri(chiave):
+    """Restituisce i token numerici di una chiave (numeri civici, sigle numerate)."""
+    return sorted(token for token in chiave.split() if any(c.isdigit() for c in token))
+
+
+class IndiceFornitori:
+    """
+    Indice dei fornitori noti per chiave canonica, alias e token.
+
+    Attributes:
+        nomi (dict): Chiave canonica -> nome del fornitore come salvato nel database
+    """
+
+    def __init__(self, fornitori, alias=None):
+        """
+        Args:
+            fornitori (iterable): Nomi dei fornitori noti
+            alias (dict, optional): Chiave canonica di un alias -> nome del fornitore
+        """
+        self.nomi = {}
+        self._per_token = {}
+        self._per_nome = {}
+        for nome in fornitori:
+            chiave = chiave_fornitore(nome)
+            if chiave and chiave not in self.nomi:
+                self.nomi[chiave] = nome
+                for token in chiave.split():
+                    self._per_token.setdefault(token, set()).add(chiave)
+                self._per_nome.setdefault(_separa_forma(chiave)[0], []).append(chiave)
+        self._alias = dict(alias or {})
+
+    def trova(self, nome):
+        """
+        Cerca il fornitore noto corrispondente a un nome.
+
+        Una corrispondenza è esatta se la chiave canonica coincide con quella di
+        un fornitore o di un alias confermato, oppure se è equivalente (vedi
+        `chiavi_equivalenti`) a quella di un solo fornitore. Un fornitore
+        trovato per somiglianza va confermato prima di essere usato.
+
+        Args:
+            nome (str): Denominazione letta dal documento
+
+        Returns:
+            tuple: (nome del fornitore, esatto) dove esatto è False se il fornitore è
+                   solo simile; (None, False) se non trovato
+        """
+        chiave = chiave_fornitore(nome)
+        if not chiave:
+            return None, False
+        if chiave in self.nomi:
+            return self.nomi[chiave], True
+        if chiave in self._alias:
+            return self._alias[chiave], True
+        equivalenti = [candidato for candidato in self._per_nome.get(_separa_forma(chiave)[0], ())
+                       if chiavi_equivalenti(chiave, candidato)]
+        if len(equivalenti) == 1:
+            return self.nomi[equivalenti[0]], True
+
+        # Candidati: solo i fornitori che condividono almeno un token significativo,
+        # dal più raro. Le forme giuridiche e i token comuni a più di MAX_CANDIDATI_TOKEN
+        # fornitori ("ITALIA", "SERVIZI") vengono ignorati anche se sono gli unici in
+        # comune: un nome fatto solo di token comuni non ha suggerimenti
+        liste = sorted(
+            (self._per_token[token] for token in chiave.split()
+             if token in self._per_token and token not in FORME_GIURIDICHE),
+            key=len
+        )
+        candidati = set()
+        for lista in liste:
+            if len(lista) > MAX_CANDIDATI_TOKEN:
+                break
+            candidati.update(lista)
+        # Nomi che differiscono per un numero ("ALFA 2", "ALFA 3") non sono mai lo stesso fornitore
+        numeri = _numeri(chiave)
+        migliore, punteggio = None, SOGLIA_SIMILARITA
+        for candidato in candidati:
+            if _numeri(candidato) != numeri:
+                continue
+            confronto = difflib.SequenceMatcher(None, chiave, candidato)
+            if confronto.real_quick_ratio() < punteggio or confronto.quick_ratio() < punteggio:
+                continue
+            ratio = confronto.ratio()
+            if ratio >= punteggio:
+                migliore, punteggio = candidato, ratio
+        if migliore is None:
+            return None, False
+        return self.nomi[migliore], False
@@ -0,0 +1,255 @@
+"""
+Cache del testo estratto dai PDF.
+
+Estrarre il testo con MuPDF è la parte più costosa dell'elaborazione di un
+documento, e lo stesso documento viene letto più volte: simulazione ed
+esecuzione, nuova estrazione dopo la correzione di un pattern, verifica di un
+pattern su tutte le fatture già viste. Il testo delle pagine lette viene quindi
+conservato, compresso con zlib, insieme agli offset di inizio di ogni pagina e
+all'impronta del layout, in un file per documento nella cartella "testi" dei dati.
+
+La chiave è lo SHA-256 del contenuto del documento: una fattura rinominata,
+spostata o letta da un archivio ZIP ritrova lo stesso testo, mentre un file
+modificato ne ottiene uno nuovo. Ogni file viene scritto in modo atomico e il
+suo contenuto dipende solo dal documento, quindi più processi possono
+scrivere la stessa voce senza lock.
+"""
+
+import os
+import json
+import zlib
+import hashlib
+import logging
+import tempfile
+from dataclasses import dataclass, field
+from datetime import datetime
+from config import get_impostazioni
+
+# Versione del formato delle voci; le voci di altre versioni vengono ignorate
+VERSIONE_CACHE = 1
+
+# Estensione dei file della cache
+ESTENSIONE_VOCE = ".json.z"
+
+# Livello di compressione zlib (il testo delle fatture si riduce a circa un quinto)
+LIVELLO_COMPRESSIONE = 6
+
+
+def hash_contenuto(dati):
+    """
+    Calcola la chiave della cache per il contenuto di un documento.
+
+    Args:
+        dati (bytes): Contenuto del documento
+
+    Returns:
+        str: SHA-256 esadecimale
+    """
+    return hashlib.sha256(dati).hexdigest()
+
+
+@dataclass
+class TestoDocumento:
+    """
+    Testo delle prime pagine di un documento, come conservato nella cache.
+
+    Attributes:
+        chiave (str): SHA-256 del contenuto del documento
+        testo (str): Testo delle pagine lette, concatenate
+        inizio_pagine (list): Offset nel testo dell'inizio di ogni pagina letta
+        pagine_totali (int): Pagine del documento
+        impronta (str): Impronta del layout (vedi `fingerprint.calcola_impronta`)
+        nome (str): Ultimo percorso da cui il documento è stato letto
+        creato (str): Data e ora dell'estrazione in formato ISO
+    """
+    chiave: str
+    testo: str
+    inizio_pagine: list = field(default_factory=list)
+    pagine_totali: int = 0
+    impronta: str = None
+    nome: str = None
+    creato: str = None
+
+    @property
+    def pagine_lette(self):
+        """int: Numero di pagine di cui è conservato il testo."""
+        return len(self.inizio_pagine)
+
+    def pagina(self, numero):
+        """
+        Restituisce il testo di una pagina.
+
+        Args:
+            numero (int): Indice della pagina, a partire da 0
+
+        Raises:
+            IndexError: Se il testo della pagina non è conservato
+        """
+        inizio = self.inizio_pagine[numero]
+        fine = self.inizio_pagine[numero + 1] if numero + 1 < len(self.inizio_pagine) else len(self.testo)
+        return self.testo[inizio:fine]
+
+    def prime_pagine(self, numero):
+        """
+        Restituisce il testo delle prime pagine, come se fossero state lette solo quelle.
+
+        Args:
+            numero (int): Numero di pagine (0 = tutte quelle conservate)
+        """
+        if not numero or numero >= len(self.inizio_pagine):
+            return self.testo
+        return self.testo[:self.inizio_pagine[numero]]
+
+
+class CacheTesti:
+    """
+    Cache su disco dei testi estratti, un file per documento.
+
+    I file sono suddivisi in sottocartelle per i primi due caratteri della
+    chiave, per non avere decine di migliaia di file in un'unica cartella.
+
+    Attributes:
+        cartella (str): Cartella della cache
+        sola_lettura (bool): Se True, `scrivi` non salva nuove voci (ad esempio durante una simulazione)
+    """
+
+    def __init__(self, cartella=None, sola_lettura=False):
+        """
+        Args:
+            cartella (str, optional): Cartella della cache; predefinita "testi" nella cartella dei dati
+            sola_lettura (bool, optional): Se True, le voci vengono solo lette
+        """
+        self.cartella = cartella or os.path.join(get_impostazioni().cartella_dati, "testi")
+        self.sola_lettura = sola_lettura
+
+    def _percorso(self, chiave):
+        """Restituisce il file della voce con la chiave indicata."""
+        return os.path.join(self.cartella, chiave[:2], chiave + ESTENSIONE_VOCE)
+
+    def leggi(self, chiave, max_pagine=0):
+        """
+        Legge il testo di un documento dalla cache.
+
+        Args:
+            chiave (str): SHA-256 del contenuto (vedi `hash_contenuto`)
+            max_pagine (int): Pagine richieste (0 = tutte); se la voce ne contiene
+                meno di quelle richieste viene considerata assente
+
+        Returns:
+            TestoDocumento: Testo limitato alle pagine richieste, oppure None se non disponibile
+        """
+        try:
+            with open(self._percorso(chiave), 'rb') as f:
+                dati = json.loads(zlib.decompress(f.read()).decode('utf-8'))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, zlib.error) as e:
+            logging.warning("Voce della cache dei testi non leggibile %s: %s", chiave, e)
+            return None
+        if dati.get("versione") != VERSIONE_CACHE:
+            return None
+
+        voce = TestoDocumento(
+            chiave=chiave,
+            testo=dati["testo"],
+            inizio_pagine=dati["inizio_pagine"],
+            pagine_totali=dati["pagine_totali"],
+            impronta=dati.get("impronta"),
+            nome=dati.get("nome"),
+            creato=dati.get("creato"),
+        )
+        richieste = min(max_pagine or voce.pagine_totali, voce.pagine_totali)
+        if voce.pagine_lette < richieste:
+            # Estratta con un limite di pagine più basso di quello attuale
+            return None
+        if richieste < voce.pagine_lette:
+            voce.testo = voce.prime_pagine(richieste)
+            voce.inizio_pagine = voce.inizio_pagine[:richieste]
+        return voce
+
+    def scrivi(self, chiave, pagine, pagine_totali, impronta=None, nome=None):
+        """
+        Salva il testo delle pagine lette di un documento.
+
+        Un errore di scrittura viene solo segnalato nel log: la cache non deve
+        mai far fallire un'estrazione.
+
+        Args:
+            chiave (str): SHA-256 del contenuto (vedi `hash_contenuto`)
+            pagine (list): Testo di ogni pagina letta, dalla prima
+            pagine_totali (int): Pagine del documento
+            impronta (str, optional): Impronta del layout
+            nome (str, optional): Percorso da cui il documento è stato letto
+
+        Returns:
+            bool: True se la voce è stata salvata
+        """
+        if self.sola_lettura:
+            return False
+        inizio_pagine = []
+        posizione = 0
+        for testo_pagina in pagine:
+            inizio_pagine.append(posizione)
+            posizione += len(testo_pagina)
+        voce = {
+            "versione": VERSIONE_CACHE,
+            "testo": "".join(pagine),
+            "inizio_pagine": inizio_pagine,
+            "pagine_totali": pagine_totali,
+            "impronta": impronta,
+            "nome": nome,
+            "creato": datetime.now().isoformat(timespec="seconds"),
+        }
+        percorso = self._percorso(chiave)
+        percorso_tmp = None
+        try:
+            os.makedirs(os.path.dirname(percorso), exist_ok=True)
+            compresso = zlib.compress(json.dumps(voce, ensure_ascii=False).encode('utf-8'), LIVELLO_COMPRESSIONE)
+            fd, percorso_tmp = tempfile.mkstemp(prefix=".testo_", suffix=".tmp", dir=os.path.dirname(percorso))
+            with os.fdopen(fd, 'wb') as f:
+                f.write(compresso)
+            os.replace(percorso_tmp, percorso)
+            return True
+        except OSError as e:
+            logging.warning("Impossibile salvare il testo in cache %s: %s", chiave, e)
+            if percorso_tmp and os.path.exists(percorso_tmp):
+                os.remove(percorso_tmp)
+            return False
+
+    def chiavi(self):
+        """
+        Elenca le chiavi dei documenti in cache.
+
+        Yields:
+            str: SHA-256 di ogni documento
+        """
+        try:
+            sottocartelle = sorted(os.scandir(self.cartella), key=lambda voce: voce.name)
+        except FileNotFoundError:
+            return
+        for sottocartella in sottocartelle:
+            if not sottocartella.is_dir():
+                continue
+            for voce in os.scandir(sottocartella.path):
+                if voce.name.endswith(ESTENSIONE_VOCE) and not voce.name.startswith("."):
+                    yield voce.name[:-len(ESTENSIONE_VOCE)]
+
+
+# Cache condivisa da tutto il processo
+_cache_testi = None
+
+
+def get_cache_testi():
+    """
+    Restituisce la cache dei testi del processo, oppure None se è disattivata
+    nelle impostazioni (`cache_testi`).
+
+    Returns:
+        CacheTesti: Cache condivisa
+    """
+    global _cache_testi
+    if not get_impostazioni().cache_testi:
+        return None
+    if _cache_testi is None:
+        _cache_testi = CacheTesti()
+    return _cache_testi
@@ -1,96 +1,484 @@
 import re
 import os
+import time
 import logging
-import traceback
+import threading
+from datetime import datetime
 import fitz  # PyMuPDF
-from pattern_db import PatternDatabase
+from pattern_db import get_pattern_db
+from fatturapa import is_fattura_elettronica, estrai_info_da_fattura_elettronica
+from document_source import esiste_documento, leggi_documento, cartella_documento
+from text_cache import get_cache_testi, hash_contenuto
+from regex_guard import RegexGuard, RegexTimeoutError, RegexWorkerError
+from fingerprint import calcola_impronta
+from supplier_index import chiave_fornitore
+from config import get_impostazioni
 
-# Inizializza il database dei pattern
-pattern_db = PatternDatabase()
+# Database dei pattern condiviso con la GUI
+pattern_db = get_pattern_db()
 
-def estrai_info_da_pdf(path, feedback_mode=False):
+# Esecutore delle regex con budget di tempo per ogni pattern
+regex_guard = RegexGuard()
+
+# Secondi dopo i quali le cartelle dei fornitori di una cartella base vengono rilette
+DURATA_INDICE_CARTELLE = 300
+
+# Cartelle dei fornitori già lette: cartella base -> (istante di lettura, {chiave canonica: percorso})
+_indice_cartelle = {}
+_lock_indice_cartelle = threading.Lock()
+
+
+def _cerca_pattern(pattern, testo):
+    """
+    Cerca un pattern nel testo corrente del `regex_guard` rispettando il budget di tempo.
+
+    I pattern già segnalati vengono ignorati; quelli che non sono espressioni
+    regolari valide vengono segnalati nel database, quelli che superano il
+    budget solo dopo più scadenze (vedi `PatternDatabase.registra_timeout`).
+    Se il processo delle regex non si avvia o termina in modo anomalo il pattern
+    viene saltato, senza essere considerato un timeout.
+    Se nel testo manca uno dei letterali obbligatori del pattern (es. "Fattura N."),
+    la regex non viene eseguita affatto.
+
+    Args:
+        pattern (str): Espressione regolare da cercare
+        testo (str): Testo impostato nel `regex_guard`, usato per il filtro dei letterali
+
+    Returns:
+        tuple: Gruppi catturati, oppure None se il pattern non corrisponde o è stato ignorato
+    """
+    if pattern_db.is_pattern_segnalato(pattern):
+        return None
+    compilato = pattern_db.get_pattern_compilato(pattern)
+    if compilato is None or not compilato.puo_corrispondere(testo):
+        # Pattern non valido (già segnalato) o letterale obbligatorio assente
+        return None
+    try:
+        return regex_guard.cerca(pattern)
+    except RegexTimeoutError:
+        pattern_db.registra_timeout(pattern)
+    except re.error as e:
+        logging.error("Pattern non valido %s: %s", pattern, e)
+        pattern_db.segnala_pattern(pattern, "non valido")
+    except RegexWorkerError as e:
+        # Processo delle regex non avviato o terminato: il pattern viene saltato senza
+        # contarlo tra i timeout, il worker riparte alla ricerca successiva
+        logging.error("Ricerca del pattern %s non eseguita: %s", pattern, e)
+    return None
+
+
+def _cerca_numero_data(pattern, testo):
+    """
+    Cerca numero e data della fattura con un pattern a due gruppi.
+
+    Returns:
+        tuple: (numero_fattura, data_fattura), oppure None se il pattern non li trova
+    """
+    gruppi = _cerca_pattern(pattern, testo)
+    if gruppi and len(gruppi) >= 2 and all(gruppi[:2]):
+        return gruppi[0].strip().replace("/", "-"), gruppi[1].strip()
+    return None
+
+
+def estrai_info_da_testo(testo, dettagli=None, impronta=None):
+    """
+    Applica i pattern del database al testo di una fattura.
+
+    Se l'impronta del layout è già associata a un fornitore, prova subito il
+    pattern specifico di quel fornitore senza passare dai pattern globali.
+    Altrimenti identifica il fornitore con i pattern globali di denominazione, poi
+    prova i pattern specifici del fornitore e infine quelli globali per numero e data.
+
+    Args:
+        testo (str): Testo estratto dal documento
+        dettagli (dict, optional): Se indicato, riceve le chiavi "origine"
+            ("impronta", "pattern_fornitore" o "pattern_globale") e "pattern" con la regex
+            che ha riconosciuto numero e data
+        impronta (str, optional): Impronta del layout (vedi `fingerprint.calcola_impronta`)
+
+    Returns:
+        tuple: (denominazione, numero_fattura, data_fattura); i valori non trovati sono None
+    """
+    # Recepisce le modifiche fatte al file da altre istanze (costa un solo stat)
+    pattern_db.ricarica_se_modificato()
+    testo = testo or ""
+    regex_guard.imposta_testo(testo)
+
+    # Layout già noto: il fornitore è riconosciuto senza scorrere i pattern globali
+    fornitore_noto = pattern_db.get_fornitore_da_impronta(impronta) if impronta else None
+    if fornitore_noto:
+        fornitore_patterns = pattern_db.get_fornitore_patterns(fornitore_noto)
+        if fornitore_patterns and "numero_data" in fornitore_patterns:
+            trovati = _cerca_numero_data(fornitore_patterns["numero_data"], testo)
+            if trovati:
+                logging.info("Fornitore %s riconosciuto dall'impronta del layout", fornitore_noto)
+                if dettagli is not None:
+                    dettagli.update(origine="impronta", pattern=fornitore_patterns["numero_data"])
+                return (fornitore_noto,) + trovati
+
+    # Prima prova a identificare il fornitore usando i pattern globali
+    denominazione = None
+    for compilato in pattern_db.get_pattern_compilati("denominazione"):
+        gruppi = _cerca_pattern(compilato.pattern, testo)
+        if gruppi and gruppi[0]:
+            denominazione = gruppi[0].strip()
+            break
+
+    # Se abbiamo identificato il fornitore, verifica se abbiamo pattern specifici
+    fornitore = pattern_db.risolvi_fornitore(denominazione)
+    if fornitore:
+        # Varianti dello stesso nome ("S.r.l.", spazi, testo in coda) diventano il nome già noto
+        denominazione = fornitore
+        fornitore_patterns = pattern_db.get_fornitore_patterns(fornitore)
+        if fornitore_patterns and "numero_data" in fornitore_patterns:
+            # Usa il pattern specifico del fornitore
+            trovati = _cerca_numero_data(fornitore_patterns["numero_data"], testo)
+            if trovati:
+                logging.info("Estrazione riuscita usando pattern specifico per %s", denominazione)
+                if dettagli is not None:
+                    dettagli.update(origine="pattern_fornitore", pattern=fornitore_patterns["numero_data"])
+                # Il layout di questo documento porterà direttamente al fornitore la prossima volta
+                pattern_db.registra_impronta(impronta, denominazione)
+                return (denominazione,) + trovati
+
+    # Se non abbiamo trovato pattern specifici o non hanno funzionato, usa i pattern globali
+    for compilato in pattern_db.get_pattern_compilati("numero_data"):
+        trovati = _cerca_numero_data(compilato.pattern, testo)
+        if trovati:
+            logging.info("Estrazione riuscita usando pattern globale")
+            if dettagli is not None:
+                dettagli.update(origine="pattern_globale", pattern=compilato.pattern)
+            return (denominazione,) + trovati
+
+    return denominazione, None, None
+
+def apri_pdf(path):
+    """
+    Apre un PDF da disco o da un membro di un archivio ZIP.
+
+    Il contenuto viene letto una sola volta e condiviso tra estrazione e anteprima
+    tramite la cache di `document_source`.
+
+    Args:
+        path (str): Percorso del file o percorso virtuale "archivio.zip::membro"
+
+    Returns:
+        fitz.Document: Documento aperto
+    """
+    return fitz.open(stream=leggi_documento(path), filetype="pdf")
+
+
+def _estrai_da_allegati(pdf, path):
+    """
+    Cerca una fattura elettronica FatturaPA tra i file allegati al PDF.
+
+    Args:
+        pdf (fitz.Document): Documento PDF già aperto
+        path (str): Percorso del PDF, usato per i messaggi di log
+
+    Returns:
+        dict: Campi letti dall'allegato (vedi `estrai_info_da_fattura_elettronica`)
+              se completi, altrimenti None
+    """
+    try:
+        if pdf.embfile_count() == 0:
+            return None
+        for nome in pdf.embfile_names():
+            nome_file = pdf.embfile_info(nome).get("filename") or nome
+            if not is_fattura_elettronica(nome_file):
+                continue
+            info = estrai_info_da_fattura_elettronica(nome_file, dati=pdf.embfile_get(nome))
+            if info and all([info["denominazione"], info["numero_fattura"], info["data_fattura"]]):
+                logging.info("Estrazione riuscita dall'allegato XML %s del PDF: %s", nome_file, path)
+                return info
+    except Exception as e:
+        logging.warning("Errore durante la lettura degli allegati del PDF %s: %s", path, e)
+        logging.debug("Traceback dell'errore:", exc_info=True)
+    return None
+
+
+def estrai_info_da_pdf(path, feedback_mode=False, dettagli=None):
     """
     Estrae informazioni rilevanti da un file PDF di fattura.
 
     Utilizza PyMuPDF per estrarre il testo dal PDF e poi cerca pattern specifici
     per identificare la denominazione del fornitore, il numero della fattura e la data.
     Utilizza un database di pattern che migliora nel tempo.
+    Se il PDF contiene la fattura elettronica XML come allegato, i dati vengono letti
+    da lì senza estrarre il testo delle pagine.
 
     Args:
         path (str): Percorso completo al file PDF da analizzare
         feedback_mode (bool): Se True, restituisce anche il testo estratto per feedback
+        dettagli (dict, optional): Se indicato, riceve l'origine dei dati e il pattern usato
+            (vedi `estrai_info_da_testo`), l'impronta del layout ("impronta"), lo SHA-256
+            del documento ("hash") e se il testo è stato letto dalla cache ("testo_in_cache");
+            per gli allegati XML l'origine è "allegato_xml"
 
     Returns:
         tuple: Una tupla contenente (denominazione, numero_fattura, data_fattura, [testo_estratto])
-               Se l'estrazione fallisce, ritorna (None, None, None, [testo_estratto])
+               Se l'estrazione fallisce, ritorna (None, None, None, [testo_estratto]).
+               Se i dati provengono da un allegato XML il testo estratto è None.
     """
     try:
         # Verifica che il file esista
-        if not os.path.exists(path):
-            logging.error(f"File non trovato: {path}")
+        if not esiste_documento(path):
+            logging.error("File non trovato: %s", path)
             return (None, None, None) if not feedback_mode else (None, None, None, None)
 
         # Verifica che il file sia un PDF
         if not path.lower().endswith('.pdf'):
-            logging.error(f"Il file non è un PDF: {path}")
+            logging.error("Il file non è un PDF: %s", path)
             return (None, None, None) if not feedback_mode else (None, None, None, None)
 
-        # Estrai il testo dal PDF
+        # Estrai il testo dal PDF, o riusa quello già estratto da un documento identico
         try:
-            with fitz.open(path) as pdf:
-                testo = ""
-                for pagina in pdf:
-                    testo += pagina.get_text()
+            dati = leggi_documento(path)
+            chiave = hash_contenuto(dati)
+            cache_testi = get_cache_testi()
+            max_pagine = get_impostazioni().max_pagine_estrazione
+            in_cache = cache_testi.leggi(chiave, max_pagine) if cache_testi is not None else None
+            if in_cache is not None:
+                # I documenti in cache non hanno allegati XML completi: nessun accesso a MuPDF
+                testo, impronta = in_cache.testo, in_cache.impronta
+            else:
+                with fitz.open(stream=dati, filetype="pdf") as pdf:
+                    # Se il PDF contiene la fattura elettronica come allegato, non serve estrarre il testo
+                    info = _estrai_da_allegati(pdf, path)
+                    if info:
+                        if dettagli is not None:
+                            dettagli.update(origine="allegato_xml", pattern=None)
+                        risultato = (info["denominazione"], info["numero_fattura"], info["data_fattura"])
+                        return risultato if not feedback_mode else risultato + (None,)
+
+                    impronta = calcola_impronta(pdf)
+
+                    # Le fatture hanno i dati nelle prime pagine: il limite evita di leggere interi allegati
+                    pagine = [pagina.get_text() for pagina in pdf.pages(0, min(max_pagine or len(pdf), len(pdf)))]
+                    testo = "".join(pagine)
+                    if cache_testi is not None:
+                        cache_testi.scrivi(chiave, pagine, len(pdf), impronta, path)
+            if dettagli is not None:
+                dettagli.update(impronta=impronta, hash=chiave, testo_in_cache=in_cache is not None)
         except fitz.FileDataError:
-            logging.error(f"Errore nel formato del file PDF: {path}")
+            logging.error("Errore nel formato del file PDF: %s", path)
             return (None, None, None) if not feedback_mode else (None, None, None, None)
         except Exception as e:
-            logging.error(f"Errore durante l'estrazione del testo dal PDF {path}: {str(e)}")
-            logging.debug(traceback.format_exc())
+            logging.error("Errore durante l'estrazione del testo dal PDF %s: %s", path, e)
+            logging.debug("Traceback dell'errore:", exc_info=True)
             return (None, None, None) if not feedback_mode else (None, None, None, None)
 
-        # Prima prova a identificare il fornitore usando i pattern globali
-        denominazione = None
-        for pattern in pattern_db.get_global_patterns("denominazione"):
-            match = re.search(pattern, testo)
-            if match:
-                denominazione = match.group(1).strip()
-                break
-
-        # Se abbiamo identificato il fornitore, verifica se abbiamo pattern specifici
-        if denominazione:
-            fornitore_patterns = pattern_db.get_fornitore_patterns(denominazione)
-            if fornitore_patterns and "numero_data" in fornitore_patterns:
-                # Usa il pattern specifico del fornitore
-                match = re.search(fornitore_patterns["numero_data"], testo)
-                if match:
-                    numero_fattura = match.group(1).strip().replace("/", "-")
-                    data_fattura = match.group(2).strip()
-                    logging.info(f"Estrazione riuscita usando pattern specifico per {denominazione}")
-                    return (denominazione, numero_fattura, data_fattura) if not feedback_mode else (denominazione, numero_fattura, data_fattura, testo)
-
-        # Se non abbiamo trovato pattern specifici o non hanno funzionato, usa i pattern globali
-        for pattern in pattern_db.get_global_patterns("numero_data"):
-            match = re.search(pattern, testo)
-            if match:
-                numero_fattura = match.group(1).strip().replace("/", "-")
-                data_fattura = match.group(2).strip()
-                logging.info(f"Estrazione riuscita usando pattern globale")
-                return (denominazione, numero_fattura, data_fattura) if not feedback_mode else (denominazione, numero_fattura, data_fattura, testo)
+        denominazione, numero_fattura, data_fattura = estrai_info_da_testo(testo, dettagli, impronta)
+        if numero_fattura and data_fattura:
+            return (denominazione, numero_fattura, data_fattura) if not feedback_mode else (denominazione, numero_fattura, data_fattura, testo)
 
         # Se siamo arrivati qui, l'estrazione è fallita
-        logging.warning(f"Non è stato possibile estrarre tutte le informazioni dal PDF: {path}")
-        logging.debug(f"Testo estratto: {testo[:500]}...")  # Log dei primi 500 caratteri
+        logging.warning("Non è stato possibile estrarre tutte le informazioni dal PDF: %s", path)
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("Testo estratto: %s...", testo[:get_impostazioni().caratteri_testo_debug])
         return (None, None, None) if not feedback_mode else (None, None, None, testo)
 
     except Exception as e:
         # Cattura qualsiasi altra eccezione non prevista
-        logging.error(f"Errore imprevisto durante l'elaborazione del PDF {path}: {str(e)}")
-        logging.debug(traceback.format_exc())
+        logging.error("Errore imprevisto durante l'elaborazione del PDF %s: %s", path, e)
+        logging.debug("Traceback dell'errore:", exc_info=True)
+        return (None, None, None) if not feedback_mode else (None, None, None, None)
+
+
+def estrai_info_da_file(path, feedback_mode=False, dettagli=None):
+    """
+    Estrae le informazioni da una fattura PDF o da una fattura elettronica FatturaPA.
+
+    I file .xml e .p7m vengono letti direttamente dalla struttura XML; tutti gli
+    altri passano da `estrai_info_da_pdf`.
+
+    Args:
+        path (str): Percorso completo al file da analizzare
+        feedback_mode (bool): Se True, restituisce anche il testo estratto per feedback
+        dettagli (dict, optional): Come `estrai_info_da_pdf`; per le fatture elettroniche
+            l'origine è "fatturapa"
+
+    Returns:
+        tuple: Come `estrai_info_da_pdf`. Per le fatture elettroniche il testo
+               estratto è None, perché non serve creare pattern di estrazione.
+    """
+    if not is_fattura_elettronica(path):
+        return estrai_info_da_pdf(path, feedback_mode, dettagli)
+
+    try:
+        info = estrai_info_da_fattura_elettronica(path, dati=leggi_documento(path))
+    except Exception as e:
+        logging.error("Errore durante la lettura della fattura elettronica %s: %s", path, e)
+        logging.debug("Traceback dell'errore:", exc_info=True)
+        info = None
+
+    if not info or not all([info["denominazione"], info["numero_fattura"], info["data_fattura"]]):
+        logging.warning("Fattura elettronica incompleta o non leggibile: %s", path)
         return (None, None, None) if not feedback_mode else (None, None, None, None)
 
+    logging.info("Estrazione riuscita dalla fattura elettronica: %s", path)
+    if dettagli is not None:
+        dettagli.update(origine="fatturapa", pattern=None)
+    risultato = (info["denominazione"], info["numero_fattura"], info["data_fattura"])
+    return risultato if not feedback_mode else risultato + (None,)
+
+
+def estensione_documento(path):
+    """
+    Restituisce l'estensione da mantenere nel nome del file rinominato.
+
+    Args:
+        path (str): Percorso del file originale
+
+    Returns:
+        str: Estensione con il punto iniziale (es. ".pdf", ".xml.p7m")
+    """
+    nome = os.path.basename(path).lower()
+    if nome.endswith(".xml.p7m"):
+        return ".xml.p7m"
+    return os.path.splitext(nome)[1] or ".pdf"
+
+
+def _cartelle_esistenti(base_dir):
+    """
+    Restituisce le cartelle dei fornitori in base_dir per chiave canonica.
+
+    La cartella base viene letta una sola volta (su una condivisione di rete
+    ogni lettura costa quanto l'elenco completo) e riletta dopo
+    `DURATA_INDICE_CARTELLE` secondi o dopo `azzera_indice_cartelle`.
+    Va chiamata con `_lock_indice_cartelle` acquisito.
+    """
+    voce = _indice_cartelle.get(base_dir)
+    if voce is not None and time.monotonic() - voce[0] < DURATA_INDICE_CARTELLE:
+        return voce[1]
+    cartelle = {}
+    try:
+        with os.scandir(base_dir) as voci:
+            for elemento in voci:
+                if elemento.is_dir():
+                    cartelle.setdefault(chiave_fornitore(elemento.name.replace("_", " ")), elemento.path)
+    except OSError:
+        pass
+    _indice_cartelle[base_dir] = (time.monotonic(), cartelle)
+    return cartelle
+
+
+def _registra_cartella(base_dir, cartella):
+    """Aggiunge all'indice una cartella del fornitore appena creata in base_dir."""
+    with _lock_indice_cartelle:
+        chiave = chiave_fornitore(os.path.basename(cartella).replace("_", " "))
+        _cartelle_esistenti(base_dir).setdefault(chiave, cartella)
+
+
+def azzera_indice_cartelle():
+    """Dimentica le cartelle dei fornitori già lette, ad esempio all'inizio di un nuovo lotto."""
+    with _lock_indice_cartelle:
+        _indice_cartelle.clear()
+
+
+def cartella_fornitore(base_dir, denominazione, previste=None):
+    """
+    Restituisce la cartella del fornitore all'interno di base_dir.
+
+    Se esiste già una cartella con la stessa chiave canonica (es. "ACME_S.R.L."
+    per "Acme Srl") viene riusata, così le varianti del nome non creano cartelle
+    quasi duplicate. Altrimenti il nome della cartella è quello del fornitore
+    noto, o la denominazione stessa, con "_" al posto degli spazi.
+
+    Args:
+        base_dir (str): Cartella che contiene le cartelle dei fornitori
+        denominazione (str): Nome del fornitore
+        previste (dict, optional): Cartelle non ancora create ma già assegnate ad altri
+            documenti, come (base_dir, chiave canonica) -> percorso (vedi `planner`)
+
+    Returns:
+        str: Percorso della cartella (non viene creata)
+    """
+    nome = pattern_db.risolvi_fornitore(denominazione) or denominazione
+    chiave = chiave_fornitore(nome)
+    if previste and (base_dir, chiave) in previste:
+        return previste[(base_dir, chiave)]
+    with _lock_indice_cartelle:
+        esistente = _cartelle_esistenti(base_dir).get(chiave) if chiave else None
+    if esistente is not None:
+        return esistente
+    for c in r'<>:"/\\|?*':
+        nome = nome.replace(c, "")
+    # Windows non ammette punti o spazi finali nei nomi delle cartelle
+    return os.path.join(base_dir, nome.strip().rstrip(". ").replace(" ", "_"))
+
+
+def percorso_destinazione(file_path, nuovo_nome, denominazione, usa_cartelle, cartella_base=None,
+                          crea_cartella=True, occupati=None, cartelle_previste=None):
+    """
+    Calcola il percorso in cui salvare il documento rinominato.
+
+    Se richiesto crea la cartella del fornitore. Se il file di destinazione
+    esiste già, al nome viene aggiunto un suffisso con l'orario.
+
+    Args:
+        file_path (str): Percorso del documento originale
+        nuovo_nome (str): Nome del file generato
+        denominazione (str): Nome del fornitore, usato per la cartella
+        usa_cartelle (bool): Se True, salva nella cartella del fornitore
+        cartella_base (str, optional): Cartella di destinazione; se None è quella del documento originale
+        crea_cartella (bool, optional): Se False la cartella del fornitore non viene creata
+            (simulazione, vedi `planner`). Default True.
+        occupati (set, optional): Percorsi già assegnati ad altri documenti, trattati come
+            file esistenti nel controllo delle collisioni
+        cartelle_previste (dict, optional): Cartelle dei fornitori già assegnate ma non ancora
+            create (vedi `cartella_fornitore`); la cartella scelta viene aggiunta al dizionario
+
+    Returns:
+        str: Percorso completo del file di destinazione
+
+    Raises:
+        OSError: Se non è possibile creare la cartella del fornitore
+    """
+    base_dir = cartella_base or cartella_documento(file_path)
+    destinazione = base_dir
+
+    # Gestione delle cartelle
+    if usa_cartelle:
+        destinazione = cartella_fornitore(base_dir, denominazione, cartelle_previste)
+        if cartelle_previste is not None:
+            chiave = chiave_fornitore(os.path.basename(destinazione).replace("_", " "))
+            cartelle_previste.setdefault((base_dir, chiave), destinazione)
+    if usa_cartelle and crea_cartella:
+        try:
+            os.makedirs(destinazione, exist_ok=True)
+            _registra_cartella(base_dir, destinazione)
+            logging.info("Cartella creata/verificata: %s", destinazione)
+        except Exception as e:
+            logging.error("Errore nella creazione della cartella %s: %s", destinazione, e)
+            raise
+
+    nuovo_percorso = os.path.join(destinazione, nuovo_nome)
+    occupati = occupati or ()
+
+    def occupato(percorso):
+        return percorso in occupati or os.path.exists(percorso)
+
+    # Verifica se il file di destinazione esiste già
+    if occupato(nuovo_percorso):
+        logging.warning("Il file di destinazione esiste già: %s", nuovo_percorso)
+        # Aggiungi un suffisso al nome file per evitare sovrascritture
+        ext = estensione_documento(nuovo_nome)
+        base = f"{nuovo_nome[:-len(ext)]}_{datetime.now().strftime('%H%M%S')}"
+        nuovo_nome = f"{base}{ext}"
+        nuovo_percorso = os.path.join(destinazione, nuovo_nome)
+        contatore = 2
+        while occupato(nuovo_percorso):
+            nuovo_nome = f"{base}_{contatore}{ext}"
+            nuovo_percorso = os.path.join(destinazione, nuovo_nome)
+            contatore += 1
+        logging.info("Nuovo nome con timestamp: %s", nuovo_nome)
+
+    return nuovo_percorso
+
 
-def genera_nome_file(tipologia, numero_fattura, data_fattura, denominazione, stagione, anno, genere, generico=False):
+def genera_nome_file(tipologia, numero_fattura, data_fattura, denominazione, stagione, anno, genere, generico=False,
+                     estensione=".pdf"):
     """
     Genera un nome file standardizzato per la fattura in base ai parametri forniti.
 
@@ -106,14 +494,15 @@ def genera_nome_file(tipologia, numero_fattura, data_fattura, denominazione, sta
         anno (str): Anno di riferimento
         genere (str): Genere di riferimento (es. "UOMO", "DONNA")
         generico (bool, optional): Se True, usa un formato semplificato. Default False.
+        estensione (str, optional): Estensione del file generato. Default ".pdf".
 
     Returns:
-        str: Nome file standardizzato con estensione .pdf
+        str: Nome file standardizzato con l'estensione indicata
     """
     if generico:
-        nome = f"{denominazione} {numero_fattura} DEL {data_fattura}.pdf"
+        nome = f"{denominazione} {numero_fattura} DEL {data_fattura}{estensione}"
     else:
-        nome = f"{tipologia} {numero_fattura} DEL {data_fattura} {denominazione} {stagione} {anno} {genere}.pdf"
+        nome = f"{tipologia} {numero_fattura} DEL {data_fattura} {denominazione} {stagione} {anno} {genere}{estensione}"
 
     caratteri_non_validi = r'<>:"/\\|?*'
     for c in caratteri_non_validi:
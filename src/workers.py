@@ -0,0 +1,552 @@
+"""
+Estrazione dei dati in un processo separato e supervisionato.
+
+Un PDF malformato può bloccare MuPDF in un ciclo infinito o farlo terminare
+con un errore nativo: se l'estrazione avviene nel processo dell'interfaccia,
+un solo file rovinato interrompe l'intero batch. Qui l'estrazione viene eseguita
+in un processo worker con un budget di tempo per ogni file: se il budget viene
+superato o il worker termina in modo anomalo, il worker viene sostituito e il
+file viene messo in quarantena, così le elaborazioni successive lo saltano.
+"""
+
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import tempfile
+import threading
+import multiprocessing
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from filelock import FileLock, Timeout
+from document_source import firma_documento, documento_in_cache, memorizza_documento
+from text_cache import get_cache_testi
+from pattern_db import LOCK_TIMEOUT
+from regex_guard import RegexWorkerError
+from config import get_impostazioni
+
+# Tempo massimo (in secondi) concesso all'estrazione di un singolo file
+BUDGET_ESTRAZIONE = get_impostazioni().budget_estrazione
+
+# Tempo massimo (in secondi) di avvio del worker (import di PyMuPDF e caricamento dei pattern)
+TIMEOUT_AVVIO_WORKER = get_impostazioni().timeout_avvio_worker
+
+# Intervallo (in secondi) tra due chiamate della funzione di attesa
+INTERVALLO_ATTESA = 0.1
+
+# Tempo massimo (in secondi) concesso al worker per salvare le modifiche in attesa prima di chiudersi
+TIMEOUT_CHIUSURA_WORKER = 15
+
+# Numero predefinito di processi worker del servizio HTTP e della simulazione
+WORKER_PREDEFINITI = get_impostazioni().worker_estrazione
+
+
+class EstrazioneInterrottaError(Exception):
+    """Sollevata quando l'estrazione di un file supera il budget o fa terminare il worker."""
+
+
+class Quarantena:
+    """
+    Elenco persistente dei documenti che hanno bloccato o fatto terminare il worker.
+
+    Ogni voce conserva la firma del file (data di modifica e dimensione): se il
+    file viene sostituito, esce automaticamente dalla quarantena.
+
+    Interfaccia, servizio e simulazione usano lo stesso file: ogni modifica
+    viene salvata sotto un lock tra processi, rileggendo prima il file e
+    riapplicando le modifiche locali, come per il database dei pattern. Se il
+    lock non è disponibile le modifiche restano in attesa del salvataggio successivo.
+    """
+
+    def __init__(self, path=None):
+        """
+        Args:
+            path (str, optional): File JSON della quarantena; predefinito quarantena.json nella cartella dei dati
+        """
+        self.path = path or os.path.join(get_impostazioni().cartella_dati, 'quarantena.json')
+        self._lock = threading.Lock()
+        self._modifiche = []
+        self._firma = self._leggi_firma()
+        self.voci = self._carica()
+
+    def _leggi_firma(self):
+        """Restituisce (mtime in nanosecondi, dimensione) del file, oppure None se non esiste."""
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def _carica(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.error("Errore nel caricamento della quarantena %s: %s", self.path, e)
+            return {}
+
+    @staticmethod
+    def _applica_modifica(voci, modifica):
+        """Applica una modifica (percorso, voce) alle voci; voce None toglie il documento."""
+        path, voce = modifica
+        if voce is None:
+            voci.pop(path, None)
+        else:
+            voci[path] = voce
+
+    def _ricarica_se_modificata(self):
+        """Rilegge il file se un'altra istanza lo ha modificato, mantenendo le modifiche locali."""
+        firma = self._leggi_firma()
+        if firma == self._firma:
+            return
+        voci = self._carica()
+        for modifica in self._modifiche:
+            self._applica_modifica(voci, modifica)
+        self.voci = voci
+        self._firma = firma
+
+    def _salva(self):
+        """Scrive la quarantena in modo atomico."""
+        cartella = os.path.dirname(self.path)
+        os.makedirs(cartella, exist_ok=True)
+        fd, percorso_tmp = tempfile.mkstemp(prefix=".quarantena_", suffix=".tmp", dir=cartella)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self.voci, f, indent=4, ensure_ascii=False)
+            os.replace(percorso_tmp, self.path)
+        except Exception:
+            if os.path.exists(percorso_tmp):
+                os.remove(percorso_tmp)
+            raise
+
+    def _registra_modifica(self, modifica):
+        """
+        Applica una modifica in memoria e la salva unendola al file condiviso.
+
+        Sotto il lock del file la quarantena viene riletta, così le voci
+        aggiunte nel frattempo da altri processi non vanno perse.
+        """
+        with self._lock:
+            self._applica_modifica(self.voci, modifica)
+            self._modifiche.append(modifica)
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with FileLock(self.path + ".lock", timeout=LOCK_TIMEOUT):
+                    self._ricarica_se_modificata()
+                    self._salva()
+                    self._firma = self._leggi_firma()
+                    self._modifiche.clear()
+            except Timeout:
+                logging.error("Quarantena bloccata da un'altra istanza, salvataggio rimandato: %s", self.path)
+            except OSError as e:
+                logging.error("Errore nel salvataggio della quarantena: %s", e)
+
+    def contiene(self, path):
+        """
+        Verifica se il documento, nella versione attuale, è in quarantena.
+
+        Args:
+            path (str): Percorso del file o percorso virtuale del membro ZIP
+
+        Returns:
+            bool: True se il documento è in quarantena e non è stato modificato
+        """
+        with self._lock:
+            # Le voci aggiunte da altri processi (servizio, simulazione) valgono subito
+            self._ricarica_se_modificata()
+            voce = self.voci.get(path)
+        if voce is None:
+            return False
+        try:
+            return list(firma_documento(path)) == voce["firma"]
+        except (OSError, KeyError):
+            return False
+
+    def aggiungi(self, path, motivo):
+        """
+        Mette un documento in quarantena.
+
+        Args:
+            path (str): Percorso del file o percorso virtuale del membro ZIP
+            motivo (str): Motivo della quarantena (es. "timeout", "crash")
+        """
+        try:
+            firma = list(firma_documento(path))
+        except (OSError, KeyError):
+            firma = None
+        self._registra_modifica((path, {"motivo": motivo, "firma": firma, "data": datetime.now().isoformat()}))
+        logging.warning("Documento messo in quarantena (%s): %s", motivo, path)
+
+    def rimuovi(self, path):
+        """
+        Toglie un documento dalla quarantena.
+
+        Args:
+            path (str): Percorso del file o percorso virtuale del membro ZIP
+        """
+        with self._lock:
+            self._ricarica_se_modificata()
+            presente = path in self.voci
+        if presente:
+            self._registra_modifica((path, None))
+
+
+class _InoltroLog(logging.Handler):
+    """Reinserisce nel logging del processo principale i record arrivati dal worker."""
+
+    def emit(self, record):
+        logging.getLogger(record.name).handle(record)
+
+
+def inizializza_worker(sola_lettura=False):
+    """
+    Prepara un processo worker: compila i pattern e avvia il processo della RegexGuard.
+
+    Args:
+        sola_lettura (bool): Se True, il worker non modifica i dati: impronte, alias e
+            pattern segnalati non vengono salvati e la cache dei testi non riceve nuove voci
+    """
+    from utils import pattern_db, regex_guard
+    if sola_lettura:
+        # Il database può essere già stato creato importando il modulo principale nel worker
+        pattern_db.sola_lettura = True
+        cache_testi = get_cache_testi()
+        if cache_testi is not None:
+            cache_testi.sola_lettura = True
+    for tipo in ("denominazione", "numero_data"):
+        pattern_db.get_pattern_compilati(tipo)
+    regex_guard.imposta_testo("")
+    try:
+        regex_guard.cerca("^")
+    except RegexWorkerError as e:
+        # Il processo delle regex verrà riavviato alla prima ricerca
+        logging.warning("Processo delle regex non avviato: %s", e)
+
+
+def estrai_dati(path):
+    """
+    Estrae i dati di un documento nel processo worker.
+
+    Args:
+        path (str): Percorso del file o percorso virtuale del membro ZIP
+
+    Returns:
+        dict: denominazione, numero_fattura, data_fattura, origine e pattern usato
+    """
+    from utils import estrai_info_da_file
+    dettagli = {}
+    denominazione, numero_fattura, data_fattura = estrai_info_da_file(path, dettagli=dettagli)
+    return {
+        "denominazione": denominazione,
+        "numero_fattura": numero_fattura,
+        "data_fattura": data_fattura,
+        "origine": dettagli.get("origine"),
+        "pattern": dettagli.get("pattern"),
+    }
+
+
+def _estrai_per_feedback(path, documento=None):
+    """
+    Estrae i dati di un documento nel worker, con testo e dettagli (vedi `EstrattoreIsolato.estrai`).
+
+    Args:
+        path (str): Percorso del file o percorso virtuale del membro ZIP
+        documento (tuple, optional): (firma, contenuto) già letti dal processo padre
+    """
+    from utils import estrai_info_da_file
+    if documento is not None:
+        memorizza_documento(path, *documento)
+    dettagli = {}
+    risultato = estrai_info_da_file(path, feedback_mode=True, dettagli=dettagli)
+    return tuple(risultato) + (dettagli,)
+
+
+def _ciclo_estrattore(conn, coda_log, livello_log, sola_lettura=False):
+    """
+    Ciclo principale del processo worker di estrazione.
+
+    Segnala ("pronto", pid) dopo l'avvio, poi riceve comandi ("esegui", (funzione, argomenti))
+    e risponde con ("ok", risultato della funzione) oppure ("errore", messaggio).
+    La funzione deve essere definita a livello di modulo, per poter essere
+    inviata al worker.
+
+    Args:
+        conn: Estremità della pipe lato worker
+        coda_log: Coda su cui inviare i record di log al processo principale
+        livello_log (int): Livello del logger principale del processo padre
+        sola_lettura (bool): Vedi `inizializza_worker`
+    """
+    root = logging.getLogger()
+    root.handlers[:] = [QueueHandler(coda_log)]
+    root.setLevel(livello_log)
+
+    inizializza_worker(sola_lettura)
+    conn.send(("pronto", os.getpid()))
+
+    while True:
+        try:
+            comando, valore = conn.recv()
+        except (EOFError, OSError):
+            break
+        if comando == "stop":
+            break
+        try:
+            funzione, argomenti = valore
+            conn.send(("ok", funzione(*argomenti)))
+        except Exception as e:
+            conn.send(("errore", str(e)))
+
+    # I processi figli non eseguono le funzioni registrate con atexit
+    from utils import pattern_db
+    pattern_db.salva_modifiche_in_attesa()
+
+
+class EstrattoreIsolato:
+    """
+    Esegue `estrai_info_da_file` in un processo worker supervisionato.
+
+    Il worker resta attivo tra un file e l'altro; se un file supera il budget
+    di tempo o il worker termina in modo anomalo, il worker viene terminato,
+    il file messo in quarantena e un nuovo worker viene avviato alla richiesta
+    successiva.
+
+    Il worker non è un processo daemon perché deve poter avviare a sua volta
+    il processo della `RegexGuard`; viene arrestato da `chiudi`, registrata
+    anche all'uscita dell'interprete.
+    """
+
+    def __init__(self, budget=BUDGET_ESTRAZIONE, quarantena=None, sola_lettura=False):
+        """
+        Args:
+            budget (float): Tempo massimo in secondi per l'estrazione di un file
+            quarantena (Quarantena, optional): Quarantena da usare; predefinita quella nella cartella dei dati
+            sola_lettura (bool): Se True, il worker non salva impronte, segnalazioni e testi in cache
+                (vedi `inizializza_worker`)
+        """
+        self.budget = budget
+        self.quarantena = quarantena or Quarantena()
+        self.sola_lettura = sola_lettura
+        self._processo = None
+        self._conn = None
+        self._coda_log = None
+        self._listener_log = None
+        self._lock = threading.Lock()
+        atexit.register(self.chiudi)
+
+    def _attendi(self, timeout, in_attesa):
+        """Attende una risposta dal worker, chiamando `in_attesa` a intervalli regolari."""
+        scadenza = time.monotonic() + timeout
+        while True:
+            rimanente = scadenza - time.monotonic()
+            if rimanente <= 0:
+                return False
+            if self._conn.poll(min(rimanente, INTERVALLO_ATTESA) if in_attesa else rimanente):
+                return True
+            if in_attesa:
+                in_attesa()
+
+    def _avvia_worker(self, in_attesa=None):
+        """Avvia il processo worker se non è già attivo e attende che sia pronto."""
+        if self._processo is not None and self._processo.is_alive():
+            return
+        self._termina_worker()
+        # "spawn" evita di duplicare con fork il processo dell'interfaccia e i suoi thread
+        contesto = multiprocessing.get_context("spawn")
+        if self._listener_log is None:
+            # I log del worker finiscono nello stesso file di quelli dell'interfaccia
+            self._coda_log = contesto.Queue()
+            self._listener_log = QueueListener(self._coda_log, _InoltroLog())
+            self._listener_log.start()
+        conn_padre, conn_figlio = contesto.Pipe()
+        processo = contesto.Process(
+            target=_ciclo_estrattore,
+            args=(conn_figlio, self._coda_log, logging.getLogger().level, self.sola_lettura),
+            name="EstrattoreIsolato"
+        )
+        try:
+            processo.start()
+        finally:
+            conn_figlio.close()
+        self._processo = processo
+        self._conn = conn_padre
+
+        try:
+            pronto = self._attendi(TIMEOUT_AVVIO_WORKER, in_attesa) and self._conn.recv()[0] == "pronto"
+        except (EOFError, OSError):
+            pronto = False
+        if not pronto:
+            self._termina_worker()
+            raise RuntimeError("Impossibile avviare il processo di estrazione")
+        logging.info("Processo di estrazione avviato (pid %d)", self._processo.pid)
+
+    def _termina_worker(self):
+        """Termina forzatamente il processo worker."""
+        if self._processo is not None:
+            if self._processo.is_alive():
+                self._processo.kill()
+            self._processo.join()
+        if self._conn is not None:
+            self._conn.close()
+        self._processo = None
+        self._conn = None
+
+    def avvia(self, in_attesa=None):
+        """
+        Avvia il processo worker senza attendere la prima richiesta.
+
+        Raises:
+            RuntimeError: Se il worker non è pronto entro TIMEOUT_AVVIO_WORKER
+        """
+        with self._lock:
+            self._avvia_worker(in_attesa)
+
+    def esegui(self, funzione, path, *argomenti, in_attesa=None, usa_quarantena=True):
+        """
+        Esegue funzione(path, *argomenti) nel worker entro il budget di tempo.
+
+        Args:
+            funzione (callable): Funzione definita a livello di modulo
+            path (str): Documento elaborato dalla funzione
+            *argomenti: Altri argomenti della funzione
+            in_attesa (callable, optional): Funzione chiamata periodicamente durante
+                l'attesa, ad esempio per mantenere reattiva l'interfaccia
+            usa_quarantena (bool): Se False il documento non viene controllato né messo
+                in quarantena (es. file temporanei dal nome sempre diverso)
+
+        Returns:
+            Il valore restituito dalla funzione
+
+        Raises:
+            EstrazioneInterrottaError: Se il documento è in quarantena, supera il budget
+                o fa terminare il worker
+            RuntimeError: Se la funzione solleva un'eccezione nel worker
+        """
+        if usa_quarantena and self.quarantena.contiene(path):
+            raise EstrazioneInterrottaError(f"Documento in quarantena: {path}")
+
+        with self._lock:
+            self._avvia_worker(in_attesa)
+            self._conn.send(("esegui", (funzione, (path,) + argomenti)))
+
+            if not self._attendi(self.budget, in_attesa):
+                logging.error("Estrazione interrotta dopo %.0fs: %s", self.budget, path)
+                self._termina_worker()
+                if usa_quarantena:
+                    self.quarantena.aggiungi(path, "timeout")
+                raise EstrazioneInterrottaError(f"Tempo massimo di estrazione superato ({self.budget:.0f}s)")
+
+            try:
+                esito, valore = self._conn.recv()
+            except (EOFError, OSError):
+                self._processo.join(1)
+                codice = self._processo.exitcode
+                logging.error("Processo di estrazione terminato (codice %s) durante: %s", codice, path)
+                self._termina_worker()
+                if usa_quarantena:
+                    self.quarantena.aggiungi(path, "crash")
+                raise EstrazioneInterrottaError(f"Il processo di estrazione è terminato in modo anomalo (codice {codice})")
+
+        if esito == "errore":
+            raise RuntimeError(valore)
+        return valore
+
+    def estrai(self, path, dettagli=None, in_attesa=None):
+        """
+        Estrae i dati di un documento nel worker entro il budget di tempo.
+
+        Se il documento è già nella cache di questo processo (ad esempio per
+        l'anteprima) il contenuto viene inviato al worker, che non lo rilegge.
+
+        Args:
+            path (str): Percorso del file o percorso virtuale del membro ZIP
+            dettagli (dict, optional): Riceve l'origine dei dati e il pattern usato
+                (vedi `estrai_info_da_file`)
+            in_attesa (callable, optional): Funzione chiamata periodicamente durante
+                l'attesa, ad esempio per mantenere reattiva l'interfaccia
+
+        Returns:
+            tuple: (denominazione, numero_fattura, data_fattura, testo_estratto), come
+                   `estrai_info_da_file` con feedback_mode=True
+
+        Raises:
+            EstrazioneInterrottaError: Se il documento è in quarantena, supera il budget
+                o fa terminare il worker
+        """
+        # Il documento già letto per l'anteprima viene inviato al worker invece di essere riletto
+        documento = documento_in_cache(path)
+        *risultato, dettagli_worker = self.esegui(_estrai_per_feedback, path, documento, in_attesa=in_attesa)
+        if dettagli is not None:
+            dettagli.update(dettagli_worker)
+        return tuple(risultato)
+
+    def chiudi(self):
+        """Arresta il processo worker."""
+        with self._lock:
+            if self._conn is not None:
+                try:
+                    self._conn.send(("stop", None))
+                    self._processo.join(TIMEOUT_CHIUSURA_WORKER)
+                except OSError:
+                    pass
+            self._termina_worker()
+            if self._listener_log is not None:
+                self._listener_log.stop()
+                self._coda_log.close()
+                self._listener_log = None
+                self._coda_log = None
+
+
+class GruppoEstrattori:
+    """
+    Gruppo di `EstrattoreIsolato` condivisi tra più thread.
+
+    Ogni richiesta usa un estrattore libero; un documento che blocca o fa
+    terminare il proprio worker costa solo quel worker, che viene sostituito,
+    mentre gli altri continuano a elaborare le richieste successive.
+    """
+
+    def __init__(self, numero, budget=BUDGET_ESTRAZIONE, quarantena=None, sola_lettura=False):
+        """
+        Args:
+            numero (int): Numero di processi worker
+            budget (float): Tempo massimo in secondi per l'elaborazione di un documento
+            quarantena (Quarantena, optional): Quarantena condivisa; predefinita quella nella cartella dei dati
+            sola_lettura (bool): Vedi `EstrattoreIsolato`
+        """
+        self.quarantena = quarantena or Quarantena()
+        self.estrattori = [EstrattoreIsolato(budget, self.quarantena, sola_lettura) for _ in range(max(1, numero))]
+        self._liberi = queue.Queue()
+        for estrattore in self.estrattori:
+            self._liberi.put(estrattore)
+
+    def avvia(self):
+        """Avvia tutti i worker e attende che siano pronti."""
+        for estrattore in self.estrattori:
+            estrattore.avvia()
+
+    def esegui(self, funzione, path, *argomenti, attesa_massima=None, usa_quarantena=True):
+        """
+        Esegue funzione(path, *argomenti) nel primo worker libero (vedi `EstrattoreIsolato.esegui`).
+
+        Args:
+            attesa_massima (float, optional): Secondi di attesa massima per un worker libero
+
+        Raises:
+            queue.Empty: Se nessun worker si libera entro attesa_massima
+            EstrazioneInterrottaError: Se il documento è in quarantena, supera il budget
+                o fa terminare il worker
+        """
+        estrattore = self._liberi.get(timeout=attesa_massima)
+        try:
+            return estrattore.esegui(funzione, path, *argomenti, usa_quarantena=usa_quarantena)
+        finally:
+            self._liberi.put(estrattore)
+
+    def chiudi(self):
+        """Arresta tutti i worker."""
+        for estrattore in self.estrattori:
+            estrattore.chiudi()
@@ -0,0 +1,92 @@
+"""
+Test del servizio HTTP: le risposte di errore non devono lasciare il corpo
+della richiesta sulla connessione persistente.
+
+Esecuzione: python -m pytest tests
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+import http.client
+
+# Dati e log del servizio in una cartella temporanea, impostati prima di leggere la configurazione
+_CARTELLA_TEST = tempfile.mkdtemp(prefix="invoicereader_test_")
+os.environ["INVOICEREADER_CARTELLA_DATI"] = os.path.join(_CARTELLA_TEST, "data")
+os.environ["INVOICEREADER_CARTELLA_LOG"] = os.path.join(_CARTELLA_TEST, "logs")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import service  # noqa: E402
+
+# Corpo di un documento inviato, che non deve essere interpretato come richiesta
+_CORPO_PDF = b"%PDF-1.7\n" + b"0" * 4096
+
+
+class TestConnessionePersistente(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.servizio = service.ServizioEstrazione("127.0.0.1", 0, worker=1)
+        cls.host, cls.porta = cls.servizio.avvia()
+        cls.thread = threading.Thread(target=cls.servizio.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.servizio.chiudi()
+        shutil.rmtree(_CARTELLA_TEST, ignore_errors=True)
+
+    def setUp(self):
+        self.connessione = http.client.HTTPConnection(self.host, self.porta, timeout=30)
+
+    def tearDown(self):
+        self.connessione.close()
+
+    def _richiesta(self, metodo, percorso, corpo=None, intestazioni=None):
+        self.connessione.request(metodo, percorso, body=corpo, headers=intestazioni or {})
+        risposta = self.connessione.getresponse()
+        risposta.read()
+        return risposta
+
+    def _verifica_stato(self):
+        """La richiesta successiva sulla stessa connessione deve essere gestita normalmente."""
+        risposta = self._richiesta("GET", "/stato")
+        self.assertEqual(risposta.status, 200)
+
+    def test_rinomina_senza_destinazione(self):
+        risposta = self._richiesta("POST", "/rinomina?nome=f.pdf&anno=2025", _CORPO_PDF,
+                                   {"Content-Type": "application/pdf"})
+        self.assertEqual(risposta.status, 400)
+        self._verifica_stato()
+
+    def test_endpoint_non_trovato(self):
+        risposta = self._richiesta("POST", "/inesistente", _CORPO_PDF, {"Content-Type": "application/pdf"})
+        self.assertEqual(risposta.status, 404)
+        self._verifica_stato()
+
+    def test_genera_nome_da_query(self):
+        risposta = self._richiesta(
+            "POST", "/genera-nome?denominazione=ALFA&numero_fattura=1&data_fattura=01/02/2025&generico=1",
+            _CORPO_PDF, {"Content-Type": "application/pdf"}
+        )
+        self.assertEqual(risposta.status, 200)
+        self._verifica_stato()
+
+    def test_documento_troppo_grande(self):
+        originale = service.MAX_BYTE_UPLOAD
+        service.MAX_BYTE_UPLOAD = 1024
+        try:
+            risposta = self._richiesta("POST", "/estrai?nome=f.pdf", _CORPO_PDF, {"Content-Type": "application/pdf"})
+        finally:
+            service.MAX_BYTE_UPLOAD = originale
+        self.assertEqual(risposta.status, 413)
+        self.assertEqual(risposta.getheader("Connection"), "close")
+        # http.client riapre la connessione chiusa dal server
+        self._verifica_stato()
+
+
+if __name__ == "__main__":
+    unittest.main()